@@ -9,6 +9,7 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 import itertools
+import queue
 import random
 from collections import OrderedDict
 from functools import partial
@@ -16,9 +17,11 @@ from itertools import count, product
 from multiprocessing import Pool, cpu_count
 from typing import (
     Any,
+    Callable,
     Counter,
     Dict,
     Iterable,
+    Iterator,
     List,
     Mapping,
     Optional,
@@ -33,6 +36,13 @@ from tqdm import tqdm
 
 from mesa import Model
 
+from Batch_Run.shared_parameters import shared_parameters, attach_parameters
+from Batch_Run.result_writer import create_result_sink, read_run_results
+from Batch_Run.run_manifest import RunManifest, make_run_id
+from Batch_Run.variance_reduction import VarianceReduction, PairedDifferences
+from Batch_Run.adaptive_replication import AdaptiveReplication, ReplicationController
+from Batch_Run.sensitivity import LatinHypercubeSampler, SaltelliSampler, SAMPLE_COLUMNS
+
 
     
 def batch_run(
@@ -46,9 +56,16 @@ def batch_run(
     i_steps: int = -1,
     max_steps: int = 1000,
     display_progress: bool = True,
-    createHeatmaps = False
+    createHeatmaps = False,
+    share_memory: bool = False,
+    result_format: str = "csv",
+    run_name: Optional[str] = None,
+    resume: bool = False,
+    variance_reduction: Optional[VarianceReduction] = None,
+    adaptive_replication: Optional[AdaptiveReplication] = None,
+    sampler: Optional[Union[LatinHypercubeSampler, SaltelliSampler]] = None,
     # sensitvity_analysis: bool = False,
-) -> List[Dict[str, Any]]:
+) -> int:
     """Batch run a mesa model with a set of parameter values.
     Parameters
     ----------
@@ -59,107 +76,251 @@ def batch_run(
     nr_processes : int, optional
         Number of processes used. Set to None (default) to use all available processors
     iterations : int, optional
-        Number of iterations for each parameter combination, by default 1
+        Number of iterations for each parameter combination, by default 1. Every iteration gets its own seed,
+        derived from the parameter combination and iteration, unless the seed is a variable parameter
+        (see variance_reduction for sharing seeds between parameter combinations)
     max_steps : int, optional
         Maximum number of model steps after which the model halts, by default 1000
     display_progress : bool, optional
         Display batch run process, by default True
+    share_memory : bool, optional
+        Place the arrays and DataFrames within the fixed parameters in shared memory once, so the workers
+        attach to them instead of receiving a pickled copy with every run, by default False
+    result_format : str, optional
+        Format of the results file, csv, arrow or parquet (the latter two require pyarrow), by default csv.
+        Heatmaps are stored per run in Results/heatmaps as stacked .npy files
+    run_name : str, optional
+        Name of the results and manifest files in Results, by default the current date and time
+    resume : bool, optional
+        Skip the runs that the manifest of run_name records as completed and write the remaining results to
+        new files, by default False
+    variance_reduction : VarianceReduction, optional
+        Common random numbers and stratified days for the replications. When given, the differences of all
+        parameter combinations with the first one are estimated from paired replications and written to
+        Results/<run_name>_paired.csv, by default None
+    adaptive_replication : AdaptiveReplication, optional
+        Replicate every parameter combination until the confidence intervals of the given KPIs meet their
+        targets, instead of a fixed number of iterations. The number of replications, means and half-widths
+        are written to Results/<run_name>_replications.csv, by default None
+    sampler : LatinHypercubeSampler or SaltelliSampler, optional
+        Sample the variable parameters from ranges instead of combining the variable_parameters in a full
+        factorial design, variable_parameters must then be empty. The Sobol indices of a SaltelliSampler are
+        estimated as the results come in and written to Results/<run_name>_sensitivity.csv. A batch run is
+        resumed with a sampler with the same seed, by default None
     Returns
     -------
-    List[Dict[str, Any]]
-        [description]
+    int
+        Number of times results were handed to the writer
     """
+    if sampler is not None and variable_parameters:
+        raise ValueError(f"Variable parameters {list(variable_parameters)} can not be combined with a sampler, "
+                         f"make them fixed parameters or sample them")
+
     if nr_processes is None:
         # identify the number of processors available on users machine
         available_processors = cpu_count()
         nr_processes = available_processors
         print(f"BatchRunner MP will use {nr_processes} processors.")
 
-    iter_args = _make_model_kwargs(variable_parameters, fixed_parameters)
-    
-    process_func = partial(
-        _model_run_func,
-        model_cls,
-        max_steps=max_steps,
-    )
-
-    total_iterations = len(iter_args) 
-    print(f'Total iterations: {total_iterations}')
-    run_counter = count()
+    if run_name is None:
+        run_name = datetime.now().strftime("%d_%m_%H_%M")
+
+    manifest = RunManifest(f"Results/{run_name}.manifest", resume)
+    completed = frozenset(manifest.completed)
+
+    # The variable parameters are either combined in a full factorial design or sampled
+    if sampler is None:
+        make_keys = partial(_make_model_kwargs, variable_parameters)
+        nr_keys = _count_model_kwargs(variable_parameters)
+    else:
+        make_keys = sampler.samples
+        nr_keys = len(sampler)
+        print(f"Sampling with seed {sampler.seed}")
+
+        max_replications = iterations if adaptive_replication is None else adaptive_replication.max_iterations
+        if completed and completed.isdisjoint(make_run_id(key, replication) for replication in range(max_replications)
+                                              for key in make_keys()):
+            raise ValueError("None of the completed runs are part of the sample, resume with a sampler with the "
+                             "seed of the interrupted batch run")
+
+    # Functions that receive the variable kwargs, replication and results of every run as it comes in
+    observers = []
+
+    paired_differences = None
+    if variance_reduction is not None:
+        baseline, _ = variance_reduction.pairing(next(make_keys()), 0)
+        paired_differences = PairedDifferences(baseline)
+        observers.append(lambda key, replication, run_data: paired_differences.add(
+            *variance_reduction.pairing(key, replication), run_data))
+    else:
+        variance_reduction = VarianceReduction()
+
+    if sampler is not None and sampler.estimator is not None:
+        observers.append(sampler.estimator.add)
+
+        # Base samples of which some runs were completed before a resume are only complete with those results
+        if completed:
+            completed_results = read_run_results("Results", run_name, completed, None)
+            _add_completed_results(sampler.estimator.add, make_keys, max_replications,
+                                   variance_reduction, completed_results)
+
+    with shared_parameters(fixed_parameters, enabled=share_memory and nr_processes > 1) as fixed_parameters:
+        process_func = partial(
+            _model_run_func,
+            model_cls,
+            max_steps=max_steps,
+        )
 
-    results: List[Dict[str, Any]] = []
-    
-    fileName = str("Results/"+datetime.now().strftime("%d_%m_%H_%M")+".csv")
-    if createHeatmaps:
-        createdHeatmaps = False
-        moveHeatmapFileName=str("Results/heatmaps/"+datetime.now().strftime("%d_%m_%H_%M")+"movements.csv")
-        deliveriesHeatmapFileName=str("Results/heatmaps/"+datetime.now().strftime("%d_%m_%H_%M")+"deliveries.csv")
-    writes = 0
-    iterationsPerWrite = 1000
-    with tqdm(total_iterations, disable=not display_progress) as pbar:
-        if nr_processes == 1:
-            for iteration in range(iterations):
-                for kwargs in iter_args:
-                    _, run_data, movementHeatmap, deliveriesHeatmap = process_func(kwargs)
-                    run_id = next(run_counter)
-                    out = {"RunId": run_id, "iteration": iteration - 1}
-                    out.update(run_data)
-                    results.append(out)
-                    pbar.update()
+        if adaptive_replication is None:
+            # Runs are expanded lazily, only the variable parameters are sent with each run
+            iter_args = _make_runs(make_keys, iterations, variance_reduction, completed)
 
+            total_iterations = nr_keys * iterations
+            if completed:
+                total_iterations = sum(1 for _ in _make_runs(make_keys, iterations, variance_reduction, completed))
         else:
-            with Pool(nr_processes) as p:
-                for key, run_data, movementHeatmap, deliveriesHeatmap in p.imap_unordered(process_func, iter_args):
-                    run_id = next(run_counter)
-                    if createHeatmaps:
-                        if createdHeatmaps == False:
-                            createdHeatmaps = True
-                            moveHeatmapResult = np.array(movementHeatmap)
-                            deliveryHeatmapResult = np.array(deliveriesHeatmap)
-                        else:
-                            moveHeatmapResult = np.add(moveHeatmapResult, movementHeatmap)
-                            deliveryHeatmapResult = np.add(deliveryHeatmapResult,deliveriesHeatmap)
-                    out = {"RunId": run_id}
-                    out.update(key)
-                    out.update(run_data)
-                    results.append(out)
-                    pbar.update()
-                    if writes == 0 and run_id >= iterationsPerWrite:
-                        batch_df = pd.DataFrame(results)
-                        batch_df.to_csv(path_or_buf= fileName)
-                        results: List[Dict[str, Any]] = []
-                        writes += 1
-                    elif run_id >= (writes+1)*iterationsPerWrite:
-                        batch_df = pd.DataFrame(results)
-                        batch_df.to_csv(path_or_buf= fileName, mode='a', header=False)
-                        results: List[Dict[str, Any]] = []
-                        writes += 1
-                batch_df = pd.DataFrame(results)
-                includeHeader = False
-                if writes == 0:
-                    includeHeader = True
-                batch_df.to_csv(path_or_buf= fileName, mode='a', header=includeHeader)
-                if createHeatmaps:
-                    pd.DataFrame(moveHeatmapResult).to_csv(moveHeatmapFileName)
-                    pd.DataFrame(deliveryHeatmapResult).to_csv(deliveriesHeatmapFileName)
-                writes += 0.5
-    return writes
+            # Runs are created one at a time, depending on the results so far, including those before a resume
+            completed_results = {}
+            if completed:
+                completed_results = read_run_results("Results", run_name, completed,
+                                                     adaptive_replication.precision_targets)
+
+            controller = ReplicationController(adaptive_replication, list(make_keys()),
+                                               variance_reduction, completed, completed_results)
+            total_iterations = controller.remaining_runs
+
+            if controller.missing_results:
+                print(f'No results found of {controller.missing_results} completed runs, '
+                      f'these are not included in the replication statistics')
+
+        if completed:
+            print(f'Resuming, {len(completed)} runs already completed')
+        print(f'Total iterations: {total_iterations}')
+
+        # Results are written on a background thread while the runs continue, a resumed batch gets its own files
+        fileName = str("Results/" + run_name)
+        if resume:
+            fileName += "_resumed_" + datetime.now().strftime("%d_%m_%H_%M")
+        # The columns that identify a run keep their types in Arrow and Parquet files, the model results are widened
+        first_key = next(make_keys())
+        design_columns = ["RunId", "replication"] + list(variance_reduction.run_overrides(first_key, 0)) \
+            + list(first_key)
+        sink = create_result_sink(fileName, result_format, total_iterations, createHeatmaps, manifest,
+                                  design_columns)
+
+        with sink, tqdm(total=total_iterations, disable=not display_progress) as pbar:
+            if nr_processes == 1:
+                _initialise_worker(fixed_parameters)
+                if adaptive_replication is None:
+                    results = map(process_func, iter_args)
+                else:
+                    results = _run_adaptive(lambda run, callback: callback(process_func(run)), controller, 1)
+                _collect_runs(results, sink, pbar, observers)
+
+            else:
+                # The fixed parameters are sent to each worker once
+                with Pool(nr_processes, initializer=_initialise_worker, initargs=(fixed_parameters,)) as p:
+                    if adaptive_replication is None:
+                        results = p.imap_unordered(process_func, iter_args)
+                    else:
+                        results = _run_adaptive(
+                            lambda run, callback: p.apply_async(process_func, (run,), callback=callback,
+                                                                error_callback=callback),
+                            controller,
+                            2 * nr_processes,
+                        )
+                    _collect_runs(results, sink, pbar, observers)
+
+    if adaptive_replication is not None:
+        controller.report().to_csv(fileName + "_replications.csv", index=False)
+
+    if paired_differences is not None:
+        paired_differences.report().to_csv(fileName + "_paired.csv", index=False)
+
+    if sampler is not None and sampler.estimator is not None:
+        sampler.estimator.report().to_csv(fileName + "_sensitivity.csv", index=False)
+
+    return sink.writes
+
+
+def _collect_runs(results, sink, pbar, observers=()) -> None:
+    """Hand the results of the runs to the sink as they come in."""
+    for (run_id, replication, key, overrides), run_data, movementHeatmap, deliveriesHeatmap in results:
+        out = {"RunId": run_id, "replication": replication}
+        out.update(overrides)
+        out.update(key)
+        out.update(run_data)
+        sink.add(out, {"movements": movementHeatmap, "deliveries": deliveriesHeatmap})
+        for observer in observers:
+            observer(key, replication, run_data)
+        pbar.update()
+
+
+def _add_completed_results(observer, make_keys, iterations, variance_reduction, completed_results) -> None:
+    """Pass the results of the runs that were completed before a resume to an observer.
+    Parameters
+    ----------
+    observer : Callable
+        Function that receives the variable kwargs, replication and results of a run
+    make_keys : Callable[[], Iterator[Dict[str, Any]]]
+        Function that creates the variable kwargs of all parameter combinations
+    iterations : int
+        Maximum number of replications of each parameter combination
+    variance_reduction : VarianceReduction
+        Determines the overriding kwargs, which are written with the results
+    completed_results : Dict[str, Dict[str, Any]]
+        Rows of the results files, by run id
+    """
+    for replication in range(iterations):
+        for key in make_keys():
+            row = completed_results.get(make_run_id(key, replication))
+            if row is None:
+                continue
 
+            # The results files also contain the run id, replication, variable and overriding kwargs
+            excluded = {"RunId", "replication"} | set(key) | set(variance_reduction.run_overrides(key, replication))
+            observer(key, replication, {var: value for var, value in row.items() if var not in excluded})
 
-def _make_model_kwargs(
-    parameters: Mapping[str, Union[Any, Iterable[Any]]],
-    fixed_parameters: Mapping[str, Union[Any, Iterable[Any]]] 
-) -> List[Dict[str, Any]]:
-    """Create model kwargs from parameters dictionary.
+
+def _run_adaptive(submit, controller, max_in_flight):
+    """Perform the runs that the replication controller asks for, yielding their results as they come in.
     Parameters
     ----------
-    parameters : Mapping[str, Union[Any, Iterable[Any]]]
-        Single or multiple values for each model parameter name
-    Returns
-    -------
-    List[Dict[str, Any]]
-        A list of all kwargs combinations.
+    submit : Callable
+        Function that starts a run and passes its result, or exception, to a callback
+    controller : ReplicationController
+        Decides which runs are performed
+    max_in_flight : int
+        Maximum number of runs that are submitted but not finished
     """
+    finished_runs = queue.Queue()
+    in_flight = 0
+
+    while True:
+        while in_flight < max_in_flight:
+            run = controller.next_run()
+            if run is None:
+                break
+            submit(run, finished_runs.put)
+            in_flight += 1
+
+        if in_flight == 0:
+            return
+
+        result = finished_runs.get()
+        in_flight -= 1
+        if isinstance(result, BaseException):
+            raise result
+
+        run, run_data, _, _ = result
+        controller.add_result(run[2], run_data)
+        yield result
+
+
+def _make_parameter_list(
+    parameters: Mapping[str, Union[Any, Iterable[Any]]],
+) -> List[List[Tuple[str, Any]]]:
+    """Create a list of all (name, value) pairs for each model parameter."""
     parameter_list = []
     for param, values in parameters.items():
         try:
@@ -167,16 +328,80 @@ def _make_model_kwargs(
         except TypeError:
             all_values = [(param, values)]
         parameter_list.append(all_values)
-    all_vars = itertools.product(*parameter_list)
-    kwargs_list = []
-    for vars in all_vars:
-        key = dict(vars)
-        kwargs = key.copy()
-        kwargs.update(fixed_parameters)
 
-        kwargs_list.append([key, kwargs])
+    return parameter_list
+
+
+def _make_model_kwargs(
+    parameters: Mapping[str, Union[Any, Iterable[Any]]],
+) -> Iterator[Dict[str, Any]]:
+    """Lazily create the variable model kwargs from parameters dictionary.
+    The fixed parameters are not included, these are added in the worker by _model_run_func.
+    Parameters
+    ----------
+    parameters : Mapping[str, Union[Any, Iterable[Any]]]
+        Single or multiple values for each model parameter name
+    Returns
+    -------
+    Iterator[Dict[str, Any]]
+        A generator of all kwargs combinations.
+    """
+    for vars in itertools.product(*_make_parameter_list(parameters)):
+        yield dict(vars)
+
+
+def _count_model_kwargs(
+    parameters: Mapping[str, Union[Any, Iterable[Any]]],
+) -> int:
+    """Count the kwargs combinations created by _make_model_kwargs without creating them."""
+    total = 1
+    for all_values in _make_parameter_list(parameters):
+        total *= len(all_values)
+
+    return total
+
+
+def _make_runs(
+    make_keys: Callable[[], Iterator[Dict[str, Any]]],
+    iterations: int,
+    variance_reduction: VarianceReduction,
+    completed: Iterable[str] = (),
+) -> Iterator[Tuple[str, int, Dict[str, Any], Dict[str, Any]]]:
+    """Lazily create the runs of a batch, skipping completed ones.
+    Parameters
+    ----------
+    make_keys : Callable[[], Iterator[Dict[str, Any]]]
+        Function that creates the variable kwargs of all parameter combinations
+    iterations : int
+        Number of replications of each parameter combination
+    variance_reduction : VarianceReduction
+        Determines the seed, and possibly day and delay draws, of each run
+    completed : Iterable[str]
+        Ids of the runs that do not have to be performed again
+    Returns
+    -------
+    Iterator[Tuple[str, int, Dict[str, Any], Dict[str, Any]]]
+        A generator of (run id, replication, variable kwargs, overriding kwargs). The overriding kwargs contain
+        the seed, unless the seed is one of the variable parameters
+    """
+    for replication in range(iterations):
+        for key in make_keys():
+            run_id = make_run_id(key, replication)
+            if run_id in completed:
+                continue
+
+            yield run_id, replication, key, variance_reduction.run_overrides(key, replication)
+
+
+# Fixed model parameters of a worker process, set once per worker by _initialise_worker
+_fixed_parameters: Mapping[str, Any] = {}
+
+
+def _initialise_worker(fixed_parameters: Mapping[str, Any]) -> None:
+    """Store the fixed parameters in the worker, attaching to arrays that were placed in shared memory."""
+    global _fixed_parameters
+    _fixed_parameters = attach_parameters(fixed_parameters)
 
-    return kwargs_list
 
 # def _make_sensitivity_kwargs(
 #     parameters: Mapping[str, Union[Any, Iterable[Any]]],
@@ -208,28 +433,36 @@ def _make_model_kwargs(
 
 def _model_run_func(
     model_cls: Type[Model],
-    argumentList,
+    run: Tuple[str, int, Dict[str, Any], Dict[str, Any]],
     max_steps: int,
-) -> Tuple[Tuple[Any, ...], List[Dict[str, Any]]]:
+) -> Tuple[Tuple[str, int, Dict[str, Any], Dict[str, Any]], Dict[str, Any], Any, Any]:
     """Run a single model run and collect model and agent data.
     Parameters
     ----------
     model_cls : Type[Model]
         The model class to batch-run
-    kwargs : Dict[str, Any]
-        model kwargs used for this run
+    run : Tuple[str, int, Dict[str, Any], Dict[str, Any]]
+        run id, replication, variable model kwargs and overriding kwargs of this run, completed with the fixed
+        parameters of the worker
     max_steps : int
         Maximum number of model steps after which the model halts, by default 1000
     i_steps : int
         Collect data every ith step
     Returns
     -------
-    Tuple[Tuple[Any, ...], List[Dict[str, Any]]]
-        Return model_data, agent_data from the reporters
+    Tuple[Tuple[str, int, Dict[str, Any], Dict[str, Any]], Dict[str, Any], Any, Any]
+        Return the run, model_data and the movement and deliveries heatmaps
     """
     
-    key = argumentList[0]
-    kwargs = argumentList[1]
+    _, _, key, overrides = run
+    kwargs = {param: value for param, value in key.items() if param not in SAMPLE_COLUMNS and "." not in param}
+    kwargs.update(_fixed_parameters)
+    kwargs.update(overrides)
+
+    # Parameters within dict parameters, e.g. drone_params.speed, replace the value in a copy of the dict
+    for param, value in key.items():
+        if "." in param:
+            _set_nested_parameter(kwargs, param.split("."), value)
     model = model_cls(**kwargs)
     while model.running and model.schedule.steps <= max_steps:
         model.step()
@@ -251,7 +484,17 @@ def _model_run_func(
 
     data, movementHeatmap, deliveriesHeatmap = _collect_model_result(model)
 
-    return key, data, movementHeatmap, deliveriesHeatmap
+    return run, data, movementHeatmap, deliveriesHeatmap
+
+def _set_nested_parameter(parameters: Dict[str, Any], path: List[str], value: Any) -> None:
+    """Set a parameter within nested dicts, copying the dicts on the path so the originals are not changed."""
+    name = path[0]
+    if len(path) == 1:
+        parameters[name] = value
+    else:
+        parameters[name] = dict(parameters[name])
+        _set_nested_parameter(parameters[name], path[1:], value)
+
 
 def _collect_model_result(model: Model):
     """Run reporters and collect model-level variables."""
@@ -0,0 +1,207 @@
+"""
+Adaptive number of replications per scenario
+
+Instead of a fixed number of replications, every scenario (parameter combination) is replicated until the
+confidence intervals of the chosen KPIs are narrow enough. The mean and variance of the KPIs are updated with
+every incoming result, and new replications are only submitted for scenarios that have not converged yet, so
+converged scenarios free up processors for the others.
+"""
+import math
+
+import pandas as pd
+
+from Batch_Run.run_manifest import make_run_id
+
+# z-value of a two-sided 95% confidence interval
+Z_95 = 1.96
+
+
+class RunningStatistics:
+    """Mean and variance of a KPI, updated one value at a time (Welford's algorithm)"""
+
+    def __init__(self):
+
+        self.n = 0
+        self.mean = 0.0
+        self.sum_of_squares = 0.0                       # sum of squared deviations from the mean
+
+    def add(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.sum_of_squares += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        if self.n < 2:
+            return math.inf
+
+        return self.sum_of_squares / (self.n - 1)
+
+    @property
+    def half_width(self):
+        """Half-width of the 95% confidence interval of the mean"""
+        if self.n < 2:
+            return math.inf
+
+        return Z_95 * math.sqrt(self.variance / self.n)
+
+
+class AdaptiveReplication:
+    """
+    Target precision of the KPIs of every scenario
+
+    :param precision_targets: dict of maximum relative confidence interval half-widths, by KPI name,
+                              e.g. {"Average deliverytime": 0.01} for +-1%
+    :param min_iterations: number of replications of a scenario before it can converge
+    :param max_iterations: maximum number of replications of a scenario
+    """
+
+    def __init__(self, precision_targets, min_iterations=5, max_iterations=100):
+
+        self.precision_targets = precision_targets
+        self.min_iterations = min_iterations
+        self.max_iterations = max_iterations
+
+    def converged(self, statistics):
+        """
+        Check if the KPIs of a scenario meet their targets
+
+        :param statistics: dict of RunningStatistics, by KPI name
+        :return: bool
+        """
+        for kpi, target in self.precision_targets.items():
+            kpi_statistics = statistics[kpi]
+
+            if kpi_statistics.n < self.min_iterations:
+                return False
+
+            if kpi_statistics.half_width > target * abs(kpi_statistics.mean):
+                return False
+
+        return True
+
+
+class _Scenario:
+    """Replication state of a single parameter combination"""
+
+    def __init__(self, key, targets):
+
+        self.key = key
+        self.next_replication = 0
+        self.submitted = 0
+        self.statistics = {kpi: RunningStatistics() for kpi in targets}
+        self.converged = False
+
+
+class ReplicationController:
+    """
+    Decides which run to perform next, based on the results that came in so far
+
+    When a batch is resumed, the runs that were completed before count towards the replications of their
+    scenario, and their results are added to its statistics, so converged scenarios are not run again.
+
+    :param adaptive_replication: AdaptiveReplication
+    :param keys: variable kwargs of every scenario
+    :param variance_reduction: VarianceReduction, which determines the overriding kwargs of every run
+    :param completed: ids of the runs that were completed before a resume
+    :param completed_results: dict of results of the completed runs, by run id
+    """
+
+    def __init__(self, adaptive_replication, keys, variance_reduction, completed=(), completed_results=None):
+
+        self.adaptive_replication = adaptive_replication
+        self.variance_reduction = variance_reduction
+        self.completed = completed
+        self.scenarios = [_Scenario(key, adaptive_replication.precision_targets) for key in keys]
+        self.scenarios_by_id = {make_run_id(scenario.key, None): scenario for scenario in self.scenarios}
+        self.missing_results = 0                        # completed runs of which the results were not found
+
+        if completed:
+            for scenario in self.scenarios:
+                self._add_completed_runs(scenario, completed_results or {})
+
+    def _add_completed_runs(self, scenario, completed_results):
+        """Count the completed runs of a scenario as submitted and add their results to its statistics"""
+        for replication in range(self.adaptive_replication.max_iterations):
+            run_id = make_run_id(scenario.key, replication)
+            if run_id not in self.completed:
+                continue
+
+            scenario.submitted += 1
+            if run_id not in completed_results:
+                self.missing_results += 1
+                continue
+
+            for kpi, statistics in scenario.statistics.items():
+                statistics.add(completed_results[run_id][kpi])
+
+        scenario.converged = self.adaptive_replication.converged(scenario.statistics)
+
+    @property
+    def remaining_runs(self):
+        """Maximum number of runs that may still be performed"""
+        return sum(self.adaptive_replication.max_iterations - scenario.submitted
+                   for scenario in self.scenarios if not scenario.converged)
+
+    def next_run(self):
+        """
+        Create the next run of the scenario that has been replicated least, among those that have not converged
+
+        :return: (run id, replication, variable kwargs, overriding kwargs), or None if no run is needed
+        """
+        candidates = [scenario for scenario in self.scenarios if not scenario.converged
+                      and scenario.submitted < self.adaptive_replication.max_iterations]
+
+        if not candidates:
+            return None
+
+        scenario = min(candidates, key=lambda candidate: candidate.submitted)
+        scenario.submitted += 1
+
+        # Runs that were completed before a resume are not performed again
+        while True:
+            replication = scenario.next_replication
+            scenario.next_replication += 1
+            run_id = make_run_id(scenario.key, replication)
+
+            if run_id not in self.completed:
+                break
+
+        return run_id, replication, scenario.key, self.variance_reduction.run_overrides(scenario.key, replication)
+
+    def add_result(self, key, run_data):
+        """
+        Update the statistics of a scenario with the results of one of its runs
+
+        :param key: variable kwargs of the run
+        :param run_data: dict of model results
+        :return:
+        """
+        scenario = self.scenarios_by_id[make_run_id(key, None)]
+
+        for kpi, statistics in scenario.statistics.items():
+            statistics.add(run_data[kpi])
+
+        scenario.converged = self.adaptive_replication.converged(scenario.statistics)
+
+    def report(self):
+        """
+        Summarise the replications of all scenarios
+
+        :return: DataFrame with a row per scenario
+        """
+        rows = []
+
+        for scenario in self.scenarios:
+            row = dict(scenario.key)
+            row["replications"] = scenario.submitted
+            row["converged"] = scenario.converged
+
+            for kpi, statistics in scenario.statistics.items():
+                row[kpi + " mean"] = statistics.mean
+                row[kpi + " CI half-width"] = statistics.half_width
+
+            rows.append(row)
+
+        return pd.DataFrame(rows)
@@ -0,0 +1,139 @@
+"""
+Continue several scenario variants from one model snapshot
+
+Variants that share the start of a day only have to simulate that part once. The model is restored from the
+snapshot once, after which every variant is run in a forked process that shares the memory of the restored
+model copy-on-write. On platforms without os.fork the variants are restored and run one after the other.
+"""
+import os
+import pickle
+from multiprocessing import cpu_count
+
+from Batch_Run.CustomBatchrunner import _collect_model_result
+from snapshot import restore_snapshot
+
+
+def setting_variant(settings):
+    """
+    Create a variant that changes model settings, a setting is changed with the set_<setting> method of the
+    model when it has one and is assigned directly otherwise
+
+    :param settings: dict of setting values, e.g. {"delivery_mode": "fast", "repositioning": True}
+    :return: function that changes the restored model
+    """
+    def variant(model):
+        for setting, value in settings.items():
+            setter = getattr(model, "set_" + setting, None)
+
+            if setter is not None:
+                setter(value)
+            elif hasattr(model, setting):
+                setattr(model, setting, value)
+            else:
+                raise ValueError(f"The model has no setting {setting}")
+
+    return variant
+
+
+def _run_variant(model, variant, max_steps):
+    """
+    Apply a variant to a model and run it until it halts
+
+    :param model: restored model
+    :param variant: function that changes the model, e.g. lambda m: m.set_delivery_mode("fast")
+    :param max_steps: maximum number of model steps after which the model halts
+    :return: dict of model results
+    """
+    variant(model)
+
+    while model.running and model.schedule.steps <= max_steps:
+        model.step()
+
+    model_vars, _, _ = _collect_model_result(model)
+
+    return model_vars
+
+
+def _fork_variant(model, variant, max_steps):
+    """
+    Run a variant in a forked process
+
+    :return: process id and the file from which its pickled result can be read
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+
+    if pid == 0:
+        os.close(read_fd)
+        exit_code = 0
+
+        try:
+            result = _run_variant(model, variant, max_steps)
+        except Exception as error:
+            result = error
+            exit_code = 1
+
+        with os.fdopen(write_fd, "wb") as f:
+            pickle.dump(result, f)
+
+        os._exit(exit_code)
+
+    os.close(write_fd)
+
+    return pid, os.fdopen(read_fd, "rb")
+
+
+def _collect_variant(pid, result_file):
+    """
+    Wait for a forked variant and return its result
+
+    :param pid: process id of the variant
+    :param result_file: file to which the variant writes its result
+    :return: dict of model results
+    """
+    with result_file:
+        result = pickle.load(result_file)
+
+    os.waitpid(pid, 0)
+
+    if isinstance(result, Exception):
+        raise result
+
+    return result
+
+
+def run_variants(snapshot, variants, max_steps=1000, nr_processes=None):
+    """
+    Continue a snapshot with each of the variants
+
+    :param snapshot: ModelSnapshot from which all variants start
+    :param variants: dict of functions that change the restored model, by variant name
+    :param max_steps: maximum number of model steps after which the model halts
+    :param nr_processes: maximum number of variants that run at the same time, all processors when None
+    :return: dict of model results, by variant name
+    """
+    results = {}
+
+    if not hasattr(os, "fork"):
+        for name, variant in variants.items():
+            results[name] = _run_variant(restore_snapshot(snapshot), variant, max_steps)
+
+        return results
+
+    if nr_processes is None:
+        nr_processes = cpu_count()
+
+    model = restore_snapshot(snapshot)
+    running = []
+
+    for name, variant in variants.items():
+        if len(running) == nr_processes:
+            finished_name, pid, result_file = running.pop(0)
+            results[finished_name] = _collect_variant(pid, result_file)
+
+        running.append((name,) + _fork_variant(model, variant, max_steps))
+
+    for name, pid, result_file in running:
+        results[name] = _collect_variant(pid, result_file)
+
+    return results
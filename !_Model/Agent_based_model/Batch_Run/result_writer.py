@@ -0,0 +1,354 @@
+"""
+Writers that store the results of a batch run
+
+The scalar results of every run are stored as rows of a CSV, Parquet or Arrow IPC file. The movement and
+deliveries heatmaps are stored per run in a stacked .npy file, in the same order as the rows. All
+writing happens on a background thread, so collecting results does not hold up the batch runner.
+
+Parquet and Arrow IPC files require pyarrow.
+"""
+import os
+import queue
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class ResultWriter:
+    """Base class of the writers that store the scalar results of a batch run as rows"""
+
+    extension = None
+
+    def __init__(self, file_name, design_columns=()):
+
+        self.file_name = file_name
+        self.design_columns = set(design_columns)    # columns that identify a run, the others are model results
+        self.columns = None                          # columns of the first rows, which all later rows follow
+
+    def write(self, rows):
+        """
+        Append rows to the file
+
+        Later rows may lack columns of the first rows, these are left empty, but columns that the first rows
+        did not have cannot be stored in the file.
+
+        :param rows: list of dicts that map column names to values
+        :return:
+        """
+        data_frame = pd.DataFrame(rows)
+
+        if self.columns is None:
+            self.columns = list(data_frame.columns)
+
+        unknown_columns = [column for column in data_frame.columns if column not in self.columns]
+        if unknown_columns:
+            raise ValueError(f"Results contain columns that the first results did not have: {unknown_columns}")
+
+        self._write(data_frame.reindex(columns=self.columns))
+
+    def _write(self, data_frame):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CsvResultWriter(ResultWriter):
+    """Writes the results to a CSV file"""
+
+    extension = ".csv"
+
+    def __init__(self, file_name, design_columns=()):
+
+        super().__init__(file_name, design_columns)
+        self.header_written = False
+
+    def _write(self, data_frame):
+        mode = 'a' if self.header_written else 'w'
+        data_frame.to_csv(path_or_buf=self.file_name, mode=mode, header=not self.header_written, index=False)
+        self.header_written = True
+
+
+class ArrowResultWriter(ResultWriter):
+    """
+    Writes the results to an Arrow IPC file, with the column types of the first rows
+
+    Integer and empty model result columns are stored as float64, as results such as costs are integer 0 until
+    the first delivery and floats afterwards, and results without a value in the first rows get one later on.
+    The design columns keep their types, empty ones, such as the varied parameter of the first Saltelli samples,
+    are stored as strings.
+    """
+
+    extension = ".arrow"
+
+    def __init__(self, file_name, design_columns=()):
+
+        import pyarrow
+
+        super().__init__(file_name, design_columns)
+        self.pyarrow = pyarrow
+        self.schema = None
+        self.writer = None
+
+    def _open(self, schema):
+        return self.pyarrow.ipc.new_file(self.file_name, schema)
+
+    def _create_schema(self, data_frame):
+        """Schema of the file, from the column types of the first rows"""
+        types = self.pyarrow.types
+        fields = []
+
+        for field in self.pyarrow.Schema.from_pandas(data_frame, preserve_index=False):
+            if field.name in self.design_columns:
+                if types.is_null(field.type):
+                    field = field.with_type(self.pyarrow.string())
+            elif types.is_integer(field.type) or types.is_null(field.type):
+                field = field.with_type(self.pyarrow.float64())
+            fields.append(field)
+
+        return self.pyarrow.schema(fields)
+
+    def _write(self, data_frame):
+        if self.schema is None:
+            self.schema = self._create_schema(data_frame)
+            self.writer = self._open(self.schema)
+
+        table = self.pyarrow.Table.from_pandas(data_frame, schema=self.schema, preserve_index=False)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ParquetResultWriter(ArrowResultWriter):
+    """Writes the results to a Parquet file, with the column types of the first rows (see ArrowResultWriter)"""
+
+    extension = ".parquet"
+
+    def _open(self, schema):
+        import pyarrow.parquet
+
+        return pyarrow.parquet.ParquetWriter(self.file_name, schema)
+
+
+# Result writers by format
+RESULT_WRITERS = {
+    "csv": CsvResultWriter,
+    "arrow": ArrowResultWriter,
+    "parquet": ParquetResultWriter,
+}
+
+
+class HeatmapStore:
+    """Stores one heatmap per run in a stacked .npy file, in the order of the rows of the results file"""
+
+    def __init__(self, file_name, nr_runs):
+
+        self.file_name = file_name
+        self.nr_runs = nr_runs
+        self.heatmaps = None                         # created when the first heatmap, and thus its shape, is known
+
+    def write(self, index, heatmap):
+        """
+        Store the heatmap of a run
+
+        :param index: position of the run in the results file
+        :param heatmap: heatmap matrix of the run
+        :return:
+        """
+        heatmap = np.asarray(heatmap)
+
+        if self.heatmaps is None:
+            self.heatmaps = np.lib.format.open_memmap(self.file_name, mode="w+", dtype=heatmap.dtype,
+                                                      shape=(self.nr_runs,) + heatmap.shape)
+
+        self.heatmaps[index] = heatmap
+
+    def flush(self):
+        if self.heatmaps is not None:
+            self.heatmaps.flush()
+
+    def close(self):
+        self.flush()
+
+
+class ResultSink:
+    """
+    Collects the results of a batch run and writes them on a background thread
+
+    Rows are written in batches of buffer_size. At most max_pending batches and heatmaps wait to be written,
+    after which adding results waits for the writer to catch up. The heatmaps of a run are stored at the
+    position of its row in the results file. When a manifest is given, the RunIds of the rows are recorded in it
+    once the rows have been written.
+    """
+
+    def __init__(self, writer, heatmap_stores=None, manifest=None, buffer_size=1000, max_pending=64):
+
+        self.writer = writer
+        self.heatmap_stores = heatmap_stores or {}
+        self.manifest = manifest
+        self.buffer_size = buffer_size
+        self.rows = []
+        self.nr_rows = 0
+        self.writes = 0
+        self.error = None
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.thread = threading.Thread(target=self._write_queue, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, row, heatmaps=None):
+        """
+        Add the results of a run
+
+        :param row: dict of scalar results
+        :param heatmaps: dict of heatmaps of the run, by name of the heatmap store
+        :return:
+        """
+        if self.error is not None:
+            raise self.error
+
+        # Heatmaps are queued before the row, so a run is only recorded as completed when both are written
+        for name, heatmap in (heatmaps or {}).items():
+            if heatmap is not None and name in self.heatmap_stores:
+                self.queue.put((self.heatmap_stores[name].write, (self.nr_rows, heatmap)))
+
+        self.rows.append(row)
+        self.nr_rows += 1
+
+        if len(self.rows) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered rows to the background thread"""
+        if self.rows:
+            self.queue.put((self._write_rows, (self.rows,)))
+            self.rows = []
+            self.writes += 1
+
+    def close(self):
+        """Write all remaining results and close the files"""
+        self.flush()
+        self.queue.put(None)
+        self.thread.join()
+
+        self.writer.close()
+        for store in self.heatmap_stores.values():
+            store.close()
+
+        if self.error is not None:
+            raise self.error
+
+    def _write_rows(self, rows):
+        """Write rows and record their runs as completed"""
+        self.writer.write(rows)
+
+        if self.manifest is not None:
+            for store in self.heatmap_stores.values():
+                store.flush()
+            self.manifest.record([row["RunId"] for row in rows])
+
+    def _write_queue(self):
+        """Perform the writes in the queue until None is received"""
+        while True:
+            task = self.queue.get()
+
+            if task is None:
+                return
+
+            if self.error is None:
+                write, args = task
+
+                try:
+                    write(*args)
+                except Exception as error:
+                    self.error = error
+
+
+def read_results(file_name):
+    """
+    Read a results file written by one of the result writers
+
+    :param file_name: file name of the results, with extension
+    :return: DataFrame with a row per run
+    """
+    if file_name.endswith(ArrowResultWriter.extension):
+        import pyarrow
+
+        with pyarrow.memory_map(file_name) as source:
+            return pyarrow.ipc.open_file(source).read_pandas()
+
+    if file_name.endswith(ParquetResultWriter.extension):
+        return pd.read_parquet(file_name)
+
+    return pd.read_csv(file_name)
+
+
+def read_run_results(directory, run_name, run_ids, columns):
+    """
+    Read the results of earlier sessions of a batch run, e.g. before it was resumed
+
+    The results of the first session are in <run_name>.<extension>, those of every resumed session in
+    <run_name>_resumed_<time>.<extension>. Runs of which no row is found, e.g. because a file was removed, are
+    left out.
+
+    :param directory: directory of the results files
+    :param run_name: name of the batch run
+    :param run_ids: ids of the runs of which the results are read
+    :param columns: columns that are read, all columns when None
+    :return: dict of dicts of results, by run id
+    """
+    extensions = "|".join(re.escape(writer_cls.extension) for writer_cls in RESULT_WRITERS.values())
+    pattern = re.compile(re.escape(run_name) + r"(_resumed_\d{2}_\d{2}_\d{2}_\d{2})?(" + extensions + ")$")
+    results = {}
+
+    for file_name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        if not pattern.match(file_name):
+            continue
+
+        data_frame = read_results(os.path.join(directory, file_name))
+        data_frame = data_frame[data_frame["RunId"].isin(run_ids)]
+        rows = data_frame.to_dict("records") if columns is None else data_frame[list(columns)].to_dict("records")
+
+        for run_id, row in zip(data_frame["RunId"], rows):
+            results[run_id] = row
+
+    return results
+
+
+def create_result_sink(file_name, result_format="csv", nr_runs=0, heatmaps=False, manifest=None,
+                       design_columns=()):
+    """
+    Create the sink of a batch run
+
+    :param file_name: file name of the results, without extension
+    :param result_format: csv, arrow or parquet
+    :param nr_runs: total number of runs, needed to store heatmaps
+    :param heatmaps: whether the movement and deliveries heatmaps are stored
+    :param manifest: RunManifest in which written runs are recorded, optional
+    :param design_columns: columns that identify a run, e.g. RunId and the variable parameters, the other
+                           columns are model results
+    :return: ResultSink
+    """
+    writer_cls = RESULT_WRITERS[result_format]
+    writer = writer_cls(file_name + writer_cls.extension, design_columns)
+
+    heatmap_stores = {}
+
+    if heatmaps:
+        directory, name = os.path.split(file_name)
+        os.makedirs(os.path.join(directory, "heatmaps"), exist_ok=True)
+
+        for heatmap in ["movements", "deliveries"]:
+            heatmap_stores[heatmap] = HeatmapStore(os.path.join(directory, "heatmaps", name + heatmap + ".npy"),
+                                                   nr_runs)
+
+    return ResultSink(writer, heatmap_stores, manifest)
@@ -0,0 +1,65 @@
+"""
+Manifest of the completed runs of a batch run
+
+Every run of a batch is identified by its variable parameters and replication number. The run id and the seed
+of a run are derived from these, so they are the same every time the batch is started. The ids of completed
+runs are appended to the manifest once their results have been written, which allows an interrupted batch to
+skip them when it is resumed.
+"""
+import hashlib
+import json
+import os
+
+
+def make_run_id(key, replication):
+    """
+    Compute the id of a run
+
+    :param key: dict of variable parameters of the run
+    :param replication: replication number of the parameter combination
+    :return: hexadecimal run id
+    """
+    content = json.dumps([sorted(key.items()), replication], default=repr)
+
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def make_run_seed(run_id):
+    """
+    Derive the seed of a run from its id
+
+    :param run_id: hexadecimal run id
+    :return: 32 bit seed
+    """
+    return int(run_id[:8], 16)
+
+
+class RunManifest:
+    """Append-only file with the ids of the completed runs, one per line"""
+
+    def __init__(self, file_name, resume=False):
+
+        self.file_name = file_name
+        self.completed = set()
+
+        if resume and os.path.exists(file_name):
+            with open(file_name) as f:
+                self.completed = {line.strip() for line in f if line.strip()}
+
+        else:
+            os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+            open(file_name, "w").close()
+
+    def record(self, run_ids):
+        """
+        Mark runs as completed, the ids are on disk when this returns
+
+        :param run_ids: ids of the completed runs
+        :return:
+        """
+        with open(self.file_name, "a") as f:
+            f.writelines(run_id + "\n" for run_id in run_ids)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.completed.update(run_ids)
@@ -0,0 +1,207 @@
+"""
+Space-filling samplers for sensitivity analyses
+
+Instead of the full factorial grid of the variable parameters, a sampler draws a fixed number of parameter
+combinations from the ranges of the parameters. Parameters within dict parameters are referred to with a dot,
+e.g. "drone_params.speed". A range with integer bounds is sampled as integers.
+
+LatinHypercubeSampler spreads its samples evenly over the range of every parameter. SaltelliSampler creates the
+sample matrices A, B and AB_i (A with the column of parameter i taken from B) from a Sobol sequence, from which
+SobolIndices estimates the first-order and total-effect indices while the results come in.
+
+The samples are drawn once, when the sampler is created, so every replication and a resumed batch run use the
+same design. Without a seed a random one is chosen, which is kept in the seed attribute; a batch run that was
+started without a seed is resumed with a sampler created with that seed.
+"""
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+from Batch_Run.adaptive_replication import RunningStatistics
+
+# Columns of a sample that identify it, these are not passed to the model
+SAMPLE_COLUMNS = ("sample", "sample matrix", "varied parameter")
+
+
+def scale_samples(unit_samples, bounds):
+    """
+    Scale samples from the unit hypercube to the parameter ranges
+
+    :param unit_samples: array of samples between 0 and 1, one column per parameter
+    :param bounds: dict of (lower, upper) bounds, by parameter name
+    :return: list of dicts of parameter values
+    """
+    columns = []
+
+    for (param, (lower, upper)), unit_column in zip(bounds.items(), unit_samples.T):
+        if isinstance(lower, int) and isinstance(upper, int):
+            column = np.floor(lower + unit_column * (upper - lower + 1)).astype(int).clip(lower, upper)
+        else:
+            column = lower + unit_column * (upper - lower)
+
+        columns.append(column.tolist())
+
+    return [dict(zip(bounds, values)) for values in zip(*columns)]
+
+
+def design_seed(seed):
+    """
+    Seed of a sample design, a random seed is chosen when none is given
+
+    :param seed: seed of the design or None
+    :return: integer seed
+    """
+    if seed is None:
+        return np.random.SeedSequence().entropy
+
+    return seed
+
+
+class LatinHypercubeSampler:
+    """
+    Latin hypercube sample of the parameter ranges
+
+    :param bounds: dict of (lower, upper) bounds, by parameter name
+    :param n: number of samples
+    :param seed: seed of the sample, a random seed when None
+    """
+
+    def __init__(self, bounds, n, seed=None):
+
+        self.bounds = bounds
+        self.n = n
+        self.seed = design_seed(seed)
+        self.estimator = None
+        self.unit_samples = qmc.LatinHypercube(len(bounds), seed=self.seed).random(n)
+
+    def __len__(self):
+        return self.n
+
+    def samples(self):
+        """
+        Create the samples, the same ones every time
+
+        :return: iterator of dicts of parameter values
+        """
+        for i, sample in enumerate(scale_samples(self.unit_samples, self.bounds)):
+            sample["sample"] = i
+            yield sample
+
+
+class SaltelliSampler:
+    """
+    Saltelli sample of the parameter ranges, for the estimation of Sobol indices
+
+    Creates n * (number of parameters + 2) samples.
+
+    :param bounds: dict of (lower, upper) bounds, by parameter name
+    :param n: number of base samples, preferably a power of 2
+    :param seed: seed of the Sobol sequence, a random seed when None
+    :param kpis: KPIs of which the indices are estimated, all numeric model results when None
+    """
+
+    def __init__(self, bounds, n, seed=None, kpis=None):
+
+        self.bounds = bounds
+        self.n = n
+        self.seed = design_seed(seed)
+        self.estimator = SobolIndices(list(bounds), kpis)
+        self.unit_samples = qmc.Sobol(2 * len(bounds), scramble=True, seed=self.seed).random(n)
+
+    def __len__(self):
+        return self.n * (len(self.bounds) + 2)
+
+    def samples(self):
+        """
+        Create the samples, the same ones every time, per base sample j first A_j, then B_j and then AB_ij for
+        every parameter i
+
+        :return: iterator of dicts of parameter values
+        """
+        d = len(self.bounds)
+        a = scale_samples(self.unit_samples[:, :d], self.bounds)
+        b = scale_samples(self.unit_samples[:, d:], self.bounds)
+
+        for j in range(self.n):
+            yield dict(a[j], **{"sample": j, "sample matrix": "A", "varied parameter": None})
+            yield dict(b[j], **{"sample": j, "sample matrix": "B", "varied parameter": None})
+
+            for param in self.bounds:
+                ab = dict(a[j])
+                ab[param] = b[j][param]
+                yield dict(ab, **{"sample": j, "sample matrix": "AB", "varied parameter": param})
+
+
+class SobolIndices:
+    """
+    Streaming estimator of first-order (Saltelli 2010) and total-effect (Jansen) Sobol indices
+
+    The results of base sample j are kept until those of A_j, B_j and all AB_ij are in, after which they are
+    added to running sums and released.
+    """
+
+    def __init__(self, params, kpis=None):
+
+        self.params = params
+        self.kpis = kpis
+        self.pending = {}                               # (sample, replication) -> dict of results by matrix
+        self.variance = {}                              # KPI -> RunningStatistics of all A and B results
+        self.first_order = {}                           # (KPI, parameter) -> RunningStatistics
+        self.total_effect = {}                          # (KPI, parameter) -> RunningStatistics
+        self.samples = 0
+
+    def add(self, key, replication, run_data):
+        """
+        Add the results of a run
+
+        :param key: sample of the run
+        :param replication: replication number of the run
+        :param run_data: dict of model results
+        :return:
+        """
+        if self.kpis is None:
+            self.kpis = [var for var, value in run_data.items()
+                         if isinstance(value, (int, float, np.number)) and not isinstance(value, bool)]
+
+        group = self.pending.setdefault((key["sample"], replication), {})
+        matrix = key["sample matrix"] if key["sample matrix"] != "AB" else key["varied parameter"]
+        group[matrix] = np.array([run_data[kpi] for kpi in self.kpis], dtype=float)
+
+        if len(group) == len(self.params) + 2:
+            self._add_sample(self.pending.pop((key["sample"], replication)))
+
+    def _add_sample(self, group):
+        """Update the running sums with a complete base sample"""
+        f_a, f_b = group["A"], group["B"]
+        self.samples += 1
+
+        for k, kpi in enumerate(self.kpis):
+            self.variance.setdefault(kpi, RunningStatistics()).add(f_a[k])
+            self.variance[kpi].add(f_b[k])
+
+            for param in self.params:
+                f_ab = group[param]
+                self.first_order.setdefault((kpi, param), RunningStatistics()).add(f_b[k] * (f_ab[k] - f_a[k]))
+                self.total_effect.setdefault((kpi, param), RunningStatistics()).add((f_a[k] - f_ab[k]) ** 2 / 2)
+
+    def report(self):
+        """
+        Estimate the indices from the complete samples so far
+
+        :return: DataFrame with a row per KPI and parameter
+        """
+        rows = []
+
+        for (kpi, param), first_order in self.first_order.items():
+            variance = self.variance[kpi].variance
+            total_effect = self.total_effect[(kpi, param)]
+
+            rows.append({
+                "KPI": kpi,
+                "parameter": param,
+                "samples": self.samples,
+                "S1": first_order.mean / variance if variance > 0 else np.nan,
+                "ST": total_effect.mean / variance if variance > 0 else np.nan,
+            })
+
+        return pd.DataFrame(rows)
@@ -0,0 +1,206 @@
+"""
+Shared memory for the read-only model inputs of a batch run
+
+The route matrices, risk grid and demand input are the same for every run in a batch. Instead of pickling them
+for every task, they are copied into multiprocessing.shared_memory blocks once. The parameters sent to the
+workers then only contain small handles, which the workers turn back into zero-copy NumPy views.
+
+multiprocessing.shared_memory requires Python 3.8, it is only imported when parameters are shared. On older
+versions the parameters are sent to the workers as they are.
+"""
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+# Shared memory blocks that have been attached in this process, by block name
+_attached_blocks = {}
+
+
+class SharedArray:
+    """Handle to a NumPy array that is stored in a shared memory block"""
+
+    def __init__(self, name, shape, dtype):
+
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def attach(self):
+        """
+        Create a read-only view on the shared array
+
+        :return: NumPy array
+        """
+        if self.name not in _attached_blocks:
+            from multiprocessing import shared_memory
+            _attached_blocks[self.name] = shared_memory.SharedMemory(name=self.name)
+
+        array = np.ndarray(self.shape, dtype=self.dtype, buffer=_attached_blocks[self.name].buf)
+        array.flags.writeable = False
+
+        return array
+
+
+class SharedDataFrame:
+    """Handle to a DataFrame of which the index and all columns are stored as shared arrays"""
+
+    def __init__(self, index_name, index, columns):
+
+        self.index_name = index_name
+        self.index = index                          # (shared array, categories)
+        self.columns = columns                      # list of (column name, shared array, categories)
+
+    def attach(self):
+        """
+        Rebuild the DataFrame from the shared arrays
+
+        :return: DataFrame
+        """
+        data = {column: _attach_values(array, categories) for column, array, categories in self.columns}
+
+        return pd.DataFrame(data, index=pd.Index(_attach_values(*self.index), name=self.index_name))
+
+
+def _share_array(array, blocks):
+    """
+    Copy an array into a new shared memory block
+
+    :param array: NumPy array
+    :param blocks: list to which the created block is added
+    :return: SharedArray handle
+    """
+    from multiprocessing import shared_memory
+
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    blocks.append(block)
+
+    shared_array = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    shared_array[...] = array
+
+    return SharedArray(block.name, array.shape, array.dtype)
+
+
+def _share_values(values, blocks):
+    """
+    Copy the values of a column or index into a new shared memory block
+
+    Text and other Python objects cannot be placed in shared memory, these are shared as category codes.
+
+    :param values: NumPy array
+    :param blocks: list to which the created block is added
+    :return: SharedArray handle, categories or None
+    """
+    if values.dtype != object:
+        return _share_array(values, blocks), None
+
+    codes, categories = pd.factorize(values)
+
+    # Missing values get code -1, which refers to the NaN at the end of the categories
+    categories = np.append(np.asarray(categories, dtype=object), np.nan)
+
+    return _share_array(codes, blocks), categories
+
+
+def _attach_values(array, categories):
+    """
+    Create the values of a column or index from its shared array
+
+    :param array: SharedArray handle
+    :param categories: categories of the codes in the array, or None when the array holds the values
+    :return: NumPy array
+    """
+    values = array.attach()
+
+    if categories is not None:
+        values = categories[values]
+
+    return values
+
+
+def _share_data_frame(data_frame, blocks):
+    """
+    Copy the index and columns of a DataFrame into shared memory blocks
+
+    :param data_frame: DataFrame
+    :param blocks: list to which the created blocks are added
+    :return: SharedDataFrame handle
+    """
+    columns = [(column, *_share_values(data_frame[column].to_numpy(), blocks)) for column in data_frame.columns]
+
+    return SharedDataFrame(data_frame.index.name, _share_values(data_frame.index.to_numpy(), blocks), columns)
+
+
+def share_parameters(parameters, blocks):
+    """
+    Replace all NumPy arrays and DataFrames within (nested) parameters by shared memory handles
+
+    :param parameters: model parameters, possibly containing nested dicts, lists and tuples
+    :param blocks: list to which the created blocks are added
+    :return: parameters with handles
+    """
+    if isinstance(parameters, np.ndarray) and parameters.dtype != object:
+        return _share_array(parameters, blocks)
+
+    elif isinstance(parameters, pd.DataFrame):
+        return _share_data_frame(parameters, blocks)
+
+    elif isinstance(parameters, dict):
+        return {key: share_parameters(value, blocks) for key, value in parameters.items()}
+
+    elif isinstance(parameters, (list, tuple)):
+        return type(parameters)(share_parameters(value, blocks) for value in parameters)
+
+    return parameters
+
+
+def attach_parameters(parameters):
+    """
+    Replace all shared memory handles within (nested) parameters by the arrays and DataFrames they refer to
+
+    :param parameters: model parameters with handles
+    :return: model parameters
+    """
+    if isinstance(parameters, (SharedArray, SharedDataFrame)):
+        return parameters.attach()
+
+    elif isinstance(parameters, dict):
+        return {key: attach_parameters(value) for key, value in parameters.items()}
+
+    elif isinstance(parameters, (list, tuple)):
+        return type(parameters)(attach_parameters(value) for value in parameters)
+
+    return parameters
+
+
+@contextmanager
+def shared_parameters(parameters, enabled=True):
+    """
+    Context in which the arrays within the parameters are placed in shared memory
+
+    The shared memory blocks are released when the context is left.
+
+    :param parameters: model parameters
+    :param enabled: if False, or shared memory is not available, the parameters are returned unchanged
+    :return: parameters with handles
+    """
+    if enabled:
+        try:
+            from multiprocessing import shared_memory
+        except ImportError:
+            print("Shared memory requires Python 3.8 or newer, the parameters are sent to every worker instead")
+            enabled = False
+
+    if not enabled:
+        yield parameters
+        return
+
+    blocks = []
+
+    try:
+        yield share_parameters(parameters, blocks)
+
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
@@ -0,0 +1,132 @@
+"""
+Variance reduction for replication sweeps
+
+Differences between scenarios are estimated with fewer runs when the scenarios are compared under the same
+circumstances. With common random numbers every scenario of a replication gets the same seed, so they see the
+same random streams. Stratified days spread the replications evenly over the days of the week, instead of
+drawing a random day for each. The paired differences between the scenarios are then estimated per
+replication.
+"""
+import numpy as np
+import pandas as pd
+
+from Batch_Run.run_manifest import make_run_id, make_run_seed
+
+DAYS_OF_WEEK = 7
+
+# z-value of a two-sided 95% confidence interval
+Z_95 = 1.96
+
+
+class VarianceReduction:
+    """Settings that determine the seed and day of the runs of a batch"""
+
+    def __init__(self, common_random_numbers=False, stratify_days=False):
+
+        self.common_random_numbers = common_random_numbers
+        self.stratify_days = stratify_days
+
+    def run_overrides(self, key, replication):
+        """
+        Model keyword arguments of a run that follow from the variance reduction settings
+
+        :param key: dict of variable parameters of the run
+        :param replication: replication number of the run
+        :return: dict of model keyword arguments
+        """
+        overrides = {}
+
+        # A seed that is swept is used as is. The runs of a base sample of a sampler, e.g. A_j, B_j and all AB_ij,
+        # share their random streams, so their differences are due to the parameters only
+        if "seed" not in key:
+            if self.common_random_numbers:
+                seed_key = {}
+            elif "sample" in key:
+                seed_key = {"sample": key["sample"]}
+            else:
+                seed_key = key
+            overrides["seed"] = make_run_seed(make_run_id(seed_key, replication))
+
+        if self.stratify_days:
+            overrides["day_of_week"] = (key.get("seed", 0) + replication) % DAYS_OF_WEEK + 1
+
+        return overrides
+
+    def pairing(self, key, replication):
+        """
+        Scenario of a run and the unit within which scenarios are paired
+
+        :param key: dict of variable parameters of the run
+        :param replication: replication number of the run
+        :return: scenario label, pairing unit
+        """
+        scenario = ", ".join(f"{param}={value}" for param, value in key.items() if param != "seed")
+
+        return scenario, (key.get("seed"), replication)
+
+
+class PairedDifferences:
+    """Estimates the difference of every scenario with a baseline scenario from paired replications"""
+
+    def __init__(self, baseline):
+
+        self.baseline = baseline
+        self.results = {}                               # scenario -> pairing unit -> list of KPI dicts
+
+    def add(self, scenario, unit, run_data):
+        """
+        Add the results of a run
+
+        :param scenario: scenario label
+        :param unit: pairing unit of the run
+        :param run_data: dict of model results
+        :return:
+        """
+        kpis = {var: value for var, value in run_data.items()
+                if isinstance(value, (int, float, np.number)) and not isinstance(value, bool)}
+
+        self.results.setdefault(scenario, {}).setdefault(unit, []).append(kpis)
+
+    def _unit_means(self, scenario):
+        """Average KPIs per pairing unit"""
+        return {unit: pd.DataFrame(runs).mean() for unit, runs in self.results.get(scenario, {}).items()}
+
+    def report(self):
+        """
+        Compute the paired differences of all scenarios with the baseline
+
+        :return: DataFrame with a row per scenario and KPI
+        """
+        rows = []
+        baseline = self._unit_means(self.baseline)
+
+        for scenario in self.results:
+            if scenario == self.baseline:
+                continue
+
+            variant = self._unit_means(scenario)
+            units = [unit for unit in variant if unit in baseline]
+
+            if len(units) < 2:
+                continue
+
+            variant_values = pd.DataFrame([variant[unit] for unit in units])
+            baseline_values = pd.DataFrame([baseline[unit] for unit in units])
+            differences = variant_values - baseline_values
+            n = len(units)
+
+            for kpi in differences.columns:
+                std_error = differences[kpi].std() / np.sqrt(n)
+                rows.append({
+                    "scenario": scenario,
+                    "baseline": self.baseline,
+                    "KPI": kpi,
+                    "pairs": n,
+                    "mean difference": differences[kpi].mean(),
+                    "std error": std_error,
+                    "CI half-width": Z_95 * std_error,
+                    # standard error if the scenarios had been replicated independently
+                    "independent std error": np.sqrt((variant_values[kpi].var() + baseline_values[kpi].var()) / n),
+                })
+
+        return pd.DataFrame(rows)
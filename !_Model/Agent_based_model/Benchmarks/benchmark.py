@@ -0,0 +1,285 @@
+"""
+Benchmark suite of the model on synthetic scenarios
+
+    python -m Benchmarks.benchmark --suite quick
+    python -m Benchmarks.benchmark --suite scaling --baseline Benchmarks/baseline.json
+    python -m Benchmarks.benchmark --suite scaling --save-baseline Benchmarks/baseline.json
+
+Run from the Agent_based_model directory. A suite varies the number of hospitals, drones, the grid size and the
+number of orders per minute one at a time, starting from a base case. The number of cars is not varied, as cars
+do not take part in the auctions. Every case is measured in its
+own process, so the peak memory of one case does not carry over to the next. Times are in seconds and memory
+in MB. The measurements are written to a JSON file in Results and, when a baseline is given, compared against
+it; the exit status is 1 when a metric regressed by more than the tolerance.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+from datetime import datetime
+from time import perf_counter
+
+import numpy as np
+
+from Benchmarks.synthetic_scenario import create_synthetic_inputs
+from scenario import load_scenario, create_input_params
+
+BASE_CASE = {
+    "num_hospitals": 25,
+    "num_drones": 3,
+    "grid_size": 400,
+    "orders_per_minute": 0.1,
+}
+
+# Values of the case parameters that are tried, one parameter at a time
+SUITES = {
+    "quick": {
+        "num_hospitals": [4, 25],
+        "orders_per_minute": [0.05, 0.1],
+    },
+    "scaling": {
+        "num_hospitals": [4, 25, 100, 250, 500],
+        "num_drones": [1, 3, 10, 20],
+        "grid_size": [200, 400, 800],
+        "orders_per_minute": [0.05, 0.1, 0.5, 1.0],
+    },
+}
+
+# Whether a higher or lower value of a metric is better
+METRICS = {
+    "construction time": "lower",
+    "steps per second": "higher",
+    "auction latency p50": "lower",
+    "auction latency p90": "lower",
+    "auction latency p99": "lower",
+    "peak RSS": "lower",
+    "batch runs per second": "higher",
+}
+
+
+def create_cases(suite):
+    """
+    Create the cases of a suite, the base case and every variation of a single parameter
+
+    :param suite: dict of values, by case parameter
+    :return: dict of cases, by case name
+    """
+    cases = {}
+
+    for param, values in [(None, [None])] + list(suite.items()):
+        for value in values:
+            case = dict(BASE_CASE)
+            if param is not None:
+                case[param] = value
+
+            name = "h{num_hospitals}_d{num_drones}_g{grid_size}_o{orders_per_minute}".format(**case)
+
+            # Drones are spawned at distinct hospitals
+            if case["num_drones"] > case["num_hospitals"]:
+                print(f"Skipping {name}, more drones than hospitals")
+                continue
+
+            cases[name] = case
+
+    return cases
+
+
+def _measure_case(case, scenario, batch_runs, nr_processes):
+    """
+    Measure a single case, in the current process
+
+    :param case: dict of case parameters
+    :param scenario: scenario dict of which the parameters are used
+    :param batch_runs: number of runs of the batch run throughput measurement, no batch run when 0
+    :param nr_processes: number of processes of the batch run
+    :return: dict of metrics
+    """
+    from base_model import BaseModel
+    from instrumentation import Instrumentation
+    from Batch_Run.CustomBatchrunner import batch_run
+
+    inputs = create_synthetic_inputs(case["num_hospitals"], case["grid_size"], case["orders_per_minute"])
+
+    params = dict(scenario["settings"])
+    params.update(create_input_params(scenario, inputs))
+    params.update({
+        "num_drones": case["num_drones"],
+        "visualization": False,
+        "matrix_cache_dir": None,
+    })
+    max_steps = scenario["run"]["max_steps"]
+    metrics = {}
+
+    start = perf_counter()
+    model = BaseModel(**params)
+    metrics["construction time"] = perf_counter() - start
+
+    # Only the auction is timed, so the steps per second are hardly affected
+    auction = "vectorized_auction" if model.vectorized_auction else "auction"
+    instrumentation = Instrumentation(sampled=["CommandCenter." + auction])
+    instrumentation.timed(model.command_center, auction)
+
+    start = perf_counter()
+    while model.running and model.schedule.steps <= max_steps:
+        model.step()
+    metrics["steps per second"] = model.schedule.steps / (perf_counter() - start)
+
+    latencies = instrumentation.samples["CommandCenter." + auction]
+    for percentile in (50, 90, 99):
+        metrics[f"auction latency p{percentile}"] = float(np.percentile(latencies, percentile)) if latencies else None
+    metrics["auctions"] = len(latencies)
+
+    # Peak memory of this process in MB, ru_maxrss is in kB on Linux
+    metrics["peak RSS"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    metrics["batch runs per second"] = None
+    if batch_runs > 0:
+        fixed_params = {param: value for param, value in params.items() if param != "seed"}
+        run_name = f"benchmark_{os.getpid()}"
+
+        start = perf_counter()
+        batch_run(BaseModel, {"seed": range(batch_runs)}, fixed_params, nr_processes=nr_processes,
+                  max_steps=max_steps, display_progress=False, share_memory=True, run_name=run_name)
+        metrics["batch runs per second"] = batch_runs / (perf_counter() - start)
+
+        for extension in (".csv", ".manifest"):
+            os.remove(f"Results/{run_name}{extension}")
+
+    return metrics
+
+
+def _case_process(connection, case, scenario, batch_runs, nr_processes):
+    """Measure a case in a child process and send the metrics, or the error, back"""
+    try:
+        connection.send(_measure_case(case, scenario, batch_runs, nr_processes))
+    except Exception as error:
+        connection.send(error)
+
+    connection.close()
+
+
+def run_case(case, scenario, batch_runs, nr_processes):
+    """
+    Measure a case in a fresh process
+
+    :return: dict of metrics
+    """
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_case_process, args=(sender, case, scenario, batch_runs, nr_processes))
+    process.start()
+    sender.close()
+
+    result = receiver.recv()
+    process.join()
+
+    if isinstance(result, Exception):
+        raise result
+
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare measurements with a baseline
+
+    :param results: benchmark results
+    :param baseline: benchmark results of the baseline
+    :param tolerance: relative change of a metric that is not yet a regression
+    :return: list of comparison dicts, list of regressed (case, metric)
+    """
+    comparisons = []
+    regressions = []
+    baseline_cases = {case["name"]: case["metrics"] for case in baseline["cases"]}
+
+    for case in results["cases"]:
+        if case["name"] not in baseline_cases:
+            continue
+
+        for metric, direction in METRICS.items():
+            value = case["metrics"].get(metric)
+            base = baseline_cases[case["name"]].get(metric)
+
+            if value is None or base is None or base == 0:
+                continue
+
+            change = value / base - 1
+            regressed = change > tolerance if direction == "lower" else change < -tolerance
+
+            comparisons.append({"case": case["name"], "metric": metric, "baseline": base, "value": value,
+                                "change": change, "regressed": regressed})
+            if regressed:
+                regressions.append((case["name"], metric))
+
+    return comparisons, regressions
+
+
+def main(args=None):
+    """
+    Parse the command line arguments, run the suite and compare it with the baseline
+
+    :param args: list of command line arguments, sys.argv is used when None
+    :return: exit status
+    """
+    parser = argparse.ArgumentParser(prog="benchmark", description="Benchmark the model on synthetic scenarios")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick")
+    parser.add_argument("--scenario", default="Scenarios/default.json",
+                        help="scenario of which the model, drone, car and run parameters are used")
+    parser.add_argument("--batch-runs", type=int, default=8, help="runs of the batch run throughput measurement")
+    parser.add_argument("--nr-processes", type=int, default=None, help="processes of the batch run, all when omitted")
+    parser.add_argument("--output", default=None, help="results file, Results/benchmark_<time>.json when omitted")
+    parser.add_argument("--baseline", default=None, help="results file to compare with")
+    parser.add_argument("--save-baseline", default=None, help="also write the results to this file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change that is not a regression")
+    args = parser.parse_args(args)
+
+    scenario = load_scenario(args.scenario)
+    nr_processes = args.nr_processes or multiprocessing.cpu_count()
+
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "suite": args.suite,
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "processors": multiprocessing.cpu_count(),
+        },
+        "batch runs": args.batch_runs,
+        "batch processes": nr_processes,
+        "cases": [],
+    }
+
+    for name, case in create_cases(SUITES[args.suite]).items():
+        print(f"Benchmarking {name}")
+        metrics = run_case(case, scenario, args.batch_runs, nr_processes)
+        results["cases"].append({"name": name, "case": case, "metrics": metrics})
+        print("    " + ", ".join(f"{metric}: {value:.4g}" for metric, value in metrics.items() if value is not None))
+
+    output = args.output or datetime.now().strftime("Results/benchmark_%d_%m_%H_%M.json")
+    for file_name in filter(None, [output, args.save_baseline]):
+        with open(file_name, "w") as f:
+            json.dump(results, f, indent=4)
+    print(f"Results written to {output}")
+
+    if args.baseline is None:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    comparisons, regressions = compare(results, baseline, args.tolerance)
+    for comparison in comparisons:
+        flag = "REGRESSED" if comparison["regressed"] else ""
+        print(f"{comparison['case']:<36} {comparison['metric']:<24} {comparison['baseline']:>12.4g} "
+              f"{comparison['value']:>12.4g} {comparison['change']:>+8.1%} {flag}")
+
+    print(f"{len(regressions)} regressions")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
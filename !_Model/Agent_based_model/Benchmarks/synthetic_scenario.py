@@ -0,0 +1,201 @@
+"""
+Synthetic model inputs of arbitrary size
+
+Creates the same inputs as the pre-processing modules (see scenario.load_inputs): hospital locations, a risk
+grid, drone and car route matrices and a demand schedule, so the model can be benchmarked on far more hospitals
+and orders than the test set contains. Routes are not searched on the grid: direct routes are straight lines and
+risk-minimised routes are a random detour over low-risk cells, which gives matrices of the right size and scale.
+"""
+import numpy as np
+import pandas as pd
+
+CELL_SIZE = 100                                         # meters per grid cell
+BASE_RISK = 4.62e-7                                     # risk of a cell without population
+LINE_SAMPLES = 16                                       # number of cells of which the risk of a direct route is sampled
+CAR_SPEED = 50                                          # km/h, without traffic
+DAYS_OF_WEEK = 7
+HOURS_PER_DAY = 24
+REQUEST_TYPES = ["urgent", "semi-urgent", "same-day"]
+REQUEST_TYPE_SHARES = [0.2, 0.3, 0.5]
+
+
+def create_risk_grid(grid_size, rng):
+    """
+    Risk grid with a low background risk and a number of urban areas of higher risk
+
+    :param grid_size: number of cells of each side of the grid
+    :param rng: numpy Generator
+    :return: (grid_size, grid_size) array
+    """
+    rows, cols = np.mgrid[0:grid_size, 0:grid_size]
+    grid = np.full((grid_size, grid_size), BASE_RISK)
+
+    for _ in range(max(1, grid_size // 100)):
+        center_row, center_col = rng.uniform(0, grid_size, 2)
+        radius = rng.uniform(0.02, 0.08) * grid_size
+        peak = rng.uniform(1e-5, 9e-4)
+        grid += peak * np.exp(-((rows - center_row) ** 2 + (cols - center_col) ** 2) / (2 * radius ** 2))
+
+    return grid
+
+
+def create_client_params(num_hospitals, grid_size, rng):
+    """
+    Hospitals on distinct random cells of the grid
+
+    :param num_hospitals: number of hospitals
+    :param grid_size: number of cells of each side of the grid
+    :param rng: numpy Generator
+    :return: list of [(row, col), beds, name]
+    """
+    cells = rng.choice(grid_size * grid_size, num_hospitals, replace=False)
+
+    return [[(int(cell // grid_size), int(cell % grid_size)), int(rng.integers(50, 1000)), f"Hospital {i}"]
+            for i, cell in enumerate(cells)]
+
+
+def _symmetric(rng, n, low, high):
+    """Random symmetric matrix with values between low and high"""
+    values = rng.uniform(low, high, (n, n))
+
+    return np.triu(values) + np.triu(values, 1).T
+
+
+def create_drone_matrices(client_params, grid, rng):
+    """
+    Distance and risk matrices of the risk-minimised and direct drone routes
+
+    :param client_params: list of [(row, col), beds, name]
+    :param grid: risk grid
+    :param rng: numpy Generator
+    :return: distances, risks, direct distances, direct risks
+    """
+    positions = np.array([client[0] for client in client_params], dtype=float)
+    n = len(positions)
+    steps = np.linspace(0, 1, LINE_SAMPLES)
+
+    direct_distances = np.linalg.norm(positions[:, None, :] - positions[None, :, :], axis=2) * CELL_SIZE
+    direct_risks = np.zeros((n, n))
+
+    # The risk of a direct route is the average risk of the cells on the line, times the number of cells
+    for i in range(n):
+        line = positions[i] + steps[None, :, None] * (positions[:, None, :] - positions[i])
+        cells = np.rint(line).astype(int)
+        direct_risks[i] = grid[cells[..., 0], cells[..., 1]].mean(axis=1) * direct_distances[i] / CELL_SIZE
+
+    distances = direct_distances * _symmetric(rng, n, 1.05, 1.3)
+    risks = distances / CELL_SIZE * BASE_RISK * _symmetric(rng, n, 1, 2)
+    np.fill_diagonal(risks, 0)
+
+    return distances, risks, direct_distances, direct_risks
+
+
+def traffic_factor(day, hour):
+    """Factor with which car travel times increase by traffic"""
+    if hour < 6:
+        return 0.9
+
+    if day <= 5 and hour in (7, 8, 16, 17):
+        return 1.3
+
+    return 1.0
+
+
+def create_car_matrices(client_params, direct_distances, rng):
+    """
+    Car distance and time matrices per day of week and hour
+
+    Days and hours with the same traffic share their matrices, so large networks fit in memory.
+
+    :param client_params: list of [(row, col), beds, name]
+    :param direct_distances: matrix of straight line distances in meters
+    :param rng: numpy Generator
+    :return: distances (km) and times (seconds), indexed as [day][hour]
+    """
+    n = len(client_params)
+    road_distances = direct_distances / 1000 * rng.uniform(1.2, 1.5, (n, n))
+    np.fill_diagonal(road_distances, 0)
+    free_flow_times = road_distances / CAR_SPEED * 3600
+
+    times_by_factor = {}
+    distances, times = {}, {}
+
+    for day in range(1, DAYS_OF_WEEK + 1):
+        distances[day], times[day] = {}, {}
+
+        for hour in range(HOURS_PER_DAY):
+            factor = traffic_factor(day, hour)
+            if factor not in times_by_factor:
+                times_by_factor[factor] = np.round(free_flow_times * factor)
+
+            distances[day][hour] = road_distances
+            times[day][hour] = times_by_factor[factor]
+
+    return distances, times
+
+
+def create_demand(client_params, orders_per_minute, max_steps, rng):
+    """
+    Demand schedule with Poisson arrivals between random pairs of hospitals
+
+    :param client_params: list of [(row, col), beds, name]
+    :param orders_per_minute: average number of orders per minute, over all hospitals
+    :param max_steps: number of minutes in which orders arrive
+    :param rng: numpy Generator
+    :return: DataFrame of requests, indexed by start time
+    """
+    n = len(client_params)
+    names = np.array([client[2] for client in client_params], dtype=object)
+
+    starts = np.repeat(np.arange(max_steps), rng.poisson(orders_per_minute, max_steps))
+    origins = rng.integers(n, size=len(starts))
+    destinations = (origins + rng.integers(1, n, size=len(starts))) % n
+    types = rng.choice(REQUEST_TYPES, size=len(starts), p=REQUEST_TYPE_SHARES)
+
+    deadlines = np.where(types == "urgent", starts + 60,
+                         np.where(types == "semi-urgent", starts + rng.integers(120, 200, size=len(starts)),
+                                  np.maximum(1440, starts + 240)))
+
+    request_list = pd.DataFrame({
+        "start": starts,
+        "id": np.arange(len(starts)),
+        "origin": names[origins],
+        "destination": names[destinations],
+        "deadline": deadlines,
+        "type": types,
+        "volume": 10,
+        "mass": 20,
+    })
+
+    return request_list.set_index('start', drop=True)
+
+
+def create_synthetic_inputs(num_hospitals=4, grid_size=400, orders_per_minute=0.05, max_steps=1440, seed=0):
+    """
+    Create all inputs of a synthetic scenario
+
+    :param num_hospitals: number of hospitals
+    :param grid_size: number of cells of each side of the grid
+    :param orders_per_minute: average number of orders per minute, over all hospitals
+    :param max_steps: number of minutes in which orders arrive
+    :param seed: seed of the scenario
+    :return: dict of inputs, as returned by scenario.load_inputs
+    """
+    rng = np.random.default_rng(seed)
+
+    grid = create_risk_grid(grid_size, rng)
+    client_params = create_client_params(num_hospitals, grid_size, rng)
+    distances, risks, direct_distances, direct_risks = create_drone_matrices(client_params, grid, rng)
+    car_distances, car_times = create_car_matrices(client_params, direct_distances, rng)
+
+    return {
+        "client_params": client_params,
+        "drone_distances": distances,
+        "drone_risk": risks,
+        "grid": grid,
+        "direct_drone_distances": direct_distances,
+        "direct_drone_risks": direct_risks,
+        "car_distances": car_distances,
+        "car_times": car_times,
+        "request_list": create_demand(client_params, orders_per_minute, max_steps, rng),
+    }
@@ -7,6 +7,7 @@ Objects used to add a spatial component to a model.
 Grid: base grid, a simple list-of-lists.
 SingleGrid: grid which strictly enforces one object per cell.
 MultiGrid: extension to Grid where each cell is a set of objects.
+SparseMultiGrid: MultiGrid that only stores the occupied cells.
 
 """
 # Instruction for PyLint to suppress variable name errors, since we have a
@@ -578,6 +579,146 @@ class MultiGrid(Grid):
         )
 
 
+class SparseMultiGrid(MultiGrid):
+    """MultiGrid that only stores the cells that contain agents.
+
+    Behaves like MultiGrid, but instead of a width x height list-of-lists
+    the occupied cells are kept in a dict keyed on (x, y). Constructing it
+    does not depend on the size of the grid, which matters for large grids
+    with only a few agents. The set of empty cells is only built when asked
+    for.
+
+    Properties:
+        width, height: The grid's width and height.
+
+        torus: Boolean which determines whether to treat the grid as a torus.
+
+        cells: Internal dict which holds the occupied grid cells.
+    """
+
+    def __init__(self, width: int, height: int, torus: bool) -> None:
+        """Create a new sparse multi-item grid.
+
+        Args:
+            width, height: The width and height of the grid
+            torus: Boolean whether the grid wraps or not.
+
+        """
+        self.height = height
+        self.width = width
+        self.torus = torus
+
+        self.cells: Dict[Coordinate, List[Agent]] = dict()
+
+        # Neighborhood Cache
+        self._neighborhood_cache: Dict[Any, List[Coordinate]] = dict()
+
+    @property
+    def empties(self) -> Set[Coordinate]:
+        """Set of all cells that contain no agents, computed on access."""
+        return {
+            pos
+            for pos in itertools.product(range(self.width), range(self.height))
+            if pos not in self.cells
+        }
+
+    def _cell(self, pos: Coordinate) -> List[Agent]:
+        """Contents of a single cell, an empty list if it is not occupied."""
+        return self.cells.get(pos, self.default_val())
+
+    def __getitem__(
+        self,
+        index: Union[
+            int,
+            Sequence[Coordinate],
+            Tuple[Union[int, slice], Union[int, slice]],
+        ],
+    ) -> Union[GridContent, List[GridContent]]:
+        """Access contents from the grid."""
+
+        if isinstance(index, int):
+            # grid[x]
+            x, _ = self.torus_adj((index, 0))
+            return [self._cell((x, y)) for y in range(self.height)]
+
+        if isinstance(index[0], tuple):
+            # grid[(x1, y1), (x2, y2)]
+            index = cast(Sequence[Coordinate], index)
+            return [self._cell(self.torus_adj(pos)) for pos in index]
+
+        x, y = index
+
+        if isinstance(x, int) and isinstance(y, int):
+            # grid[x, y]
+            return self._cell(self.torus_adj(cast(Coordinate, index)))
+
+        if isinstance(x, int):
+            # grid[x, :]
+            x, _ = self.torus_adj((x, 0))
+            x = slice(x, x + 1)
+
+        if isinstance(y, int):
+            # grid[:, y]
+            _, y = self.torus_adj((0, y))
+            y = slice(y, y + 1)
+
+        # grid[:, :]
+        x, y = (cast(slice, x), cast(slice, y))
+        return [
+            self._cell((row, col))
+            for row in range(self.width)[x]
+            for col in range(self.height)[y]
+        ]
+
+    def __iter__(self) -> Iterator[GridContent]:
+        """Iterate over the contents of all cells, row by row."""
+        for cell, _, _ in self.coord_iter():
+            yield cell
+
+    def coord_iter(self) -> Iterator[Tuple[GridContent, int, int]]:
+        """An iterator that returns coordinates as well as cell contents."""
+        for row in range(self.width):
+            for col in range(self.height):
+                yield self._cell((row, col)), row, col  # agent, x, y
+
+    def _place_agent(self, pos: Coordinate, agent: Agent) -> None:
+        """Place the agent at the correct location."""
+        cell = self.cells.setdefault(pos, self.default_val())
+        if agent not in cell:
+            cell.append(agent)
+
+    def _remove_agent(self, pos: Coordinate, agent: Agent) -> None:
+        """Remove the agent from the given location."""
+        cell = self.cells[pos]
+        cell.remove(agent)
+        if not cell:
+            del self.cells[pos]
+
+    def is_cell_empty(self, pos: Coordinate) -> bool:
+        """Returns a bool of the contents of a cell."""
+        return pos not in self.cells
+
+    def exists_empty_cells(self) -> bool:
+        """Return True if any cells empty else False."""
+        return len(self.cells) < self.width * self.height
+
+    @accept_tuple_argument
+    def iter_cell_list_contents(
+        self, cell_list: Iterable[Coordinate]
+    ) -> Iterator[GridContent]:
+        """
+        Args:
+            cell_list: Array-like of (x, y) tuples, or single tuple.
+
+        Returns:
+            A iterator of the contents of the cells identified in cell_list
+
+        """
+        return itertools.chain.from_iterable(
+            self.cells[pos] for pos in map(tuple, cell_list) if pos in self.cells
+        )
+
+
 class HexGrid(Grid):
     """Hexagonal Grid: Extends Grid to handle hexagonal neighbors.
 
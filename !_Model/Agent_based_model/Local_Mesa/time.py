@@ -21,6 +21,7 @@ Key concepts:
     model has taken.
 """
 
+import heapq
 from collections import OrderedDict
 
 # mypy
@@ -85,6 +86,14 @@ class BaseScheduler:
         self.steps += 1
         self.time += 1
 
+    def wake(self, agent: Agent) -> None:
+        """Notify the scheduler that the next activation of an agent may have
+        changed because of another agent. Schedulers that activate every agent
+        every step do not need to do anything.
+
+        """
+        pass
+
     def get_agent_count(self) -> int:
         """Returns the current number of agents in the queue."""
         return len(self._agents.keys())
@@ -200,3 +209,151 @@ class StagedActivation(BaseScheduler):
             self.time += self.stage_time
 
         self.steps += 1
+
+
+class EventActivation(BaseScheduler):
+    """A scheduler which only activates an agent in the steps in which
+    something happens to it, and jumps over all steps in between.
+
+    This scheduler requires that each agent have two methods:
+    next_event_time(time) returns the first step >= time in which the agent
+    has to be activated, or None if nothing is planned. skip_steps(steps)
+    processes a number of steps in which the agent was not activated, e.g. to
+    keep track of time spent in its current state. When an agent changes the
+    next activation of another agent, that agent is passed to wake().
+
+    The events are kept in a priority queue, so the model can ask for the
+    next step in which something happens with next_event_time().
+
+    With equivalent=True the agents that are activated in a step are activated
+    in the same random order as RandomActivation would, and the random number
+    generator of the model is advanced as if every step was executed. The
+    outcome is then identical to activating every agent every step.
+
+    """
+
+    def __init__(self, model: Model, equivalent: bool = False) -> None:
+        """Create a new, empty EventActivation scheduler.
+
+        Args:
+            model: Model object associated with the schedule.
+            equivalent: If True, reproduce the activation order and random
+                        number generator state of RandomActivation.
+
+        """
+        super().__init__(model)
+        self.equivalent = equivalent
+        self._events: List = []                     # priority queue of (step, agent key)
+        self._next_event: Dict[int, Optional[int]] = {}
+        self._last_step: Dict[int, int] = {}        # last step in which the agent was processed
+        self._woken: set = set()                    # agents of which the next event has to be determined
+        self._turn_passed: set = set()              # agents whose turn in the current step has passed
+        self._shuffled_steps = 0                    # steps of which the RandomActivation shuffle was reproduced
+
+    def add(self, agent: Agent) -> None:
+        """Add an Agent object to the schedule. Its first activation is
+        determined at the start of the next step.
+
+        """
+        super().add(agent)
+        self._last_step[agent.unique_id] = self.model.time - 1
+        self._woken.add(agent.unique_id)
+
+    def remove(self, agent: Agent) -> None:
+        """Remove all instances of a given agent from the schedule."""
+        super().remove(agent)
+        del self._last_step[agent.unique_id]
+        self._next_event.pop(agent.unique_id, None)
+        self._woken.discard(agent.unique_id)
+
+    def wake(self, agent: Agent) -> None:
+        """Determine the next activation of an agent again."""
+        self._woken.add(agent.unique_id)
+
+    def next_event_time(self, time: int, horizon: Optional[int] = None) -> int:
+        """Returns the first step >= time in which an agent has to be
+        activated. If time is before horizon, horizon is returned when nothing
+        happens before it. If nothing is planned at all, time is returned.
+
+        """
+        self._update_events(time)
+
+        while self._events and self._next_event.get(self._events[0][1]) != self._events[0][0]:
+            heapq.heappop(self._events)
+
+        candidates = [self._events[0][0]] if self._events else []
+        if horizon is not None and time < horizon:
+            candidates.append(horizon)
+
+        return max(time, min(candidates)) if candidates else time
+
+    def step(self) -> None:
+        """Activate the agents that have an event in the current model step."""
+        time = self.model.time
+        self._update_events(time)
+
+        if self.equivalent:
+            agent_keys = list(self._agents.keys())
+
+            # Reproduce the shuffles RandomActivation would have made in the skipped steps
+            for _ in range(self._shuffled_steps, time):
+                self.model.random.shuffle(list(agent_keys))
+            self.model.random.shuffle(agent_keys)
+            self._shuffled_steps = time + 1
+
+            for key in agent_keys:
+                self._turn_passed.add(key)
+                if key in self._agents and self._next_event.get(key) == time:
+                    self._activate(key, time)
+            self._turn_passed.clear()
+
+        else:
+            while self._events and self._events[0][0] <= time:
+                event_time, key = heapq.heappop(self._events)
+                if (
+                    key in self._agents
+                    and self._next_event.get(key) == event_time
+                    and self._last_step[key] < time
+                ):
+                    self._activate(key, time)
+
+        self.steps = time + 1
+        self.time = time + 1
+
+    def skip_to(self, time: int) -> None:
+        """Process all steps before time in which agents were not activated."""
+        for key, agent in self._agents.items():
+            skipped = time - self._last_step[key] - 1
+            if skipped > 0:
+                agent.skip_steps(skipped)
+                self._last_step[key] = time - 1
+
+    def _activate(self, key: int, time: int) -> None:
+        """Activate a single agent and determine its next event."""
+        agent = self._agents[key]
+        skipped = time - self._last_step[key] - 1
+        if skipped > 0:
+            agent.skip_steps(skipped)
+
+        agent.step()
+        self._last_step[key] = time
+        self._woken.add(key)
+        self._update_events(time)
+
+    def _update_events(self, time: int) -> None:
+        """Determine the next event of all woken agents."""
+        while self._woken:
+            key = self._woken.pop()
+            if key not in self._agents:
+                continue
+
+            # An agent that was already activated, or whose turn has passed, can only be activated in the next step
+            if self._last_step[key] >= time or key in self._turn_passed:
+                earliest = time + 1
+            else:
+                earliest = time
+            event_time = self._agents[key].next_event_time(earliest)
+            self._next_event[key] = event_time
+
+            if event_time is not None:
+                heapq.heappush(self._events, (event_time, key))
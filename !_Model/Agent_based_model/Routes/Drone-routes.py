@@ -18,6 +18,7 @@ from PIL import Image, ImageFilter
 import pickle
 import datetime, time
 import os
+from multiprocessing import Pool, cpu_count
 
 # --- Helper functions for code at bottom (line 274)
 
@@ -264,16 +265,20 @@ def create_grid_matrix(riskmap, hospitals, min_risk):
     return grid, hospital_grid, hospital_list, hospital_coordinate_list, hospital_lon_lat
 
 
-def find_routes(grid, hospital_list, hospital_coordinate_list, drone_speed, drone_range):
+def find_routes(grid, hospital_list, hospital_coordinate_list, drone_speed, drone_range, keep_regions=False):
     """
     Function that finds the optimal routes
 
+    The routes from every hospital are returned as a RouteTree, of which route j is expanded to grid cells with
+    routes[i].expand(j).
+
     :param grid:
     :param hospital_list:
     :param hospital_coordinate_list:
     :param drone_speed:
     :param drone_range:
-    :return:
+    :param keep_regions: keep the search regions in the route trees, so the routes can be updated with update_routes
+    :return: distance and risk matrices and a list of RouteTrees, of the risk optimal and of the direct routes
     """
     graph = GridGraph(grid, drone_speed)
     n = len(hospital_list)
@@ -281,43 +286,138 @@ def find_routes(grid, hospital_list, hospital_coordinate_list, drone_speed, dron
     # Initialise matrices
     distance_matrix = np.zeros((n, n))
     risk_matrix = np.zeros((n, n))
-    routes_matrix = np.zeros((n, n), dtype=object)
+    routes_matrix = [None] * n
     
     for i, hospital in enumerate(hospital_list):
         print("Start searching risk optimal routes for from "+ str(hospital['Name']))
-        routes, distances, risks = graph.a_star(hospital_coordinate_list[i], hospital_coordinate_list[:], drone_range, 1)
-    
-        for j in range(n):
-
-            if risk_matrix[i, j] == 0 or risk_matrix[i, j] > risks[j]:
-    
-                distance_matrix[i, j] = distances[j]
-                risk_matrix[i, j] = risks[j]
-                routes_matrix[i, j] = routes[j]
+        routes_matrix[i], distance_matrix[i], risk_matrix[i] = graph.route_tree(hospital_coordinate_list[i],
+                                                                                hospital_coordinate_list[:],
+                                                                                drone_range, 1,
+                                                                                keep_regions=keep_regions)
 
     direct_distance_matrix = np.zeros((n, n))
     direct_risk_matrix = np.zeros((n, n))
-    direct_routes_matrix = np.zeros((n, n), dtype=object)
+    direct_routes_matrix = [None] * n
 
     for i, hospital in enumerate(hospital_list):
         print("Start searching direct routes  for from "+str(hospital['Name']))
-        routes, distances, risks = graph.a_star(hospital_coordinate_list[i], hospital_coordinate_list[:], drone_range,0)
-    
-        for j in range(n):
-            if direct_risk_matrix[i, j] == 0 or direct_risk_matrix[i, j] > risks[j]:
-    
-                direct_distance_matrix[i, j] = distances[j]
-                direct_risk_matrix[i, j] = risks[j]
-                direct_routes_matrix[i, j] = routes[j]
+        direct_routes_matrix[i], direct_distance_matrix[i], direct_risk_matrix[i] = \
+            graph.route_tree(hospital_coordinate_list[i], hospital_coordinate_list[:], drone_range, 0,
+                             keep_regions=keep_regions)
 
     return distance_matrix, risk_matrix, routes_matrix, direct_distance_matrix, direct_risk_matrix, direct_routes_matrix
 
+def find_routes_parallel(grid, hospital_list, hospital_coordinate_list, drone_speed, drone_range, nr_processes=None,
+                         keep_regions=False):
+    """
+    Function that finds the optimal routes like find_routes, with the searches divided over a pool of processes
+
+    The graph is built once and its arrays are placed in shared memory, to which all processes attach. Every
+    origin and route type (risk optimal or direct) is a separate task.
+
+    :param grid:
+    :param hospital_list:
+    :param hospital_coordinate_list:
+    :param drone_speed:
+    :param drone_range:
+    :param nr_processes: number of processes, all processors when None
+    :param keep_regions: keep the search regions in the route trees, so the routes can be updated with update_routes
+    :return: distance and risk matrices and a list of RouteTrees, of the risk optimal and of the direct routes
+    """
+    graph = GridGraph(grid, drone_speed)
+    n = len(hospital_list)
+
+    if nr_processes is None:
+        nr_processes = cpu_count()
+
+    # Initialise matrices, by risk weight: 1 for the risk optimal routes and 0 for the direct routes
+    matrices = {}
+    for risk_weight in (1, 0):
+        matrices[risk_weight] = (np.zeros((n, n)), np.zeros((n, n)), [None] * n)
+
+    tasks = [(i, risk_weight) for risk_weight in matrices for i in range(n)]
+
+    with SharedGridGraph(graph) as shared_graph, \
+            Pool(nr_processes, initializer=initialise_route_worker,
+                 initargs=(shared_graph.handles, shared_graph.attributes, hospital_coordinate_list, drone_range,
+                           keep_regions)) as p:
+
+        for i, risk_weight, routes, distances, risks in p.imap_unordered(route_task, tasks):
+            print("Found " + ("risk optimal" if risk_weight == 1 else "direct") + " routes from "
+                  + str(hospital_list[i]['Name']))
+
+            distance_matrix, risk_matrix, routes_matrix = matrices[risk_weight]
+            distance_matrix[i] = distances
+            risk_matrix[i] = risks
+            routes_matrix[i] = routes
+
+    return matrices[1] + matrices[0]
+
+def update_routes(grid, changed_cells, hospital_list, hospital_coordinate_list, drone_speed, drone_range,
+                  previous_routes):
+    """
+    Function that updates the routes after the risk of some cells of the grid changed, e.g. by a new no-fly zone
+
+    Only the routes of which the search region contains a changed cell are searched again, the other routes and
+    their distances and risks are reused. The previous routes must have been found with keep_regions=True, which
+    the exported routes are when keep_search_regions is set (see load_routes). The changed cells of two grids are
+    found with np.argwhere(new_grid != old_grid).
+
+    :param grid: the changed grid
+    :param changed_cells: list of (row, column) of the cells of which the risk changed
+    :param hospital_list:
+    :param hospital_coordinate_list:
+    :param drone_speed:
+    :param drone_range:
+    :param previous_routes: output of find_routes or find_routes_parallel on the previous grid
+    :return: updated output of find_routes, and boolean matrices of the pairs of which the distance or risk
+             changed, of the risk optimal and of the direct routes
+    """
+    if any(routes.regions is None for routes in list(previous_routes[2]) + list(previous_routes[5])):
+        raise ValueError("The previous routes have no search regions, find them with keep_regions=True "
+                         "(keep_search_regions = True for the exported routes)")
+
+    graph = GridGraph(grid, drone_speed)
+    n = len(hospital_list)
+    changed_cells = [graph.index(cell) for cell in changed_cells]
+
+    updated_routes = ()
+    changed_pairs = []
+
+    for risk_weight, previous in ((1, previous_routes[:3]), (0, previous_routes[3:])):
+        distance_matrix, risk_matrix = previous[0].copy(), previous[1].copy()
+        routes_matrix = list(previous[2])
+        changed = np.zeros((n, n), dtype=bool)
+
+        for i, hospital in enumerate(hospital_list):
+            destinations = np.flatnonzero(routes_matrix[i].regions.affected(changed_cells, n))
+            if len(destinations) == 0:
+                continue
+
+            print("Updating " + str(len(destinations)) + (" risk optimal" if risk_weight == 1 else " direct")
+                  + " routes from " + str(hospital['Name']))
+            routes, distances, risks = graph.route_tree(hospital_coordinate_list[i], hospital_coordinate_list[:],
+                                                        drone_range, risk_weight, destinations, keep_regions=True)
+            routes_matrix[i] = routes_matrix[i].replace(destinations, routes)
+
+            distances = np.array(distances)[destinations]
+            risks = np.array(risks)[destinations]
+            changed[i, destinations] = (distance_matrix[i, destinations] != distances) | \
+                                       (risk_matrix[i, destinations] != risks)
+            distance_matrix[i, destinations] = distances
+            risk_matrix[i, destinations] = risks
+
+        updated_routes += (distance_matrix, risk_matrix, routes_matrix)
+        changed_pairs.append(changed)
+
+    return updated_routes, changed_pairs[0], changed_pairs[1]
+
 def plot_drone_routes(grid, drone_routes, drone_distances, drone_risks, pic_name):
     """
     Plots the constructed routes
 
     :param grid:
-    :param drone_routes:
+    :param drone_routes: list of RouteTrees, by origin
     :param drone_distances:
     :param drone_risks:
     :param pic_name:
@@ -328,7 +428,7 @@ def plot_drone_routes(grid, drone_routes, drone_distances, drone_risks, pic_name
     plt.figure(figsize=(15, 15))
     plt.imshow(grid, cmap='Greys', norm=matplotlib.colors.LogNorm())
     
-    n, m = drone_routes.shape
+    n, m = drone_distances.shape
     
     for i in range(n):
 
@@ -336,16 +436,16 @@ def plot_drone_routes(grid, drone_routes, drone_distances, drone_risks, pic_name
 
             if drone_distances[j,i] != float('inf') and drone_distances[i,j] != float('inf'):
 
+                # Obtain entire route, as arrays of rows and columns
+                y_val, x_val = drone_routes[i].expand(j)
+
                 # Check if other route is safer
                 if (drone_risks[i, j] - drone_risks[j, i]) >= 1:
                     print('Other route is faster')
                     drone_distances[i, j] = drone_distances[j, i]
                     drone_risks[i, j] = drone_risks[j, i]
-                    drone_routes[i, j] = drone_routes[j, i]
+                    y_val, x_val = drone_routes[j].expand(i)
 
-                # Obtain entire route
-                x_val = [x.location[1] for x in drone_routes[i,j]]
-                y_val = [x.location[0] for x in drone_routes[i,j]]
                 plt.plot(x_val,y_val, color=cm(1.*i/n),  linewidth=2)
 
     # Plot the hosptials
@@ -391,6 +491,39 @@ def export_matrices(drone_distances, drone_risk, hospital_list, direct_drone_dis
         pickle.dump([hospital_input, drone_distances, drone_risk, grid, direct_drone_distances, direct_drone_risks], f)
 
 
+def export_routes(drone_routes, direct_drone_routes):
+    """
+    Exports the routes, as RouteTrees by origin hospital, including their search regions when these were kept
+
+    :param drone_routes:
+    :param direct_drone_routes:
+    :return:
+    """
+    doc_name = str("DroneRoutes.pkl")
+
+    with open(doc_name, 'wb') as f:
+        pickle.dump({"routes": drone_routes, "direct routes": direct_drone_routes}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_routes(matrices_file="DroneRoutesMatrices.pkl", routes_file="DroneRoutes.pkl"):
+    """
+    Loads the exported matrices and routes, in the form in which update_routes takes the previous routes
+
+    :param matrices_file: file written by export_matrices
+    :param routes_file: file written by export_routes
+    :return: grid, and the distance and risk matrices and RouteTrees as returned by find_routes
+    """
+    with open(matrices_file, 'rb') as f:
+        hospital_input, drone_distances, drone_risk, grid, direct_drone_distances, direct_drone_risks = pickle.load(f)
+
+    with open(routes_file, 'rb') as f:
+        routes = pickle.load(f)
+
+    return grid, (drone_distances, drone_risk, routes["routes"],
+                  direct_drone_distances, direct_drone_risks, routes["direct routes"])
+
+
 # --- Input parameters for route determination
 
 # No-fly zones - unused
@@ -428,25 +561,32 @@ drone_flight_time = drone_range / drone_speed       # h
 # Test set
 test = True                                         # indicates if this is for a test hospital set
 
-# --- Code to run
+# Keep the search regions in the exported routes, so they can be updated with update_routes after the grid changed.
+# This makes DroneRoutes.pkl over 10 times larger, as every search region holds up to all cells of the grid.
+keep_search_regions = False
+
+# --- Code to run, guarded so the route worker processes do not run it
 
-get_background_map(bbox2)
-population_map = load_population_data(bbox)
-no_fly_zone_map = load_no_fly_zones(bbox)
-hospitals = load_hospital_data(minx, maxx, miny, maxy, test)
+if __name__ == "__main__":
+    get_background_map(bbox2)
+    population_map = load_population_data(bbox)
+    no_fly_zone_map = load_no_fly_zones(bbox)
+    hospitals = load_hospital_data(minx, maxx, miny, maxy, test)
 
-riskmap, min_risk = create_risk_map(population_map, no_fly_zone_map, no_flyzone_weight, population_weight,
-                                 no_fly_zone_verboden_weight, no_fly_zone_beperkt_weight, no_fly_zone_else_weight,
-                                 probability_of_events, impactAreas, shelter_factors)
+    riskmap, min_risk = create_risk_map(population_map, no_fly_zone_map, no_flyzone_weight, population_weight,
+                                     no_fly_zone_verboden_weight, no_fly_zone_beperkt_weight, no_fly_zone_else_weight,
+                                     probability_of_events, impactAreas, shelter_factors)
 
-grid, hospital_grid, hospital_list, \
-    hospital_coordinate_list , hospital_lon_lat = create_grid_matrix(riskmap, hospitals, min_risk)
+    grid, hospital_grid, hospital_list, \
+        hospital_coordinate_list , hospital_lon_lat = create_grid_matrix(riskmap, hospitals, min_risk)
 
-drone_distances, drone_risks, drone_routes, direct_drone_distances, direct_drone_risks, \
-    direct_drone_routes = find_routes(grid, hospital_list, hospital_coordinate_list, drone_speed, drone_range)
+    drone_distances, drone_risks, drone_routes, direct_drone_distances, direct_drone_risks, \
+        direct_drone_routes = find_routes_parallel(grid, hospital_list, hospital_coordinate_list, drone_speed,
+                                                   drone_range, keep_regions=keep_search_regions)
 
-plot_drone_routes(grid, drone_routes, drone_distances, drone_risks, "Output/risk_routes.png")
-plot_drone_routes(grid, direct_drone_routes, direct_drone_distances, direct_drone_risks, "Output/direct_routes.png")
+    plot_drone_routes(grid, drone_routes, drone_distances, drone_risks, "Output/risk_routes.png")
+    plot_drone_routes(grid, direct_drone_routes, direct_drone_distances, direct_drone_risks, "Output/direct_routes.png")
 
-export_matrices(drone_distances, drone_risks, hospital_list, direct_drone_distances, direct_drone_risks, grid)
+    export_matrices(drone_distances, drone_risks, hospital_list, direct_drone_distances, direct_drone_risks, grid)
+    export_routes(drone_routes, direct_drone_routes)
 
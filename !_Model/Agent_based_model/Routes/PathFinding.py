@@ -8,96 +8,136 @@ import math
 import sys
 import numpy as np
 
-class Node:
-    """
-    Represents a node in de network
-    """
-    def __init__(self, location, risk):
-        self.location = location
-        self.risk = risk   #injuries per hour
-        self.neighbors = []
-        self.parent = None
-        self.distance = float('inf')
-        self.g = float('inf')
-        self.f = None
-
-    def clear(self, nodes_to_find):
-        infinity = sys.float_info.max
-        self.parent = None
-        self.g = infinity
-        self.distance = infinity
-        self.f = [infinity] * nodes_to_find
+# Offsets of the 8 neighbours of a cell: W, NW, N, NE and the reverse edges E, SW, S, SE
+NEIGHBOR_OFFSETS = ((0, -1), (-1, -1), (-1, 0), (-1, 1), (0, 1), (1, -1), (1, 0), (1, 1))
 
-    def addneighbor(self, cost, other, distance):
-        # add edge in both directions
-        self.neighbors.append((cost, other, distance))
-        other.neighbors.append((cost, self, distance))
+# Arrays that describe the edges of a GridGraph
+GRAPH_ARRAYS = ("offsets", "neighbors", "costs", "distances")
 
-    def __gt__(self, other):  # make nodes comparable
-        return min(self.f) > min(other.f)
-
-    def __repr__(self):
-        return str(self.location)
 
 class GridGraph:
+    """
+    Graph of the cells of a risk grid, in which every cell is connected to its 8 neighbours
+
+    The edges are stored in compressed sparse row (CSR) arrays. Cells are numbered row by row,
+    index = row * width + column, and the neighbours of cell k are neighbors[offsets[k]:offsets[k + 1]],
+    with the risk cost and distance of each edge at the same position in costs and distances.
+    """
     def __init__(self, grid, droneSpeed): #drone speed in km/h
-        
+
+        grid = np.asarray(grid, dtype=float)
         timePerHectometer = (100 / (droneSpeed /3.6)) / (60*60)
         self.minCost = np.min(grid) * timePerHectometer
-        width = len(grid[0])
-        height = len(grid)
-
-        nodes = []
-        for i in range(height):
-            noderow = []
-            nodes.append(noderow)
-            for j in range(width):
-                node = Node((i, j), grid[i,j])
-                noderow.append(node) 
-                for di, dj in ((0, -1), (-1, -1), (-1, 0), (-1, 1)):  # 4 directions: W, NW, N, NE 
-                 
-                    #check of neighbour would we in range
-                    if i + di > (height - 1) or i + di < 0 or j+dj > (width -1) or j+dj < 0:
-                        continue                        
-                    cost = math.sqrt(di**2 + dj**2)*(0.5*grid[i,j] + 0.5*grid[i+di,j+dj])*timePerHectometer   #the time over each grid square times the time over the square
-                    distance = math.sqrt(di**2 + dj**2) * 100 #convert distance to meters
-                    node.addneighbor(cost, nodes[i+di][j+dj], distance)
-        self.nodes = nodes
+        self.height, self.width = grid.shape
 
-    @staticmethod
-    def reconstructpath(node):
+        rows, columns = np.indices(grid.shape)
+        risks = grid.ravel()
+
+        valid = np.empty((grid.size, len(NEIGHBOR_OFFSETS)), dtype=bool)
+        neighbors = np.empty((grid.size, len(NEIGHBOR_OFFSETS)), dtype=np.int64)
+        steps = np.empty(len(NEIGHBOR_OFFSETS))
+
+        for n, (di, dj) in enumerate(NEIGHBOR_OFFSETS):
+            #check if neighbour would be in range
+            valid[:, n] = ((rows + di >= 0) & (rows + di < self.height) &
+                           (columns + dj >= 0) & (columns + dj < self.width)).ravel()
+            neighbors[:, n] = ((rows + di) * self.width + columns + dj).ravel()
+            steps[n] = math.sqrt(di**2 + dj**2)
+
+        neighbors = np.where(valid, neighbors, 0)
+
+        #the time over each grid square times the risk of the squares
+        costs = steps * (0.5 * risks[:, None] + 0.5 * risks[neighbors]) * timePerHectometer
+        distances = np.broadcast_to(steps * 100, valid.shape) #convert distance to meters
+
+        self.offsets = np.zeros(grid.size + 1, dtype=np.int64)
+        np.cumsum(valid.sum(axis=1), out=self.offsets[1:])
+        self.neighbors = neighbors[valid].astype(np.int32)
+        self.costs = costs[valid].astype(np.float32)
+        self.distances = distances[valid].astype(np.float32)
+
+        self.reset_search()
+
+    def index(self, location):
+        return location[0] * self.width + location[1]
+
+    def location(self, index):
+        return divmod(index, self.width)
+
+    def path(self, parent, index):
+        """
+        Follow the predecessors of a cell back to the start of the search
+
+        :param parent: predecessor of every cell, -1 for the start
+        :param index: cell at the end of the path
+        :return: list of (row, column) cells from start to end
+        """
         path = []
-        distance = node.distance
-        cost = node.g
-        while node is not None:
-            path.append(node)
-            node = node.parent
+        while index != -1:
+            path.append(self.location(index))
+            index = parent[index]
         path.reverse()
-        return path, distance, cost
+        return path
+
+    def reconstructpath(self, index):
+        return self.path(self.parent, index), self.distance[index], self.g[index]
+
 
-    
     def heuristic(self, a, b):
         # optimistic score, assuming every risk is the minimum
         dy = abs(a[0] - b[0])
         dx = abs(a[1] - b[1])
         return math.sqrt(dx**2 + dy**2) * self.minCost
-    
+
     @staticmethod
     def minDistance(a,b):
         dy = abs(a[0] - b[0])
         dx = abs(a[1] - b[1])
         return math.sqrt(dx**2 + dy*82) * 100 #convert distance to meters
 
-    def clear(self, nodes_to_find):
-        # remove search data from graph 
-        for row in self.nodes:
-            for node in row:
-                node.clear(nodes_to_find)
+    def reset_search(self):
+        """
+        Discard the search state, it is allocated again by the next search
+        """
+        self.generation = 0
+        self.reached = None
+
+    def new_search(self):
+        """
+        Start a new search
+
+        The search state (g, distance, keys, parent) is kept in lists of the size of the grid, which are allocated
+        by the first search and reused by the following ones. A value is only valid when the stamp of its cell in
+        reached equals the generation of the current search, otherwise the cell is unreached. Starting a search
+        thus only increments the generation, and a search costs time proportional to the cells it visits instead
+        of the size of the grid. Cells are settled in the current search when their stamp in settled equals the
+        generation.
+
+        :return: generation of the new search
+        """
+        if self.reached is None:
+            infinity = sys.float_info.max
+            size = self.height * self.width
+            self.reached = [0] * size
+            self.settled = [0] * size
+            self.parent = [-1] * size
+            self.g = [infinity] * size
+            self.distance = [infinity] * size
+            self.keys = [infinity] * size
+
+        self.generation += 1
+        return self.generation
 
     def a_star(self, start, goals, uavrange, riskWeightInput):
-        
+
         uavrange = uavrange * 1000 #convert range to meters
-        startnode = self.nodes[start[0]][start[1]]
+        startnode = self.index(start)
+
+        # Python views on the edge arrays, indexing these is much faster than indexing the arrays themselves
+        offsets = memoryview(self.offsets)
+        neighbors = memoryview(self.neighbors)
+        costs = memoryview(self.costs)
+        distances = memoryview(self.distances)
 
         n = len(goals) #amount of goals to reach
         end_nodes=[0]* n
@@ -107,56 +147,534 @@ class GridGraph:
         risks = [0] * n
         found = 0
 
-        for i, goal in enumerate(goals): 
-            end_nodes[i] = self.nodes[goal[0]][goal[1]]
-            d = self.minDistance(startnode.location, self.nodes[goal[0]][goal[1]].location)
+        for i, goal in enumerate(goals):
+            end_nodes[i] = self.index(goal)
+            d = self.minDistance(start, goal)
             if d < uavrange:
-                nodes_to_find.append(self.nodes[goal[0]][goal[1]])
+                nodes_to_find.append(self.index(goal))
             else:
                 paths[i] = "Out of range"
                 lengths[i] = float('inf')
                 risks[i] = float('inf')
                 found += 1
-        
+
+        goal_locations = [self.location(node) for node in nodes_to_find]
+
         #print(str(found)+ ' out of '+str(n)+ ' Goals out of reach')
         riskweight = riskWeightInput
 
-       
+
         while found <= n:
             distanceweight = 1 - riskweight
-            self.clear(len(nodes_to_find))
-            startnode.g = 0
-            startnode.distance= 0
-            openlist = [startnode] 
-            closed = set()
+            generation = self.new_search()
+            g_values, node_distances, parents = self.g, self.distance, self.parent
+            reached, closed = self.reached, self.settled
+            g_values[startnode] = 0
+            node_distances[startnode] = 0
+            parents[startnode] = -1
+            reached[startnode] = generation
+            openlist = [(0, startnode)]
 
             while openlist:
-                node = heappop(openlist)
-                if node in closed:
+                _, node = heappop(openlist)
+                if closed[node] == generation:
                     continue
-                closed.add(node)
-                if node in nodes_to_find:                
+                closed[node] = generation
+                if node in nodes_to_find:
                     index = end_nodes.index(node)
                     if paths[index] == 0:
                         found += 1
                         #print(str(found)+' out of '+ str(n) + ' goals found')
-                        paths[index], lengths[index], risks[index] = self.reconstructpath(node)                   
+                        paths[index], lengths[index], risks[index] = self.reconstructpath(node)
                 if found == n:
-                    return paths, lengths, risks     
-                
-                for weight, neighbor, distance in node.neighbors:                    
-                    g = node.g + weight
-                    d = node.distance + distance
-                    if ((g * riskweight + d * distanceweight) < (neighbor.g * riskweight + neighbor.distance * distanceweight) ) and (d < uavrange):  #compare node with its neigbour
-                        neighbor.distance = d
-                        neighbor.g = g
-                        for i, endnode in enumerate(nodes_to_find):
-                            neighbor.f[i] = (g * riskweight + d * distanceweight) + self.heuristic(neighbor.location, endnode.location)                       
-                        neighbor.parent = node
-                        heappush(openlist, neighbor)
+                    return paths, lengths, risks
+
+                for edge in range(offsets[node], offsets[node + 1]):
+                    neighbor = neighbors[edge]
+                    g = g_values[node] + costs[edge]
+                    d = node_distances[node] + distances[edge]
+                    if (reached[neighbor] != generation or (g * riskweight + d * distanceweight) < (g_values[neighbor] * riskweight + node_distances[neighbor] * distanceweight)) and (d < uavrange):  #compare node with its neigbour
+                        reached[neighbor] = generation
+                        node_distances[neighbor] = d
+                        g_values[neighbor] = g
+                        location = self.location(neighbor)
+                        f = (g * riskweight + d * distanceweight) + min(self.heuristic(location, goal) for goal in goal_locations)
+                        parents[neighbor] = node
+                        heappush(openlist, (f, neighbor))
 
             riskweight = riskweight / 10 #by emphasizing risk less and distance more, feasible routes are always found
             #print("Not all goals were found optimally, lowering risk weight")
 
-         
-        return paths, lengths, risks       
\ No newline at end of file
+
+        return paths, lengths, risks
+
+    def dijkstra(self, start, goals, uavrange, riskWeight):
+        """
+        Single-source multi-target Dijkstra search, that stops when all goals within range are settled
+
+        Cells are ordered by riskWeight * risk cost + (1 - riskWeight) * distance, equal orders by the lowest risk
+        cost. Only paths shorter than the range are followed.
+
+        :param start: (row, column) of the start cell
+        :param goals: list of (row, column) of the goal cells
+        :param uavrange: range in km
+        :param riskWeight: weight of the risk cost, the distance gets weight 1 - riskWeight
+        :return: SearchTree of the reached cells
+        """
+        uavrange = uavrange * 1000 #convert range to meters
+        distanceWeight = 1 - riskWeight
+
+        offsets = memoryview(self.offsets)
+        neighbors = memoryview(self.neighbors)
+        costs = memoryview(self.costs)
+        distances = memoryview(self.distances)
+
+        generation = self.new_search()
+        reached, settled = self.reached, self.settled
+        keys, cost, distance, parent = self.keys, self.g, self.distance, self.parent
+
+        startnode = self.index(start)
+        keys[startnode] = cost[startnode] = distance[startnode] = 0.0
+        parent[startnode] = -1
+        reached[startnode] = generation
+        visited = [startnode]                           # reached cells, in the order in which they were reached
+        to_settle = set(self.index(goal) for goal in goals if self.minDistance(start, goal) < uavrange)
+        extents = {}                                    # goal -> number of cells reached when it was settled
+        heap = [(0.0, 0.0, startnode)]
+
+        while heap and to_settle:
+            _, g, node = heappop(heap)
+            if settled[node] == generation:
+                continue
+            settled[node] = generation
+            if node in to_settle:
+                to_settle.remove(node)
+                extents[node] = len(visited)
+
+            d = distance[node]
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbor = neighbors[edge]
+                if settled[neighbor] == generation:
+                    continue
+                neighbor_distance = d + distances[edge]
+                if neighbor_distance >= uavrange:
+                    continue
+                neighbor_cost = g + costs[edge]
+                key = neighbor_cost * riskWeight + neighbor_distance * distanceWeight
+                if reached[neighbor] != generation:
+                    reached[neighbor] = generation
+                    visited.append(neighbor)
+                elif key > keys[neighbor] or (key == keys[neighbor] and neighbor_cost >= cost[neighbor]):
+                    continue
+                keys[neighbor] = key
+                cost[neighbor] = neighbor_cost
+                distance[neighbor] = neighbor_distance
+                parent[neighbor] = node
+                heappush(heap, (key, neighbor_cost, neighbor))
+
+        return SearchTree(startnode,
+                          np.array(visited, dtype=np.int32),
+                          np.array([distance[k] for k in visited]),
+                          np.array([cost[k] for k in visited]),
+                          np.array([parent[k] for k in visited], dtype=np.int32),
+                          np.array([settled[k] == generation for k in visited]),
+                          extents)
+
+    def route_tree(self, start, goals, uavrange, riskWeightInput, destinations=None, keep_regions=False):
+        """
+        Routes from a start cell to all goals, searched with dijkstra
+
+        Goals that are not reached are searched again with a ten times lower risk weight, until the distance
+        alone is minimised. Goals that are not reached then are out of range.
+
+        :param start: (row, column) of the start cell
+        :param goals: list of (row, column) of the goal cells
+        :param uavrange: range in km
+        :param riskWeightInput: weight of the risk cost
+        :param destinations: indices of the goals that are searched, all goals when None
+        :param keep_regions: keep the SearchRegions of the searches in the RouteTree, for update_routes
+        :return: RouteTree of the routes, lists of distances (m) and risk costs, by goal
+        """
+        n = len(goals)
+        lengths = [float('inf')] * n
+        risks = [float('inf')] * n
+        ends = [-1] * n
+        cells, parents = [], []                         # route tree under construction
+        searches, dependencies = [], []                 # search regions under construction
+
+        if destinations is None:
+            destinations = range(n)
+        to_find = [i for i in destinations if self.minDistance(start, goals[i]) < uavrange * 1000]
+        riskweight = riskWeightInput
+
+        while to_find:
+            tree = self.dijkstra(start, [goals[i] for i in to_find], uavrange, riskweight)
+            added = {}                                  # position in the search tree -> position in the route tree
+
+            for i in to_find:
+                cell = self.index(goals[i])
+                position = tree.position(cell)
+                if position != -1 and tree.settled[position]:
+                    ends[i] = _add_route(tree, position, added, cells, parents)
+                    lengths[i] = float(tree.distance[position])
+                    risks[i] = float(tree.cost[position])
+                    dependencies.append((i, len(searches), tree.extents[cell]))
+                else:
+                    dependencies.append((i, len(searches), len(tree)))
+
+            if keep_regions:
+                searches.append(tree.cells)
+
+            to_find = [i for i in to_find if lengths[i] == float('inf')]
+
+            if riskweight == 0:
+                break
+            riskweight = riskweight / 10 if riskweight > 1e-12 else 0 #by emphasizing risk less and distance more, feasible routes are always found
+
+        regions = None
+        if keep_regions:
+            regions = SearchRegions(searches, np.array(dependencies, dtype=np.int64).reshape(-1, 3))
+
+        route_tree = RouteTree(self.width, np.array(cells, dtype=np.int32), np.array(parents, dtype=np.int32),
+                               np.array(ends, dtype=np.int32), regions)
+
+        return route_tree, lengths, risks
+
+    def routes(self, start, goals, uavrange, riskWeightInput):
+        """
+        Routes from a start cell to all goals, with the same output as a_star but searched with dijkstra
+
+        :param start: (row, column) of the start cell
+        :param goals: list of (row, column) of the goal cells
+        :param uavrange: range in km
+        :param riskWeightInput: weight of the risk cost
+        :return: lists of paths, distances (m) and risk costs, by goal
+        """
+        route_tree, lengths, risks = self.route_tree(start, goals, uavrange, riskWeightInput)
+        paths = [route_tree.locations(j) if route_tree.reachable(j) else "Out of range" for j in range(len(goals))]
+
+        return paths, lengths, risks
+
+
+def _add_route(tree, position, added, cells, parents):
+    """
+    Add the path of a search tree to a cell to a route tree, sharing the part that is already in it
+
+    :param tree: SearchTree
+    :param position: position of the cell in the search tree
+    :param added: dict of the positions in the route tree of the cells of the search tree that were added
+    :param cells: flat cell indices of the route tree, extended in place
+    :param parents: predecessor positions of the route tree, extended in place
+    :return: position of the cell in the route tree
+    """
+    chain = []
+    while position != -1 and position not in added:
+        chain.append(position)
+        parent = tree.parent[position]
+        position = tree.position(parent) if parent != -1 else -1
+
+    attach = added[position] if position != -1 else -1
+    for position in reversed(chain):
+        cells.append(int(tree.cells[position]))
+        parents.append(attach)
+        added[position] = attach = len(cells) - 1
+
+    return attach
+
+
+class SearchTree:
+    """
+    Cells reached by a search from a start cell, with their distance (m), risk cost and predecessor
+
+    Only the reached cells are stored, in the order in which they were reached, so the tree is as large as the
+    search instead of the grid. The labels of settled cells are final, those of the other cells are tentative.
+    """
+    def __init__(self, start, cells, distance, cost, parent, settled, extents):
+
+        self.start = start
+        self.cells = cells                              # flat cell indices
+        self.distance = distance
+        self.cost = cost
+        self.parent = parent                            # flat cell index of the predecessor, -1 for the start
+        self.settled = settled
+        self.extents = extents                          # goal cell -> number of cells reached when it was settled
+        self._positions = None                          # cell -> position in cells, created on first use
+
+    def __len__(self):
+        return len(self.cells)
+
+    def position(self, cell):
+        """
+        Position of a cell in the tree
+
+        :param cell: flat cell index
+        :return: position, -1 when the cell was not reached
+        """
+        if self._positions is None:
+            self._positions = dict(zip(self.cells.tolist(), range(len(self.cells))))
+        return self._positions.get(cell, -1)
+
+    def path(self, position):
+        """
+        Follow the predecessors of a cell back to the start of the search
+
+        :param position: position of the cell at the end of the path
+        :return: list of flat cell indices from start to end
+        """
+        parent = self.parent
+        path = [int(self.cells[position])]
+        while parent[position] != -1:
+            path.append(int(parent[position]))
+            position = self.position(path[-1])
+        path.reverse()
+        return path
+
+    def as_arrays(self, size):
+        """
+        Distance, risk cost and predecessor of every cell of the grid
+
+        :param size: number of cells of the grid
+        :return: distance, risk cost and predecessor arrays, unreached cells have an infinite distance and
+                 predecessor -1
+        """
+        distance = np.full(size, np.inf)
+        cost = np.full(size, np.inf)
+        parent = np.full(size, -1, dtype=np.int32)
+        distance[self.cells] = self.distance
+        cost[self.cells] = self.cost
+        parent[self.cells] = self.parent
+        return distance, cost, parent
+
+
+class RouteTree:
+    """
+    Routes from an origin to all destinations, stored as a tree of the cells on the routes
+
+    Routes share the cells of their common beginning, so the tree is much smaller than the routes themselves.
+    Every cell is stored once with the position of its predecessor, which always comes before it, and the route
+    to a destination is expanded on demand by following the predecessors from its last cell.
+    """
+    def __init__(self, width, cells, parents, ends, regions=None):
+
+        self.width = width                              # width of the grid, to convert flat cell indices
+        self.cells = cells                              # flat cell indices, int32
+        self.parents = parents                          # position of the predecessor, -1 for the origin
+        self.ends = ends                                # position of the last cell of every route, -1 when out of range
+        self.regions = regions                          # SearchRegions of the searches, when kept
+
+    def __len__(self):
+        return len(self.ends)
+
+    def reachable(self, destination):
+        return self.ends[destination] != -1
+
+    def route(self, destination):
+        """
+        Route to a destination
+
+        :param destination: index of the destination
+        :return: int32 array of flat cell indices from origin to destination, empty when out of range
+        """
+        positions = []
+        position = self.ends[destination]
+        while position != -1:
+            positions.append(position)
+            position = self.parents[position]
+
+        return self.cells[positions[::-1]]
+
+    def expand(self, destination):
+        """
+        Route to a destination as grid coordinates
+
+        :param destination: index of the destination
+        :return: int arrays of the rows and of the columns of the cells from origin to destination
+        """
+        return np.divmod(self.route(destination), self.width)
+
+    def locations(self, destination):
+        """
+        Route to a destination as a list of (row, column) cells
+
+        :param destination: index of the destination
+        :return: list of (row, column)
+        """
+        rows, columns = self.expand(destination)
+        return list(zip(rows.tolist(), columns.tolist()))
+
+    def replace(self, destinations, other):
+        """
+        Route tree with the routes to some destinations taken from another route tree from the same origin
+
+        :param destinations: indices of the destinations of which the routes are replaced
+        :param other: RouteTree that contains the new routes
+        :return: RouteTree
+        """
+        offset = len(self.cells)
+        ends = self.ends.copy()
+        ends[destinations] = np.where(other.ends[destinations] == -1, -1, other.ends[destinations] + offset)
+        cells = np.concatenate([self.cells, other.cells])
+        parents = np.concatenate([self.parents, np.where(other.parents == -1, -1, other.parents + offset)])
+
+        regions = None
+        if self.regions is not None and other.regions is not None:
+            regions = self.regions.replace(destinations, other.regions)
+
+        # Remove the cells that are no longer on any route
+        keep = np.zeros(len(cells), dtype=bool)
+        for position in ends.tolist():
+            while position != -1 and not keep[position]:
+                keep[position] = True
+                position = parents[position]
+
+        new_positions = np.cumsum(keep) - 1
+        parents = parents[keep]
+        parents = np.where(parents == -1, -1, new_positions[parents]).astype(np.int32)
+        ends = np.where(ends == -1, -1, new_positions[ends]).astype(np.int32)
+
+        return RouteTree(self.width, cells[keep], parents, ends, regions)
+
+
+class SearchRegions:
+    """
+    Cells reached by the searches of a RouteTree, which tell whether a route depends on a cell
+
+    A search reaches the cells in a fixed order. The route to a destination only depends on the risks of the cells
+    that the search that found it had reached when the destination was settled, and of all cells reached by the
+    earlier searches, with a higher risk weight, that did not find it. When none of these cells change, searching
+    again gives the same route.
+    """
+    def __init__(self, searches, dependencies):
+
+        self.searches = searches                        # flat cell indices reached by every search, in that order
+        self.dependencies = dependencies                # rows of (destination, search, number of cells of the search)
+
+    def affected(self, changed_cells, n):
+        """
+        Destinations of which the route depends on a changed cell
+
+        :param changed_cells: flat indices of the changed cells
+        :param n: number of destinations
+        :return: boolean array, by destination
+        """
+        first_changed = np.empty(len(self.searches), dtype=np.int64)
+        for s, cells in enumerate(self.searches):
+            changed = np.flatnonzero(np.isin(cells, changed_cells))
+            first_changed[s] = changed[0] if len(changed) else len(cells)
+
+        destination, search, extent = self.dependencies.T
+        affected = np.zeros(n, dtype=bool)
+        affected[destination[first_changed[search] < extent]] = True
+        return affected
+
+    def replace(self, destinations, other):
+        """
+        Search regions with those of some destinations taken from other search regions from the same origin
+
+        :param destinations: indices of the destinations of which the regions are replaced
+        :param other: SearchRegions that contains the new regions
+        :return: SearchRegions
+        """
+        kept = self.dependencies[~np.isin(self.dependencies[:, 0], destinations)]
+        added = other.dependencies[np.isin(other.dependencies[:, 0], destinations)].copy()
+        added[:, 1] += len(self.searches)
+        dependencies = np.concatenate([kept, added])
+        searches = self.searches + other.searches
+
+        # Remove the searches on which no route depends anymore
+        used = np.unique(dependencies[:, 1])
+        new_index = np.full(len(searches), -1, dtype=np.int64)
+        new_index[used] = np.arange(len(used))
+        dependencies[:, 1] = new_index[dependencies[:, 1]]
+
+        return SearchRegions([searches[s] for s in used], dependencies)
+
+
+class SharedGridGraph:
+    """
+    Copy of the edge arrays of a GridGraph in shared memory, from which other processes create the graph
+    without copying it. Use as a context manager, the shared memory is released on exit. Requires Python 3.8.
+    """
+    def __init__(self, graph):
+        from multiprocessing import shared_memory
+
+        self.blocks = []
+        self.handles = {}                               # array name -> (block name, shape, dtype)
+        self.attributes = {"minCost": graph.minCost, "height": graph.height, "width": graph.width}
+
+        for name in GRAPH_ARRAYS:
+            array = getattr(graph, name)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            self.blocks.append(block)
+            self.handles[name] = (block.name, array.shape, array.dtype.str)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+
+def attach_graph(handles, attributes):
+    """
+    Create a GridGraph on the arrays of a SharedGridGraph
+
+    :param handles: SharedGridGraph.handles
+    :param attributes: SharedGridGraph.attributes
+    :return: GridGraph and the shared memory blocks, which must be kept open while the graph is used
+    """
+    from multiprocessing import shared_memory
+
+    graph = GridGraph.__new__(GridGraph)
+    blocks = []
+
+    for name, (block_name, shape, dtype) in handles.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        setattr(graph, name, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+
+    for name, value in attributes.items():
+        setattr(graph, name, value)
+
+    graph.reset_search()
+
+    return graph, blocks
+
+
+# Graph and hospitals of a route worker process, set by initialise_route_worker
+_worker = {}
+
+
+def initialise_route_worker(handles, attributes, hospital_coordinate_list, drone_range, keep_regions=False):
+    """
+    Attach a route worker process to the shared graph
+
+    :param handles: SharedGridGraph.handles
+    :param attributes: SharedGridGraph.attributes
+    :param hospital_coordinate_list: (row, column) of every hospital
+    :param drone_range: range in km
+    :param keep_regions: keep the search regions in the route trees
+    :return:
+    """
+    _worker["graph"], _worker["blocks"] = attach_graph(handles, attributes)
+    _worker["hospitals"] = hospital_coordinate_list
+    _worker["range"] = drone_range
+    _worker["keep regions"] = keep_regions
+
+
+def route_task(task):
+    """
+    Find the routes from one hospital to all hospitals, in a route worker process
+
+    :param task: (index of the origin hospital, risk weight)
+    :return: origin, risk weight, RouteTree of the routes, distances, risks
+    """
+    origin, riskWeight = task
+    hospitals = _worker["hospitals"]
+    routes, distances, risks = _worker["graph"].route_tree(hospitals[origin], hospitals, _worker["range"], riskWeight,
+                                                           keep_regions=_worker["keep regions"])
+
+    return origin, riskWeight, routes, distances, risks
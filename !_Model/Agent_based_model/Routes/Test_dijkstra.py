@@ -0,0 +1,96 @@
+"""
+Regression check of the Dijkstra route search
+
+Compares the routes that GridGraph.dijkstra and GridGraph.route_tree find on a small random risk grid with
+brute force shortest paths, found by relaxing every edge of the grid until no label improves. The edges of the
+brute force are derived from the grid directly, so the graph construction is checked as well. Run from the
+Routes directory:
+
+    python Test_dijkstra.py
+"""
+import math
+
+import numpy as np
+
+from PathFinding import GridGraph, NEIGHBOR_OFFSETS
+
+DRONE_SPEED = 90
+DRONE_RANGE = 100                                       # km, larger than the grid so the range does not matter
+RISK_WEIGHTS = [1, 0.5, 0]
+
+
+def brute_force(grid, start, risk_weight):
+    """
+    Shortest path labels from a start cell to all cells of a grid
+
+    :param grid: risk grid
+    :param start: (row, column) of the start cell
+    :param risk_weight: weight of the risk cost, the distance gets weight 1 - risk_weight
+    :return: arrays of the key, risk cost and distance (m) of every cell
+    """
+    height, width = grid.shape
+    time_per_hectometer = (100 / (DRONE_SPEED / 3.6)) / (60 * 60)
+
+    edges = []
+    for row in range(height):
+        for column in range(width):
+            for di, dj in NEIGHBOR_OFFSETS:
+                if 0 <= row + di < height and 0 <= column + dj < width:
+                    step = math.sqrt(di ** 2 + dj ** 2)
+                    cost = step * (0.5 * grid[row, column] + 0.5 * grid[row + di, column + dj]) * time_per_hectometer
+                    edges.append((row * width + column, (row + di) * width + column + dj, cost, step * 100))
+
+    key = np.full(grid.size, np.inf)
+    cost = np.full(grid.size, np.inf)
+    distance = np.full(grid.size, np.inf)
+    key[start[0] * width + start[1]] = cost[start[0] * width + start[1]] = distance[start[0] * width + start[1]] = 0
+
+    improved = True
+    while improved:
+        improved = False
+        for a, b, edge_cost, edge_distance in edges:
+            edge_key = edge_cost * risk_weight + edge_distance * (1 - risk_weight)
+            if key[a] + edge_key < key[b] - 1e-9:
+                key[b] = key[a] + edge_key
+                cost[b] = cost[a] + edge_cost
+                distance[b] = distance[a] + edge_distance
+                improved = True
+
+    return key, cost, distance
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(5)
+    grid = rng.uniform(1, 100, (9, 12))
+    grid[2:7, 5] = 1000                                 # a wall with a high risk, which the risk optimal routes avoid
+    graph = GridGraph(grid, DRONE_SPEED)
+
+    cells = [(row, column) for row in range(grid.shape[0]) for column in range(grid.shape[1])]
+    starts = [(0, 0), (4, 2), (8, 11), (3, 9)]
+    checked = 0
+
+    for start in starts:
+        for risk_weight in RISK_WEIGHTS:
+            key, cost, distance = brute_force(grid, start, risk_weight)
+            tree = graph.dijkstra(start, cells, DRONE_RANGE, risk_weight)
+            tree_distance, tree_cost, _ = tree.as_arrays(grid.size)
+
+            assert tree.settled.all() and len(tree) == grid.size, "not all cells were settled"
+            tree_key = tree_cost * risk_weight + tree_distance * (1 - risk_weight)
+            assert np.allclose(tree_key, key, rtol=1e-5), f"start {start}, risk weight {risk_weight}: keys differ"
+
+            # The routes of the route tree follow the grid and have the lengths and risks it reports
+            routes, lengths, risks = graph.route_tree(start, cells, DRONE_RANGE, risk_weight)
+            for j, cell in enumerate(cells):
+                route = routes.locations(j)
+                assert route[0] == start and route[-1] == cell
+                steps = np.diff(np.array(route), axis=0)
+                assert (np.abs(steps) <= 1).all()
+
+                route_distance = np.sqrt((steps ** 2).sum(axis=1)).sum() * 100
+                assert math.isclose(lengths[j], route_distance, rel_tol=1e-5, abs_tol=1e-3)
+                assert math.isclose(lengths[j] * (1 - risk_weight) + risks[j] * risk_weight,
+                                    key[j], rel_tol=1e-5, abs_tol=1e-6)
+                checked += 1
+
+    print(f"Dijkstra and brute force agree on {checked} routes")
@@ -0,0 +1,77 @@
+"""
+Regression check of the incremental route update
+
+Changes the risk of a few local patches of a small random risk grid, one after the other, and checks that the
+routes, distances and risks of update_routes are identical to those of a full find_routes on the changed grid.
+The patches lie far from all routes, on a route and around a hospital. Run from the Routes directory:
+
+    python Test_update_routes.py
+"""
+import importlib.util
+
+import numpy as np
+
+# Drone-routes.py is not a valid module name, so it is loaded from its file
+spec = importlib.util.spec_from_file_location("drone_routes", "Drone-routes.py")
+drone_routes = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(drone_routes)
+
+DRONE_SPEED = 90
+DRONE_RANGE = 4                                         # km, less than the size of the grid so some pairs are out of range
+
+
+def same_routes(a, b):
+    """
+    Check if two outputs of find_routes are identical
+
+    :param a: output of find_routes or update_routes
+    :param b: output of find_routes or update_routes
+    :return: True if all matrices and routes are identical
+    """
+    for x, y in zip(a, b):
+        if isinstance(x, list):
+            if not all(np.array_equal(x[i].route(j), y[i].route(j)) for i in range(len(x)) for j in range(len(x))):
+                return False
+
+        elif not np.array_equal(x, y):
+            return False
+
+    return True
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(3)
+    grid = rng.uniform(1, 100, (50, 50))
+    hospital_coordinates = [(2, 3), (10, 40), (25, 25), (45, 8), (47, 46), (30, 12)]
+    hospitals = [{"Name": f"Hospital {i}"} for i in range(len(hospital_coordinates))]
+
+    routes = drone_routes.find_routes(grid, hospitals, hospital_coordinates, DRONE_SPEED, DRONE_RANGE,
+                                      keep_regions=True)
+
+    route = routes[2][2].locations(1)
+    row, column = route[len(route) // 2]
+    patches = [
+        ("far from the routes", (slice(0, 2), slice(47, 50)), 10.0),
+        ("on the route from hospital 2 to 1", (slice(row - 2, row + 3), slice(column - 2, column + 3)), 100.0),
+        ("around hospital 2", (slice(20, 30), slice(20, 30)), 0.01),
+        ("no-fly block", (slice(5, 35), slice(18, 20)), 1000.0),
+    ]
+
+    for name, (rows, columns), factor in patches:
+        new_grid = grid.copy()
+        new_grid[rows, columns] *= factor
+        changed_cells = [tuple(cell) for cell in np.argwhere(new_grid != grid)]
+
+        updated, changed, direct_changed = drone_routes.update_routes(new_grid, changed_cells, hospitals,
+                                                                      hospital_coordinates, DRONE_SPEED,
+                                                                      DRONE_RANGE, routes)
+        full = drone_routes.find_routes(new_grid, hospitals, hospital_coordinates, DRONE_SPEED, DRONE_RANGE,
+                                        keep_regions=True)
+
+        assert same_routes(updated, full), f"{name}: the updated routes differ from the full search"
+        assert np.array_equal(changed, (updated[0] != routes[0]) | (updated[1] != routes[1])), name
+        assert np.array_equal(direct_changed, (updated[3] != routes[3]) | (updated[4] != routes[4])), name
+
+        routes, grid = updated, new_grid
+
+    print(f"update_routes and find_routes agree after {len(patches)} local changes")
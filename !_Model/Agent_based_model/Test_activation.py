@@ -0,0 +1,55 @@
+"""
+Regression check of the event-driven activation
+
+Runs the default scenario with every agent activated every minute (tick) and with the event scheduler that
+reproduces the tick outcomes (event_equivalent), for a few seeds and delivery modes, and checks that all KPIs
+are identical. Run from the Agent_based_model directory:
+
+    python Test_activation.py
+"""
+from base_model import BaseModel
+from scenario import load_scenario, load_inputs, create_input_params
+
+SEEDS = [0, 1, 2]
+DELIVERY_MODES = ["safe", "fast", "combi"]
+
+
+def run_kpis(params, max_steps, activation, seed, delivery_mode):
+    """
+    Perform a single run and return its KPIs
+
+    :param params: model keyword arguments shared by all runs
+    :param max_steps: maximum number of model steps after which the model halts
+    :param activation: tick, event or event_equivalent
+    :param seed: seed of the run
+    :param delivery_mode: safe, fast or combi
+    :return: dict of model results, without the heatmaps
+    """
+    model = BaseModel(**params, activation=activation, seed=seed, delivery_mode=delivery_mode)
+
+    while model.running and model.schedule.steps <= max_steps:
+        model.step()
+
+    return {var: value for var, value in model.model_reporters.items()
+            if var != 'Movement matrix' and var != 'Deliveries matrix'}
+
+
+if __name__ == "__main__":
+    scenario = load_scenario("Scenarios/default.json")
+    params = create_input_params(scenario, load_inputs(scenario["paths"]))
+    params.update(scenario["settings"])
+    params.update({"visualization": False, "matrix_cache_dir": None})
+    for setting in ("seed", "delivery_mode"):
+        del params[setting]
+
+    max_steps = scenario["run"]["max_steps"]
+
+    for seed in SEEDS:
+        for delivery_mode in DELIVERY_MODES:
+            tick = run_kpis(params, max_steps, "tick", seed, delivery_mode)
+            event = run_kpis(params, max_steps, "event_equivalent", seed, delivery_mode)
+
+            differences = {var: (tick[var], event[var]) for var in tick if tick[var] != event[var]}
+            assert not differences, f"seed {seed}, {delivery_mode}: {differences}"
+
+    print(f"Tick and event activation give the same KPIs in {len(SEEDS) * len(DELIVERY_MODES)} runs")
@@ -3,6 +3,7 @@ Created on Tue August 1 2023
 
 @author: Nikki Kamphuis
 """
+import numpy as np
 
 
 class Bid:
@@ -71,3 +72,40 @@ class Bid:
         :return:
         """
         return self.score < other.score
+
+
+def determine_bid_scores(model, eta, emissions, cost, risk, deadline):
+    """
+    Vectorized version of Bid.determine_score that computes the scores of many bids at once
+
+    :param model: agent-based model class
+    :param eta: array of bid arrival times
+    :param emissions: array of bid emissions
+    :param cost: array of bid costs
+    :param risk: array of bid risks
+    :param deadline: deadline of the request
+    :return: array of scores
+    """
+    decision_weights = model.decision_weights
+    delivery_time = eta - model.time
+
+    # Orders coming in too late are always discouraged
+    score = np.where(eta > deadline, 10000000, 0)
+
+    if model.delivery_mode == "safe":
+        # In safe modus only TPR levels are compared
+        score = score + risk
+
+    elif model.delivery_mode == "fast":
+        # In fast modus only delivery times are compared
+        score = score + delivery_time
+
+    elif model.delivery_mode == "combi":
+        # In combi modus multiple KPIs can be weighed into the score, in the same order as Bid.determine_score
+        score = (score
+                 + risk * decision_weights["risk"] * 1000000
+                 + emissions * decision_weights["emmissions"]
+                 + delivery_time * decision_weights["deliveryTime"]
+                 + cost * decision_weights["cost"])
+
+    return score
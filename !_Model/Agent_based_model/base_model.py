@@ -4,8 +4,8 @@ Created on Tue Jul 25 2023
 @author: Nikki Kamphuis
 """
 from Local_Mesa import Model
-from Local_Mesa.space import MultiGrid
-from Local_Mesa.time import RandomActivation
+from Local_Mesa.space import SparseMultiGrid
+from Local_Mesa.time import RandomActivation, EventActivation
 from Local_Mesa.datacollection import DataCollector
 import numpy as np
 import random as rd
@@ -18,6 +18,9 @@ from client import Client
 from drone import Drone
 from car import Car
 from command_center import CommandCenter
+from matrix_cache import cached_matrices, drone_matrix_key, car_matrix_key
+from snapshot import take_snapshot, restore_snapshot
+from instrumentation import Instrumentation
 
 
 class BaseModel(Model):
@@ -39,7 +42,13 @@ class BaseModel(Model):
         visualization=True,
         max_steps=1440,
         charts=False,
-        track_heatmap=False
+        track_heatmap=False,
+        matrix_cache_dir=None,                    # directory in which processed route matrices are cached
+        activation="tick",                        # ['tick', 'event', 'event_equivalent'], -> how agents are activated
+        vectorized_auction=False,                 # evaluate the bids of all vehicles at once
+        instrumentation="off",                    # ['off', 'on', 'report'], -> count and time the hot paths,
+                                                  # report adds the measurements to the model reporters
+        num_cars=1
     ):
 
         ############################################ Time parameters ###################################################
@@ -48,36 +57,37 @@ class BaseModel(Model):
         self.time = 0
         self.request_counter = 0
         self.seed = seed
-        rd.seed(seed)
+        self.random = rd.Random(seed)                   # mesa keeps its RNG on the class, give every model its own
+
+        # Independent random streams, so the outcome of one does not depend on how often another is drawn from
+        # The demand is read from the request input and not drawn, its stream is skipped so the others stay the same
+        _, spawn_stream, day_stream, delay_stream = np.random.SeedSequence(seed).spawn(4)
+        self.spawn_rng = np.random.default_rng(spawn_stream)
+        self.day_rng = np.random.default_rng(day_stream)
+        self.delay_rng = np.random.default_rng(delay_stream)
+        self.delay_draws = np.empty(0)                  # uniform [0, 1) travel delay draws, generated in bulk
+        self.delay_draw_index = 0
 
         ############################################### Spatial parameters #############################################
 
         grid = model_params["grid"]
         width, height = grid.shape
-        self.grid = MultiGrid(width, height, False)
+        self.grid = SparseMultiGrid(width, height, False)     # only stores the cells that contain agents
         self.matrices = {}
         self.averages = {}
 
         ############################################# Model characteristics ############################################
 
-        self.delivery_mode = delivery_mode                                              # fast or safe routes
         self.decision_weights = model_params["decisionWeights"]
         self.num_locations = int(len(client_params))                                    # client locations, could potentially introduce more hubs
         self.num_drones = num_drones
-        self.schedule = RandomActivation(self)                                          # should this be RandomActivationByType?
-        self.reposition_mode = "safe"                                                   # by default repositioning is done using the safe option
-        if self.delivery_mode == "fast":                                                # only reposition using the fast option when deliverymode is set to fast
-            self.reposition_mode = "fast"
-        self.considered_delivery_modes = []                                             # List that contains the deliverymodes that should
-                                                                                        # be used when making bids, this list only contains
-                                                                                        # safe or fast for their respective modes, and contains
-                                                                                        # both when using combi, thus a list is needed
-        if self.delivery_mode == "fast" or self.delivery_mode == "combi":
-            self.considered_delivery_modes.append("fast")
-
-        if self.delivery_mode == "safe" or self.delivery_mode == "combi":
-            self.considered_delivery_modes.append("safe")
-
+        self.num_cars = num_cars
+        self.activation = activation
+        if self.activation == "tick":                                                   # activate every agent every minute
+            self.schedule = RandomActivation(self)                                      # should this be RandomActivationByType?
+        else:                                                                           # only activate agents when something happens,
+            self.schedule = EventActivation(self, activation == "event_equivalent")   # equivalent reproduces the tick outcomes
+        self.set_delivery_mode(delivery_mode)                                           # route types used for deliveries and repositioning
         self.possible_delivery_modes = ["safe", "fast"]
         self.agent_types = ["Drone", "Car"]
         self.drone_infra_costs = model_params["droneInfraCosts"]
@@ -85,6 +95,7 @@ class BaseModel(Model):
         self.delays = False                                                             # Boolean that can be activate if one were to include
                                                                                         # unexpected delays into deliveries
         self.repositioning = repositioning
+        self.vectorized_auction = vectorized_auction
         self.visualization = visualization
         self.charts = charts
         self.max_steps = max_steps
@@ -92,9 +103,11 @@ class BaseModel(Model):
         self.labour_costs = 0
         self.spawn_locations = []
         self.request_input = request_input
+        self.report_instrumentation = instrumentation == "report"
+        self.instrumentation = Instrumentation() if instrumentation != "off" else None
 
         if day_of_week == "Random":
-            self.day = rd.choice([1, 2, 3, 4, 5, 6, 7])
+            self.day = int(self.day_rng.integers(1, 8))
         else:
             self.day = day_of_week
 
@@ -200,8 +213,16 @@ class BaseModel(Model):
         ###################################### Create items within model ###############################################
 
         # Create drone and car route matrices
-        self.matrices["Drone"] = self.create_drone_time_matrix(drone_params)
-        self.matrices["Car"] = self.create_car_matrices(car_params)
+        if matrix_cache_dir is None:
+            self.matrices["Drone"] = self.create_drone_time_matrix(drone_params)
+            self.matrices["Car"] = self.create_car_matrices(car_params)
+
+        # Reuse the matrices from the cache if they were created before
+        else:
+            self.matrices["Drone"] = cached_matrices(matrix_cache_dir, drone_matrix_key(drone_params),
+                                                     lambda: self.create_drone_time_matrix(drone_params))
+            self.matrices["Car"] = cached_matrices(matrix_cache_dir, car_matrix_key(car_params, self.day),
+                                                   lambda: self.create_car_matrices(car_params))
 
         # Place medical clients in model
         self.create_client_locations(client_params, width, height)
@@ -213,7 +234,7 @@ class BaseModel(Model):
         self.create_drones(self.num_drones, drone_params)
 
         # Place cars
-        self.create_cars(1, car_params, self.clients)
+        self.create_cars(self.num_cars, car_params, self.clients)
 
         # Create Control center
         self.command_center = CommandCenter(-1, self, car_params, drone_params)
@@ -225,6 +246,31 @@ class BaseModel(Model):
         else:
             self.client_dc = None
 
+        # Replace the hot methods of the agents by timed versions, nothing is replaced when instrumentation is off
+        if self.instrumentation is not None:
+            self.instrumentation.attach(self)
+
+    def set_delivery_mode(self, delivery_mode):
+        """
+        Function that sets the delivery mode and the route types that follow from it
+
+        :param delivery_mode: safe, fast or combi
+        :return:
+        """
+        self.delivery_mode = delivery_mode
+        self.reposition_mode = "safe"                                               # by default repositioning is done using the safe option
+        if self.delivery_mode == "fast":                                            # only reposition using the fast option when deliverymode is set to fast
+            self.reposition_mode = "fast"
+        self.considered_delivery_modes = []                                         # List that contains the deliverymodes that should
+                                                                                    # be used when making bids, this list only contains
+                                                                                    # safe or fast for their respective modes, and contains
+                                                                                    # both when using combi, thus a list is needed
+        if self.delivery_mode == "fast" or self.delivery_mode == "combi":
+            self.considered_delivery_modes.append("fast")
+
+        if self.delivery_mode == "safe" or self.delivery_mode == "combi":
+            self.considered_delivery_modes.append("safe")
+
     def create_drone_time_matrix(self, drone_params):
         """
         Function that processes and complements the route matrices created in the pre-processing module
@@ -233,42 +279,26 @@ class BaseModel(Model):
         :return: time matrix
         """
 
-        # Matrix containing the route travel time when taking the risk minimized option
-        risk_drone_matrix = np.zeros_like(drone_params["distanceMatrix"])
-        # Matrix containing the route travel time when taking the fast route
-        fast_drone_matrix = np.zeros_like(drone_params["directDistanceMatrix"])
-
         drone_speed = drone_params["speed"] / 3.6                           # convert km/h to m/s
         take_off_time = drone_params["takeOffTime"]
         landing_time = drone_params["landTime"]
 
-        for i in range(self.num_locations):                                 # loop over all locations (medical and MDS hubs)
-            for j in range(self.num_locations):
-                if i == j:                                                  # No route is needed when location A = location B
-                    risk_drone_matrix[i, j] = 0
-                    risk_drone_matrix[i, j] = 0
-                else:
-                    # Check if a risk-averse route exists between these hospitals
-                    if drone_params["distanceMatrix"][i, j] > 10000000:
-                        risk_drone_matrix[i, j] = -1
-                    else:
-                        # Compute travel time in seconds from route distance
-                        risk_drone_matrix[i, j] = round(
-                            drone_params["distanceMatrix"][i, j] / drone_speed
-                            + take_off_time
-                            + landing_time
-                        )
-
-                    # Check if a fast route exists between these hospitals
-                    if drone_params["directDistanceMatrix"][i, j] > 10000000:
-                        fast_drone_matrix[i, j] = -1
-                    else:
-                        # Compute traveltime in seconds from route distance
-                        fast_drone_matrix[i, j] = round(
-                            drone_params["directDistanceMatrix"][i, j] / drone_speed
-                            + take_off_time
-                            + landing_time
-                        )
+        # No route is needed when location A = location B
+        same_location = np.eye(self.num_locations, dtype=bool)
+
+        def route_time_matrix(distance_matrix):
+            # Compute travel time in seconds from route distance, routes that do not exist are set to -1
+            time_matrix = np.where(distance_matrix > 10000000, -1,
+                                   np.round(distance_matrix / drone_speed + take_off_time + landing_time))
+            time_matrix[same_location] = 0
+
+            return time_matrix.astype(distance_matrix.dtype)
+
+        # Matrix containing the route travel time when taking the risk minimized option
+        risk_drone_matrix = route_time_matrix(drone_params["distanceMatrix"])
+        # Matrix containing the route travel time when taking the fast route
+        fast_drone_matrix = route_time_matrix(drone_params["directDistanceMatrix"])
+
         # Set up dictionary to contain all matrices
         matrices = dict()
         matrices["Distance"] = {}
@@ -303,72 +333,44 @@ class BaseModel(Model):
         :return: car matrices
         """
 
-        # Get the matrices of the modeled day of week
-        original_time_matrices = car_params["timeMatrix"][self.day]
-        distance_matrices = car_params["distanceMatrix"][self.day]
-
-        # initialise dictionaries
-        risk_matrix_safe = {}
-        time_matrix_safe = {}
-        risk_matrix_fast = {}
-        time_matrix_fast = {}
-
-        # Loop over all hours of the day
-        for hour in range(24):
-            risk_matrix_safe[hour] = np.zeros_like(distance_matrices[hour], dtype=float)
-            time_matrix_safe[hour] = np.zeros_like(distance_matrices[hour])
-            risk_matrix_fast[hour] = np.zeros_like(distance_matrices[hour], dtype=float)
-            time_matrix_fast[hour] = np.zeros_like(distance_matrices[hour])
-
-            leaving_time = car_params["leavingTime"]
-            arrival_time = car_params["arrivalTime"]
-            emergency_risk = car_params["emergencyRisk"]                        # injuries/ hour
-            normal_risk = car_params["normalRisk"]                              # injuries/km
-            speeding_factor = car_params["speedingFactor"]                      # The factor with which travel time is
+        leaving_time = car_params["leavingTime"]
+        arrival_time = car_params["arrivalTime"]
+        emergency_risk = car_params["emergencyRisk"]                            # injuries/ hour
+        normal_risk = car_params["normalRisk"]                                  # injuries/km
+        speeding_factor = car_params["speedingFactor"]                          # The factor with which travel time is
                                                                                 # reduced when using lights and sirens
-            for i in range(self.num_locations):
-                for j in range(self.num_locations):
-                    if i == j:
-                        risk_matrix_safe[hour][i, j] = 0
-                        time_matrix_safe[hour][i, j] = 0
-                        risk_matrix_fast[hour][i, j] = 0
-                        time_matrix_fast[hour][i, j] = 0
-                        distance_matrices[hour][i, j] = 0
-                    else:
-                        time = original_time_matrices[hour][i, j]
-                        distance = distance_matrices[hour][i, j]
-                        fast_time = time / speeding_factor
-
-                        risk_matrix_safe[hour][i, j] = (distance * normal_risk)
-                        time_matrix_safe[hour][i, j] = round(time + leaving_time + arrival_time)
-                        risk_matrix_fast[hour][i, j] = (fast_time * emergency_risk / (60 * 60))
-                        time_matrix_fast[hour][i, j] = round(fast_time + leaving_time + arrival_time)
+
+        # Stack the matrices of the modeled day of week into (hour, origin, destination) tensors
+        time_tensor = np.stack([car_params["timeMatrix"][self.day][hour] for hour in range(24)]).astype(float)
+        distance_tensor = np.stack([car_params["distanceMatrix"][self.day][hour] for hour in range(24)]).astype(float)
+        fast_time_tensor = time_tensor / speeding_factor
+
+        risk_tensor_safe = distance_tensor * normal_risk
+        time_tensor_safe = np.round(time_tensor + leaving_time + arrival_time)
+        risk_tensor_fast = fast_time_tensor * emergency_risk / (60 * 60)
+        time_tensor_fast = np.round(fast_time_tensor + leaving_time + arrival_time)
+
+        # No ride is needed when location A = location B
+        same_location = np.eye(self.num_locations, dtype=bool)
+        for tensor in [distance_tensor, risk_tensor_safe, time_tensor_safe, risk_tensor_fast, time_tensor_fast]:
+            tensor[:, same_location] = 0
 
         # Create dict that will contain all matrices, similar to drones
+        # All matrices are specified for each hour of the day, indexed as [hour, origin, destination]
         matrices = dict()
         matrices["Distance"] = {}
         matrices["Time"] = {}
         matrices["Risk"] = {}
         matrices["Emission"] = {}
-        matrices["Distance"]["safe"] = {}
-        matrices["Distance"]["fast"] = {}
-        matrices["Time"]["safe"] = {}
-        matrices["Time"]["fast"] = {}
-        matrices["Risk"]["safe"] = {}
-        matrices["Risk"]["fast"] = {}
-        matrices["Emission"]["safe"] = {}
-        matrices["Emission"]["fast"] = {}
-
-        # All matrices are specified for each hour of the day
-        for hour in range(24):
-            matrices["Distance"]["safe"][hour] = distance_matrices[hour].astype(float)
-            matrices["Distance"]["fast"][hour] = distance_matrices[hour].astype(float)
-            matrices["Time"]["safe"][hour] = time_matrix_safe[hour].astype(float)
-            matrices["Time"]["fast"][hour] = time_matrix_fast[hour].astype(float)
-            matrices["Risk"]["safe"][hour] = risk_matrix_safe[hour].astype(float)
-            matrices["Risk"]["fast"][hour] = risk_matrix_fast[hour].astype(float)
-            matrices["Emission"]["safe"][hour] = (distance_matrices[hour] * car_params["emmissionPerKm"]).astype(float)
-            matrices["Emission"]["fast"][hour] = (distance_matrices[hour] * car_params["emmissionPerKm"]).astype(float)
+
+        matrices["Distance"]["safe"] = distance_tensor
+        matrices["Distance"]["fast"] = distance_tensor
+        matrices["Time"]["safe"] = time_tensor_safe
+        matrices["Time"]["fast"] = time_tensor_fast
+        matrices["Risk"]["safe"] = risk_tensor_safe
+        matrices["Risk"]["fast"] = risk_tensor_fast
+        matrices["Emission"]["safe"] = distance_tensor * car_params["emmissionPerKm"]
+        matrices["Emission"]["fast"] = distance_tensor * car_params["emmissionPerKm"]
 
         return matrices
 
@@ -391,13 +393,19 @@ class BaseModel(Model):
         # Obtain hospital names
         client_names = create_client_names(client_params)
 
+        # Index of each client by name, so request destinations can be resolved directly
+        self.client_indices = {name: i for i, name in enumerate(client_names)}
+
+        # Split the requests per origin once
+        requests_per_origin = dict(tuple(self.request_input.groupby('origin', sort=False)))
+
         # Create clients
         for i, client in enumerate(client_params):
 
             # Place the client on the grid
             position = rowColtoXY(client[0], width, height)
             name = client_names[i]
-            requests = self.request_input[self.request_input['origin'] == name]
+            requests = requests_per_origin.get(name, self.request_input.iloc[:0])
 
             client_agent = Client(i, self, position, requests, name)
 
@@ -414,7 +422,23 @@ class BaseModel(Model):
         """
         total_vehicles = self.num_drones
 
-        self.spawn_locations = rd.sample(self.clients, total_vehicles)
+        spawn_indices = self.spawn_rng.choice(len(self.clients), total_vehicles, replace=False)
+        self.spawn_locations = [self.clients[i] for i in spawn_indices]
+
+    def draw_travel_delay(self):
+        """
+        Function that returns the next draw of the travel delay stream
+
+        :return: uniform draw between 0 and 1
+        """
+        if self.delay_draw_index == len(self.delay_draws):
+            self.delay_draws = self.delay_rng.random(1024)
+            self.delay_draw_index = 0
+
+        draw = self.delay_draws[self.delay_draw_index]
+        self.delay_draw_index += 1
+
+        return draw
 
     def create_drones(self, num_drones, drone_params):
         """
@@ -425,12 +449,15 @@ class BaseModel(Model):
         :return:
         """
 
+        # Drone ids start at 100, or after the client ids when there are more clients
+        first_id = max(100, self.num_locations)
+
         # Loop over the total number of drones
         for i in range(num_drones):
             # Determine the spawn location
             spawn_location = self.spawn_locations[i]
 
-            drone = Drone(100 + i, self, drone_params, spawn_location)
+            drone = Drone(first_id + i, self, drone_params, spawn_location)
 
             self.schedule.add(drone)
             self.vehicles.append(drone)
@@ -445,13 +472,16 @@ class BaseModel(Model):
         :param car_params: Car specifications
         :return:
         """
+        # Car ids start at 200, or after the drone ids when there are more clients and drones
+        first_id = max(200, max(100, self.num_locations) + self.num_drones)
+
         # Loop over the total number of cars
         for i in range(num_cars):
 
-            spawn_location = rd.choice(client_params)
+            spawn_location = client_params[self.spawn_rng.integers(len(client_params))]
 
             # Create the agent
-            car = Car(200 + i, self, car_params, spawn_location)
+            car = Car(first_id + i, self, car_params, spawn_location)
 
             self.schedule.add(car)
             self.grid.place_agent(car, spawn_location.pos)
@@ -473,8 +503,15 @@ class BaseModel(Model):
     def step(self):
         """Advance the model by one step"""
 
+        # When agents are only activated for events, jump straight to the next minute in which something happens
+        if self.activation != "tick":
+            self.time = self.schedule.next_event_time(self.time, self.max_steps + 1)
+
         # Check if the day has ended and all orders have been completed
         if len(self.requests) == 0 and self.time > self.max_steps:
+            if self.activation != "tick":
+                # Account for the minutes in which agents were not activated
+                self.schedule.skip_to(self.time)
             self.compute_model_outputs()
             self.running = False
 
@@ -485,6 +522,52 @@ class BaseModel(Model):
 
         self.time += 1
 
+    def static_objects(self):
+        """
+        Function that lists the objects that do not change during a run, snapshots refer to these instead of copying them
+
+        :return: list of objects
+        """
+        static = [self.request_input]
+
+        for agent_type in self.matrices.values():
+            for kind in agent_type.values():
+                static.extend(kind.values())
+
+        for client in self.clients:
+            static.extend(client.static_objects())
+
+        return static
+
+    def snapshot(self):
+        """
+        Function that captures the current state of the model, from which it can be continued later on
+
+        :return: ModelSnapshot
+        """
+        return take_snapshot(self)
+
+    @staticmethod
+    def restore(snapshot):
+        """
+        Function that creates a model that continues from a snapshot
+
+        :param snapshot: ModelSnapshot
+        :return: BaseModel
+        """
+        return restore_snapshot(snapshot)
+
+    def instrumentation_results(self):
+        """
+        Function that returns the counters and timers of the hot paths of the model
+
+        :return: dict of counts and seconds, empty when instrumentation is off
+        """
+        if self.instrumentation is None:
+            return {}
+
+        return self.instrumentation.results()
+
     def compute_model_outputs(self):
         """
         Function that is called at the end of the simulation to compute all desired KPIs
@@ -577,6 +660,9 @@ class BaseModel(Model):
             "Deliveries matrix": self.track_deliveries_matrix,
         }
 
+        if self.report_instrumentation:
+            self.model_reporters.update(self.instrumentation_results())
+
     def print_step_state(self):
         """
         Helper function that can be used to evaluate simulation functioning
@@ -588,7 +674,7 @@ class BaseModel(Model):
                 "Agent", "Ori", "Des", "ETD", "ETA", "Use case", "Orders"
             )
         )
-        for item in self.command_center.scheduled_deliveries:
+        for item in sorted(self.command_center.scheduled_deliveries, key=lambda x: x.etd):
             print(
                 "{:<15} {:<5} {:<5} {:<8} {:<8} {:<8} {:<8}".format(
                     item.vehicle.type + " " + str(item.vehicle.unique_id),
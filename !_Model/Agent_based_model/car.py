@@ -7,6 +7,7 @@ from Local_Mesa import Agent
 from schedule import ScheduleItem
 from auction import Bid
 from helper_functions import errorMessage, time_tick_to_hour
+import numpy as np
 
 class Car(Agent):
     """Agent representing a car or other road vehicle"""
@@ -37,6 +38,7 @@ class Car(Agent):
         self.capacity = car_params["capacity"]
         self.current_end_location = self.location
         self.next_time_available = 0
+        self.fleet_index = None                     # index in the fleet arrays of the command center
 
     def determine_ride_details(self, origin, destination, mode, dep_time):
         """
@@ -49,13 +51,14 @@ class Car(Agent):
         :return: Dict containing distance, time, risk, emission, cost, mode
         """
 
-        hour = time_tick_to_hour(dep_time)
+        # Matrices are (hour, origin, destination) tensors
+        route = (time_tick_to_hour(dep_time), origin.matrix_index, destination.matrix_index)
 
-        distance = self.matrices["Distance"][mode][hour][origin.matrix_index, destination.matrix_index]
-        emmission = self.matrices["Emission"][mode][hour][origin.matrix_index, destination.matrix_index]
+        distance = self.matrices["Distance"][mode][route]
+        emmission = self.matrices["Emission"][mode][route]
 
-        time = round(self.matrices["Time"][mode][hour][origin.matrix_index, destination.matrix_index] / 60)
-        risk = self.matrices["Risk"][mode][hour][origin.matrix_index, destination.matrix_index]
+        time = round(self.matrices["Time"][mode][route] / 60)
+        risk = self.matrices["Risk"][mode][route]
         cost = distance * self.cost_per_km
 
         return {
@@ -68,6 +71,32 @@ class Car(Agent):
         }
 
 
+    @staticmethod
+    def determine_fleet_ride_details(matrices, origins, destinations, mode, dep_times, cost_per_km):
+        """
+        Vectorized version of determine_ride_details that extracts the KPIs of many rides at once
+
+        :param matrices: Car matrices of the model
+        :param origins: Array of origin matrix indices
+        :param destinations: Array of destination matrix indices
+        :param mode: Fast of safe
+        :param dep_times: Array of departure times
+        :param cost_per_km: Array of costs per km of the cars
+        :return: Dict containing arrays of distance, time, risk, emission, cost and whether the ride is possible
+        """
+        # Same as time_tick_to_hour
+        route = (np.minimum(dep_times // 60, 23).astype(int), origins, destinations)
+        distance = matrices["Distance"][mode][route]
+
+        return {
+            "possible": np.ones(len(origins), dtype=bool),
+            "distance": distance,
+            "time": np.round(matrices["Time"][mode][route] / 60),
+            "risk": matrices["Risk"][mode][route],
+            "emmission": matrices["Emission"][mode][route],
+            "cost": distance * cost_per_km,
+        }
+
     def create_bid(self, origin, destination, request):
         """
         Create a bid between origin and destination for a specific request
@@ -77,6 +106,31 @@ class Car(Agent):
         :param order:
         :return:
         """
+        bids = []  # List that will contain all possible bids
+
+        # Create bids for all considered deliverymodes: safe,fast or both
+        for mode in self.model.considered_delivery_modes:
+            bids.append(self.create_mode_bid(origin, destination, request, mode))
+
+        # If bids are possible, sort the bids and return the best bid to the command center
+        if len(bids) > 0:
+            bids.sort()
+
+            return bids[0]
+        else:
+
+            return False
+
+    def create_mode_bid(self, origin, destination, request, mode):
+        """
+        Create a bid between origin and destination for a specific request and delivery mode
+
+        :param origin:
+        :param destination:
+        :param request:
+        :param mode: fast or safe
+        :return: Bid
+        """
 
         # if already a schedule continue from where the current schedule ends
         if len(self.schedule) > 0:
@@ -87,59 +141,45 @@ class Car(Agent):
         else:
             dep_time = self.model.time + round(self.TAT / 60)
             dep_loc = self.location
-        bids = []  # List that will contain all possible bids
 
+        bid_dep_time = dep_time
 
-        # Create bids for all considered deliverymodes: safe,fast or both
-        for mode in self.model.considered_delivery_modes:
-            bid_dep_time = dep_time
-
-            # List that will contain all schedule items that together comprimise the bid
-            schedule_items = []
-
-            # Bid KPIs
-            cost, emmissions, risk, eta = 0, 0, 0, 0
-
-            # Ride to pickup point is needed. Get the ride KPIs and update bid values accordingly
-            # and add scheduleItem to bid
-            if origin != dep_loc:
-                ride_to_origin_details = self.determine_ride_details(dep_loc, origin, mode, bid_dep_time)
-                ride_to_origin = ScheduleItem(self.model, dep_loc, origin, bid_dep_time,
-                                                bid_dep_time + ride_to_origin_details["time"],
-                                                ride_to_origin_details, self, None)
-
-                bid_dep_time += ride_to_origin_details["time"] + round(self.TAT / 60)
-                cost += ride_to_origin_details["cost"]
-                emmissions += ride_to_origin_details["emmission"]
-                risk += ride_to_origin_details["risk"]
-                schedule_items.append(ride_to_origin)
-
-            # Get the delivery ride KPIs and update bid values accordingly and add scheduleItem to bid
-            ride_to_destination_details = self.determine_ride_details(origin, destination, mode, bid_dep_time)
-
-            ride_to_destination = ScheduleItem(self.model, origin, destination, bid_dep_time,
-                                                bid_dep_time + ride_to_destination_details["time"],
-                                                ride_to_destination_details, self, request)
-
-            eta = bid_dep_time + ride_to_destination_details["time"]
-            bid_dep_time += ride_to_destination_details["time"] + round(self.TAT / 60)
-            emmissions += ride_to_destination_details["emmission"]
-            risk += ride_to_destination_details["risk"]
-            cost += ride_to_destination_details["cost"]
-            schedule_items.append(ride_to_destination)
-
-            # Create the total bid and add it to the list
-            bid = Bid(self.model, eta, emmissions, cost, risk, schedule_items, mode, self, request)
-            bids.append(bid)
+        # List that will contain all schedule items that together comprimise the bid
+        schedule_items = []
 
-        # If bids are possible, sort the bids and return the best bid to the command center
-        if len(bids) > 0:
-            bids.sort()
+        # Bid KPIs
+        cost, emmissions, risk, eta = 0, 0, 0, 0
 
-            return bids[0]
-        else:
+        # Ride to pickup point is needed. Get the ride KPIs and update bid values accordingly
+        # and add scheduleItem to bid
+        if origin != dep_loc:
+            ride_to_origin_details = self.determine_ride_details(dep_loc, origin, mode, bid_dep_time)
+            ride_to_origin = ScheduleItem(self.model, dep_loc, origin, bid_dep_time,
+                                            bid_dep_time + ride_to_origin_details["time"],
+                                            ride_to_origin_details, self, None)
 
-            return False
+            bid_dep_time += ride_to_origin_details["time"] + round(self.TAT / 60)
+            cost += ride_to_origin_details["cost"]
+            emmissions += ride_to_origin_details["emmission"]
+            risk += ride_to_origin_details["risk"]
+            schedule_items.append(ride_to_origin)
+
+        # Get the delivery ride KPIs and update bid values accordingly and add scheduleItem to bid
+        ride_to_destination_details = self.determine_ride_details(origin, destination, mode, bid_dep_time)
+
+        ride_to_destination = ScheduleItem(self.model, origin, destination, bid_dep_time,
+                                            bid_dep_time + ride_to_destination_details["time"],
+                                            ride_to_destination_details, self, request)
+
+        eta = bid_dep_time + ride_to_destination_details["time"]
+        bid_dep_time += ride_to_destination_details["time"] + round(self.TAT / 60)
+        emmissions += ride_to_destination_details["emmission"]
+        risk += ride_to_destination_details["risk"]
+        cost += ride_to_destination_details["cost"]
+        schedule_items.append(ride_to_destination)
+
+        # Create the total bid
+        return Bid(self.model, eta, emmissions, cost, risk, schedule_items, mode, self, request)
 
     def step(self):
         """
@@ -193,6 +233,36 @@ class Car(Agent):
 
         self.update_model_variables()
 
+    def next_event_time(self, time):
+        """
+        Determine the first step from time onwards in which something happens to the car:
+        the departure of the next ride when idle, or the arrival otherwise
+
+        :param time: earliest step
+        :return: step, or None if nothing is planned
+        """
+        if len(self.schedule) == 0:
+            return None
+
+        if self.status == "Idle":
+            event_time = self.schedule[0].etd
+        else:
+            event_time = self.eta
+
+        if event_time < time:
+            return None
+
+        return event_time
+
+    def skip_steps(self, steps):
+        """
+        Process steps in which the car was not activated, its status did not change during these steps
+
+        :param steps: number of skipped steps
+        :return:
+        """
+        self.update_model_variables(steps)
+
     def arrive(self):
         """
         Function that is activated at the end of a ride
@@ -265,25 +335,26 @@ class Car(Agent):
                 i += 1
                 propagating_delay = new_first_departure_time - self.schedule[i].etd
 
-    def update_model_variables(self):
+    def update_model_variables(self, steps=1):
         """
         Update the model KPIs
 
+        :param steps: number of steps spent in the current status
         :return:
         """
         if self.status == "Idle":
-            self.model.idle_time[self.type] += 1
+            self.model.idle_time[self.type] += steps
 
         elif self.status == "delayed":
-            self.model.delay_time[self.type] += 1
+            self.model.delay_time[self.type] += steps
 
         elif self.status == "Driving":
 
             if self.empty:
-                self.model.empty_time[self.type][self.mode] += 1
+                self.model.empty_time[self.type][self.mode] += steps
 
             else:
-                self.model.delivery_time[self.type][self.mode] += 1
+                self.model.delivery_time[self.type][self.mode] += steps
         else:
             print(f"Status {self.status}")
             errorMessage("Car status error")
@@ -5,6 +5,7 @@ Created on Thu Jul 27 2023
 """
 from Local_Mesa import Agent
 from request import Request
+import numpy as np
 
 class Client(Agent):
     """Agent representing a client of Medical Drone Service"""
@@ -23,58 +24,94 @@ class Client(Agent):
 
         self.pos = location
 
+        self.create_arrival_index(requests)
 
-    def step(self):
+    def create_arrival_index(self, requests):
         """
-        Defines what happens each step of the model.
+        Create an index of the demand schedule, so requests can be created without searching the schedule
 
-        Here: client checks its demand schedule and creates an order if needed.
+        The requests are stored in compact arrays sorted by start time. The requests that arrive
+        in minute t are found at positions arrival_offsets[t] up to arrival_offsets[t + 1].
+
+        :param requests: demand schedule, indexed by start time
         :return:
         """
+        requests = requests[requests.index < self.model.max_steps]
+        requests = requests.iloc[np.argsort(requests.index.to_numpy(), kind="stable")]
 
-        if self.model.time < self.model.max_steps:
+        self.request_times = requests.index.to_numpy()
+        self.request_destinations = np.array([self.model.client_indices.get(destination, -1)
+                                              for destination in requests['destination']], dtype=int)
+        self.request_deadlines = requests['deadline'].to_numpy()
+        self.request_types = requests['type'].to_numpy()
+        self.request_masses = requests['mass'].to_numpy()
+        self.request_volumes = requests['volume'].to_numpy()
+        self.request_ids = requests['id'].to_numpy()
 
-            if self.model.time in list(self.demand_schedule.index):
+        self.arrival_offsets = np.searchsorted(self.request_times, np.arange(self.model.max_steps + 1))
 
-                request = self.demand_schedule.loc[self.model.time]
+    def static_objects(self):
+        """
+        The demand schedule and its index do not change during a run
 
-                # For a single request
-                if request.__class__.__name__ == 'Series':
-                    # Retrieve order specifications
-                    target = request['destination']
-                    target = next((client for client in self.model.clients if client.name == target), None)
-                    deadline_type = request['type']
-                    deadline = request['deadline']
-                    mass = request['mass']
-                    volume = request['volume']
-                    id = 5000 + request['id']
+        :return: list of objects
+        """
+        return [self.demand_schedule, self.request_times, self.request_destinations, self.request_deadlines,
+                self.request_types, self.request_masses, self.request_volumes, self.request_ids, self.arrival_offsets]
 
-                    # model, deadline, urgency, hospital, id
-                    request = Request(self.model, deadline, deadline_type, self, target, id, mass, volume)
-                    self.model.requests.append(request)
-                    self.model.request_counter += 1
+    def next_event_time(self, time):
+        """
+        Determine the first step from time onwards in which the client creates a request
+
+        :param time: earliest step
+        :return: step, or None if no more requests will be created
+        """
+        i = np.searchsorted(self.request_times, time)
 
-                    self.model.command_center.new_demand(request)
+        if i < len(self.request_times):
+            return int(self.request_times[i])
 
-                # For multiple requests at the same time
-                else:
-                    for index, row in request.iterrows():
-                        # Retrieve order specifications
-                        target = row['destination']
-                        target = next((client for client in self.model.clients if client.name == target), None)
-                        deadline_type = row['type']
-                        deadline = row['deadline']
-                        mass = row['mass']
-                        volume = row['volume']
-                        id = row['id']
+        return None
 
-                        # model, deadline, urgency, hospital, id
-                        request = Request(self.model, deadline, deadline_type, self, target, id, mass, volume)
-                        self.model.requests.append(request)
-                        self.model.request_counter += 1
+    def skip_steps(self, steps):
+        """
+        Nothing happens to a client in steps in which it creates no requests
 
-                        self.model.command_center.new_demand(request)
+        :param steps: number of skipped steps
+        :return:
+        """
+        pass
 
+    def step(self):
+        """
+        Defines what happens each step of the model.
 
+        Here: client checks its demand schedule and creates an order if needed.
+        :return:
+        """
 
+        if self.model.time < self.model.max_steps:
 
+            first = self.arrival_offsets[self.model.time]
+            last = self.arrival_offsets[self.model.time + 1]
+
+            for i in range(first, last):
+                # Retrieve order specifications
+                destination = self.request_destinations[i]
+                target = self.model.clients[destination] if destination >= 0 else None
+                deadline_type = self.request_types[i]
+                deadline = self.request_deadlines[i]
+                mass = self.request_masses[i]
+                volume = self.request_volumes[i]
+                id = self.request_ids[i]
+
+                # A single request in a minute has always been numbered from 5000
+                if last - first == 1:
+                    id += 5000
+
+                # model, deadline, urgency, hospital, id
+                request = Request(self.model, deadline, deadline_type, self, target, id, mass, volume)
+                self.model.requests.append(request)
+                self.model.request_counter += 1
+
+                self.model.command_center.new_demand(request)
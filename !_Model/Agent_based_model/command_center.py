@@ -5,7 +5,12 @@ Created on Thu 3 August 2023
 """
 from Local_Mesa import Agent
 import numpy as np
+from bisect import bisect_left, bisect_right, insort
+from itertools import count
 from helper_functions import errorMessage
+from auction import determine_bid_scores
+from drone import Drone
+from car import Car
 
 
 class CommandCenter(Agent):
@@ -22,9 +27,14 @@ class CommandCenter(Agent):
         self.TATs = {"Car": round(car_params["TAT"] / 60),
                      "Drone": round(drone_params["TAT"] / 60)}
 
-        self.scheduled_deliveries = []
+        self.scheduled_deliveries = set()                               # schedule items that have not been completed
         self.supply_overview = []
 
+        # Consolidation index: for each (origin, destination) the scheduled items that have capacity left,
+        # as a list of (eta, number, item) ordered by eta
+        self.consolidation_index = {}
+        self.consolidation_counter = count()
+
         # dict of arrays stating the time it takes to supply hospital 1 [first index] from hospital 2 [second index]
         self.travel_times = ( {} )
 
@@ -37,6 +47,9 @@ class CommandCenter(Agent):
 
         self.compute_costs()
 
+        # Arrays describing the fleet, used to evaluate the bids of all vehicles at once
+        self.create_fleet_arrays()
+
     def new_demand(self, request):
 
         """
@@ -51,7 +64,10 @@ class CommandCenter(Agent):
         # Check if the new demand can be added to already planned (delivery) rides
         if self.assign_to_existing_schedule(request, origin, destination) == False:
             # Create a new task allocation auction
-            self.auction(origin, destination, request)
+            if self.model.vectorized_auction:
+                self.vectorized_auction(origin, destination, request)
+            else:
+                self.auction(origin, destination, request)
 
     def compute_costs(self):
         """
@@ -84,26 +100,75 @@ class CommandCenter(Agent):
         :return: Assigned: Whether the request has been assigned to an existing ride
         """
 
-        assigned = False
+        items = self.consolidation_index.get((origin.matrix_index, destination.matrix_index), [])
+
+        # The first item with capacity left that arrives after the current time
+        i = bisect_right(items, (self.model.time, float("inf")))
+
+        if i < len(items):
+            eta, _, item = items[i]
+
+            # Check if it arrives before the deadline
+            if eta < request.deadline:
+                item.requests.append(request)
+                request.assignedVehicle = item.vehicle
 
-        # Check if the order can be added to current schedule items
-        for item in self.scheduled_deliveries:
-            if (
-                item.eta > self.model.time
-                and item.eta < request.deadline
-                and item.origin == origin
-                and item.destination == destination
-                and assigned == False
-            ):
-                # Check if the timing and route matches
-                # Check if additional capacity is present so deliveries can be combined
-                if item.vehicle.capacity > len(item.requests):
-                    item.requests.append(request)
-                    assigned = True
-                    request.assignedVehicle = item.vehicle
+                if item.vehicle.capacity <= len(item.requests):
+                    self.remove_from_consolidation_index(item)
 
-        # Return true if the order is succesfully assigned to an already existing schedule item
-        return assigned
+                # Return true if the order is succesfully assigned to an already existing schedule item
+                return True
+
+        return False
+
+    def add_scheduled_delivery(self, item):
+        """
+        Add a schedule item of a vehicle to the scheduled deliveries
+
+        :param item: ScheduleItem
+        :return:
+        """
+        self.scheduled_deliveries.add(item)
+
+        if item.vehicle.capacity > len(item.requests):
+            entry = (item.eta, next(self.consolidation_counter), item)
+            item.consolidation_entry = entry
+            insort(self.consolidation_index.setdefault((item.origin.matrix_index, item.destination.matrix_index), []),
+                   entry)
+
+    def remove_scheduled_delivery(self, item):
+        """
+        Remove a completed schedule item from the scheduled deliveries
+
+        :param item: ScheduleItem
+        :return:
+        """
+        self.scheduled_deliveries.discard(item)
+        self.remove_from_consolidation_index(item)
+
+    def update_scheduled_delivery(self, item):
+        """
+        Reorder a scheduled item in the consolidation index after its eta has changed
+
+        :param item: ScheduleItem
+        :return:
+        """
+        if item in self.scheduled_deliveries:
+            self.remove_scheduled_delivery(item)
+            self.add_scheduled_delivery(item)
+            self.update_fleet_arrays(item.vehicle)
+
+    def remove_from_consolidation_index(self, item):
+        """
+        Remove a schedule item from the consolidation index, if it is in there
+
+        :param item: ScheduleItem
+        :return:
+        """
+        if item.consolidation_entry is not None:
+            items = self.consolidation_index[(item.origin.matrix_index, item.destination.matrix_index)]
+            items.pop(bisect_left(items, item.consolidation_entry))
+            item.consolidation_entry = None
 
     def auction(self, origin, destination, request):
         """
@@ -134,27 +199,183 @@ class CommandCenter(Agent):
         # Order the bids
         bids.sort()
 
+        self.process_auction_result(bids[0] if len(bids) > 0 else None, idle_vehicles, request)
+
+    def process_auction_result(self, best_bid, idle_vehicles, request):
+        """
+        Assign the request to the vehicle with the winning bid
+
+        :param best_bid: Winning bid, or None if no vehicle can perform the delivery
+        :param idle_vehicles: Whether an idle vehicle was available
+        :param request: Request object
+        :return:
+        """
         # No vehicle can perform the delivery
-        if len(bids) == 0:
+        if best_bid is None:
             self.model.no_delivery_possible.append(request)
             self.model.demands.remove(request)
             request.parent.openDemand -= 1
 
         # Pick the winning bid
         else:
-            best_bid = bids[0]
             request.assigned_vehicle = best_bid.vehicle
 
             if best_bid.vehicle.status != "Idle" and idle_vehicles:
                 self.model.no_idle_vehicle_chosen += 1
 
             for item in best_bid.schedule_items:
-                self.scheduled_deliveries.append(item)
+                self.add_scheduled_delivery(item)
 
                 best_bid.vehicle.schedule.append(item)
                 best_bid.vehicle.nextTimeAvailable = item.eta
                 best_bid.vehicle.currentEndLocation = item.destination
 
-    def step(self):
-        self.scheduled_deliveries.sort(key=lambda x: x.etd)
+            # The schedule of the winning vehicle has changed
+            self.update_fleet_arrays(best_bid.vehicle)
+            self.model.schedule.wake(best_bid.vehicle)
+
+    def vectorized_auction(self, origin, destination, request):
+        """
+        Vectorized version of auction that evaluates the bids of all vehicles for all considered delivery modes
+        at once. Schedule items are only created for the winning bid.
+
+        :param origin: Origin of the request
+        :param destination: Destination of the request
+        :param request: Request object
+        :return:
+        """
+        vehicles = self.model.vehicles
+        modes = self.model.considered_delivery_modes
+
+        # Bid scores of each vehicle (rows) and delivery mode (columns), impossible bids are infinite
+        scores = np.full((len(vehicles), len(modes)), np.inf)
+
+        # Vehicles depart after their current schedule, or from now when they are idle
+        dep_times = np.maximum(self.fleet_end_times, self.model.time) + self.fleet_TATs
 
+        for vehicle_type, rows in self.fleet_types.items():
+            for j, mode in enumerate(modes):
+                eta, emmissions, cost, risk, possible = self.evaluate_fleet_bids(vehicle_type, rows, dep_times[rows],
+                                                                                 origin, destination, mode)
+                bid_scores = determine_bid_scores(self.model, eta, emmissions, cost, risk, request.deadline)
+                scores[rows, j] = np.where(possible, bid_scores, np.inf)
+
+        # Boolean that helps analyse if an idle vehicle is picked when one is available
+        idle_vehicles = any(vehicle.status == "Idle" for vehicle in vehicles)
+
+        best_bid = None
+
+        if scores.size > 0:
+            # The first minimum, which is the bid that sorting the bids of all vehicles would pick
+            best = np.argmin(scores)
+
+            if scores.flat[best] != np.inf:
+                vehicle = vehicles[best // len(modes)]
+                best_bid = vehicle.create_mode_bid(origin, destination, request, modes[best % len(modes)])
+
+        self.process_auction_result(best_bid, idle_vehicles, request)
+
+    def evaluate_fleet_bids(self, vehicle_type, rows, dep_times, origin, destination, mode):
+        """
+        Compute the KPIs of the bids of a group of vehicles of the same type, similar to create_mode_bid
+
+        :param vehicle_type: Drone or Car
+        :param rows: Fleet indices of the vehicles
+        :param dep_times: Array of the times the vehicles can depart
+        :param origin: Origin of the request
+        :param destination: Destination of the request
+        :param mode: Safe or fast
+        :return: Arrays of eta, emissions, cost, risk and whether the bid is possible
+        """
+        dep_locations = self.fleet_end_locations[rows]
+        TATs = self.fleet_TATs[rows]
+        costs_per_km = self.fleet_costs_per_km[rows]
+        origins = np.full(len(rows), origin.matrix_index)
+        destinations = np.full(len(rows), destination.matrix_index)
+
+        # A trip to the pickup point is needed
+        pickup = dep_locations != origin.matrix_index
+
+        to_origin = self.determine_fleet_details(vehicle_type, dep_locations, origins, mode, dep_times, costs_per_km)
+        bid_dep_times = dep_times + np.where(pickup, to_origin["time"] + TATs, 0)
+        to_destination = self.determine_fleet_details(vehicle_type, origins, destinations, mode, bid_dep_times,
+                                                      costs_per_km)
+
+        eta = bid_dep_times + to_destination["time"]
+        emmissions = np.where(pickup, to_origin["emmission"], 0) + to_destination["emmission"]
+        cost = np.where(pickup, to_origin["cost"], 0) + to_destination["cost"]
+        risk = np.where(pickup, to_origin["risk"], 0) + to_destination["risk"]
+        possible = to_destination["possible"] & (~pickup | to_origin["possible"])
+
+        return eta, emmissions, cost, risk, possible
+
+    def determine_fleet_details(self, vehicle_type, origins, destinations, mode, dep_times, costs_per_km):
+        """
+        Extract the KPIs of many trips of vehicles of the same type at once
+
+        :param vehicle_type: Drone or Car
+        :param origins: Array of origin matrix indices
+        :param destinations: Array of destination matrix indices
+        :param mode: Safe or fast
+        :param dep_times: Array of departure times
+        :param costs_per_km: Array of costs per km
+        :return: Dict of arrays
+        """
+        if vehicle_type == "Drone":
+            return Drone.determine_fleet_flight_details(self.model.matrices["Drone"], origins, destinations, mode,
+                                                        costs_per_km)
+        else:
+            return Car.determine_fleet_ride_details(self.model.matrices["Car"], origins, destinations, mode,
+                                                    dep_times, costs_per_km)
+
+    def create_fleet_arrays(self):
+        """
+        Create the arrays that describe where and when each vehicle finishes its current schedule
+
+        :return:
+        """
+        vehicles = self.model.vehicles
+
+        self.fleet_end_times = np.zeros(len(vehicles), dtype=int)
+        self.fleet_end_locations = np.array([vehicle.location.matrix_index for vehicle in vehicles], dtype=int)
+        self.fleet_TATs = np.array([round(vehicle.TAT / 60) for vehicle in vehicles], dtype=int)
+        self.fleet_costs_per_km = np.array([vehicle.cost_per_km for vehicle in vehicles], dtype=float)
+        self.fleet_types = {}
+
+        for i, vehicle in enumerate(vehicles):
+            vehicle.fleet_index = i
+            self.fleet_types.setdefault(vehicle.type, []).append(i)
+
+        self.fleet_types = {vehicle_type: np.array(rows) for vehicle_type, rows in self.fleet_types.items()}
+
+    def update_fleet_arrays(self, vehicle):
+        """
+        Update where and when a vehicle finishes its schedule after the schedule has changed
+
+        :param vehicle: Drone or Car
+        :return:
+        """
+        if vehicle.fleet_index is not None and len(vehicle.schedule) > 0:
+            self.fleet_end_times[vehicle.fleet_index] = vehicle.schedule[-1].eta
+            self.fleet_end_locations[vehicle.fleet_index] = vehicle.schedule[-1].destination.matrix_index
+
+    def next_event_time(self, time):
+        """
+        The command center only acts on new demand, so it never needs to be activated
+
+        :param time: earliest step
+        :return: None
+        """
+        return None
+
+    def skip_steps(self, steps):
+        """
+        Nothing happens to the command center in steps in which it is not activated
+
+        :param steps: number of skipped steps
+        :return:
+        """
+        pass
+
+    def step(self):
+        pass
@@ -40,6 +40,7 @@ class Drone(Agent):
         self.capacity = drone_params["capacity"]
         self.current_end_location = self.location
         self.next_time_available = 0
+        self.fleet_index = None                     # index in the fleet arrays of the command center
 
     def determine_flight_details(self, origin, destination, mode):
         """
@@ -50,16 +51,19 @@ class Drone(Agent):
         :return: Dict containing distance, time, risk, emission, cost, type
         """
 
+        route = (origin.matrix_index, destination.matrix_index)
+        flight_time = self.matrices["Time"][mode][route]
+
         # Check first whether flight is possible
-        if self.matrices["Time"][mode][origin.matrix_index, destination.matrix_index] == -1:
+        if flight_time == -1:
 
             return False
         else:
 
-            distance = self.matrices["Distance"][mode][origin.matrix_index, destination.matrix_index]
-            time = round(self.matrices["Time"][mode][origin.matrix_index, destination.matrix_index] / 60)
-            risk = self.matrices["Risk"][mode][origin.matrix_index, destination.matrix_index]
-            emmission = self.matrices["Emission"][mode][origin.matrix_index, destination.matrix_index]
+            distance = self.matrices["Distance"][mode][route]
+            time = round(flight_time / 60)
+            risk = self.matrices["Risk"][mode][route]
+            emmission = self.matrices["Emission"][mode][route]
             cost = distance * self.cost_per_km
 
             # Why is this adjusted?
@@ -75,6 +79,34 @@ class Drone(Agent):
                 "type": mode,
             }
 
+    @staticmethod
+    def determine_fleet_flight_details(matrices, origins, destinations, mode, cost_per_km):
+        """
+        Vectorized version of determine_flight_details that extracts the KPIs of many flights at once
+
+        :param matrices: Drone matrices of the model
+        :param origins: Array of origin matrix indices
+        :param destinations: Array of destination matrix indices
+        :param mode: Safe or fast (which route matrices should be used)
+        :param cost_per_km: Array of costs per km of the drones
+        :return: Dict containing arrays of distance, time, risk, emission, cost and whether the flight is possible
+        """
+        route = (origins, destinations)
+        flight_time = matrices["Time"][mode][route]
+        distance = matrices["Distance"][mode][route]
+
+        time = np.round(flight_time / 60)
+        time[time == 0] = 1
+
+        return {
+            "possible": flight_time != -1,
+            "distance": distance,
+            "time": time,
+            "risk": matrices["Risk"][mode][route],
+            "emmission": matrices["Emission"][mode][route],
+            "cost": distance * cost_per_km,
+        }
+
     def create_bid(self, origin, destination, request):
         """
         Create a bid between origin and destination for a specific request
@@ -84,6 +116,34 @@ class Drone(Agent):
         :param request: Request object
         :return: Best bid value
         """
+        # List that will contain all possible bids
+        bids = []
+
+        # Create bids for all considered delivery modes: safe,fast or both
+        for mode in self.model.considered_delivery_modes:
+
+            bid = self.create_mode_bid(origin, destination, request, mode)
+
+            if bid != False:
+                bids.append(bid)
+
+        # If bids are possible, sort the bids and return the best bid to the command center
+        if len(bids) > 0:
+            bids.sort()
+            return bids[0]
+        else:
+            return False
+
+    def create_mode_bid(self, origin, destination, request, mode):
+        """
+        Create a bid between origin and destination for a specific request and delivery mode
+
+        :param origin: Origin of request
+        :param destination: Destination of request
+        :param request: Request object
+        :param mode: Safe or fast
+        :return: Bid, or False if the flights are not possible
+        """
         # If a schedule already exists, continue from where the current schedule ends
         if len(self.schedule) > 0:
 
@@ -96,76 +156,56 @@ class Drone(Agent):
             dep_time = self.model.time + round(self.TAT / 60)
             dep_loc = self.location
 
-        # List that will contain all possible bids
-        bids = []
+        bid_dep_time = dep_time
 
-        # Create bids for all considered delivery modes: safe,fast or both
-        for mode in self.model.considered_delivery_modes:
-
-            bid_dep_time = dep_time
-
-            # Determine KPIs of delivery flight
-            flight_to_destination_details = self.determine_flight_details(origin, destination, mode)
-
-            # Only consider a bid when a flight is possible
-            if flight_to_destination_details != False:
+        # Determine KPIs of delivery flight
+        flight_to_destination_details = self.determine_flight_details(origin, destination, mode)
 
-                # List that will contain all schedule items that together compromise the bid
-                schedule_items = []
-
-                # Bid KPIs
-                cost, emmissions, risk, eta = 0, 0, 0, 0
-
-                bid_possible = True
+        # Only consider a bid when a flight is possible
+        if flight_to_destination_details == False:
+            return False
 
-                # Flight to pickup point is needed. Get the flight KPIs and update bid values
-                # accordingly and add schedule_item to bid
-                if origin != dep_loc:
+        # List that will contain all schedule items that together compromise the bid
+        schedule_items = []
 
-                    flight_to_origin_details = self.determine_flight_details(dep_loc, origin, mode)
+        # Bid KPIs
+        cost, emmissions, risk, eta = 0, 0, 0, 0
 
-                    if flight_to_origin_details != False:
+        # Flight to pickup point is needed. Get the flight KPIs and update bid values
+        # accordingly and add schedule_item to bid
+        if origin != dep_loc:
 
-                        flight_to_origin = ScheduleItem(self.model, dep_loc, origin, bid_dep_time,
-                                                                bid_dep_time + flight_to_origin_details["time"],
-                                                                flight_to_origin_details, self, None)
+            flight_to_origin_details = self.determine_flight_details(dep_loc, origin, mode)
 
-                        bid_dep_time += flight_to_origin_details["time"] + round(self.TAT / 60)
-                        cost += flight_to_origin_details["cost"]
-                        emmissions += flight_to_origin_details["emmission"]
-                        risk += flight_to_origin_details["risk"]
-                        schedule_items.append(flight_to_origin)
+            # Can't get to the pick up location
+            if flight_to_origin_details == False:
+                return False
 
-                    else:
-                        # Can't get to the pick up location
-                        bid_possible = False
+            flight_to_origin = ScheduleItem(self.model, dep_loc, origin, bid_dep_time,
+                                            bid_dep_time + flight_to_origin_details["time"],
+                                            flight_to_origin_details, self, None)
 
-                # Get the delivery flight KPIs and update bid values accordingly and add scheduleItem to bid
-                flight_to_destination = ScheduleItem(self.model, origin, destination, bid_dep_time,
-                                                                bid_dep_time + flight_to_destination_details["time"],
-                                                                flight_to_destination_details, self, request)
+            bid_dep_time += flight_to_origin_details["time"] + round(self.TAT / 60)
+            cost += flight_to_origin_details["cost"]
+            emmissions += flight_to_origin_details["emmission"]
+            risk += flight_to_origin_details["risk"]
+            schedule_items.append(flight_to_origin)
 
-                eta = bid_dep_time + flight_to_destination_details["time"]
-                bid_dep_time += flight_to_destination_details["time"] + round(self.TAT / 60)
-                emmissions += flight_to_destination_details["emmission"]
-                risk += flight_to_destination_details["risk"]
-                cost += flight_to_destination_details["cost"]
+        # Get the delivery flight KPIs and update bid values accordingly and add scheduleItem to bid
+        flight_to_destination = ScheduleItem(self.model, origin, destination, bid_dep_time,
+                                             bid_dep_time + flight_to_destination_details["time"],
+                                             flight_to_destination_details, self, request)
 
-                schedule_items.append(flight_to_destination)
+        eta = bid_dep_time + flight_to_destination_details["time"]
+        bid_dep_time += flight_to_destination_details["time"] + round(self.TAT / 60)
+        emmissions += flight_to_destination_details["emmission"]
+        risk += flight_to_destination_details["risk"]
+        cost += flight_to_destination_details["cost"]
 
-                # Create the total bid and add it to the list
-                if bid_possible:
-                    bid = Bid(self.model, eta, emmissions, cost, risk, schedule_items,
-                                        mode, self, request)
+        schedule_items.append(flight_to_destination)
 
-                    bids.append(bid)
-
-        # If bids are possible, sort the bids and return the best bid to the command center
-        if len(bids) > 0:
-            bids.sort()
-            return bids[0]
-        else:
-            return False
+        # Create the total bid
+        return Bid(self.model, eta, emmissions, cost, risk, schedule_items, mode, self, request)
 
     def step(self):
         """
@@ -222,6 +262,36 @@ class Drone(Agent):
 
         self.update_model_variables()
 
+    def next_event_time(self, time):
+        """
+        Determine the first step from time onwards in which something happens to the drone:
+        the departure of the next flight when idle, or the arrival otherwise
+
+        :param time: earliest step
+        :return: step, or None if nothing is planned
+        """
+        if len(self.schedule) == 0:
+            return None
+
+        if self.status == "Idle":
+            event_time = self.schedule[0].etd
+        else:
+            event_time = self.eta
+
+        if event_time < time:
+            return None
+
+        return event_time
+
+    def skip_steps(self, steps):
+        """
+        Process steps in which the drone was not activated, its status did not change during these steps
+
+        :param steps: number of skipped steps
+        :return:
+        """
+        self.update_model_variables(steps)
+
     def arrive(self):
         """
         Function that is activated at the end of a flight
@@ -304,25 +374,26 @@ class Drone(Agent):
                 if i > len(self.schedule) + 1:
                     errorMessage("Infinite while loop in drone.py, delay_schedule()")
 
-    def update_model_variables(self):
+    def update_model_variables(self, steps=1):
         """
         Update the model KPIs
 
+        :param steps: number of steps spent in the current status
         :return:
         """
         if self.status == "Idle":
-            self.model.idle_time[self.type] += 1
+            self.model.idle_time[self.type] += steps
 
         elif self.status == "Delayed":
-            self.model.delay_time[self.type] += 1
+            self.model.delay_time[self.type] += steps
 
         elif self.status == "Flying":
 
             if self.empty:
-                self.model.empty_time[self.type][self.mode] += 1
+                self.model.empty_time[self.type][self.mode] += steps
 
             else:
-                self.model.delivery_time[self.type][self.mode] += 1
+                self.model.delivery_time[self.type][self.mode] += steps
 
         else:
             errorMessage("Drone status error")
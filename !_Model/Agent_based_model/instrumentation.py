@@ -0,0 +1,134 @@
+"""
+Opt-in instrumentation of the hot paths of a model
+
+When instrumentation is enabled, the hot methods of the agents of a model are replaced, per instance, by wrappers
+that count the calls and accumulate the time spent in them. When it is disabled nothing is replaced, so the model
+runs without any overhead. Times are inclusive: the time of an auction includes the time of the bids made in it.
+"""
+from time import perf_counter
+
+# Methods that are timed, by the class of the agent
+TIMED_METHODS = {
+    "Client": ["step"],
+    "CommandCenter": ["new_demand", "assign_to_existing_schedule", "auction", "vectorized_auction",
+                      "evaluate_fleet_bids"],
+    "Drone": ["create_bid", "create_mode_bid", "update_position", "update_model_variables"],
+    "Car": ["create_bid", "create_mode_bid", "update_position", "update_model_variables"],
+}
+
+# Counters that are derived from the results of timed methods, by method name
+COUNTED_RESULTS = {
+    "assign_to_existing_schedule": "Consolidations",
+    "evaluate_fleet_bids": "Bids evaluated",
+}
+
+
+def _count_result(method_name, result):
+    """Number by which the counter of a timed method increases for a result"""
+    if method_name == "evaluate_fleet_bids":
+        return len(result[0])                           # one bid per vehicle in the group
+
+    return int(bool(result))
+
+
+class _TimedMethod:
+    """Picklable replacement of a method of an object, which counts its calls and measures their duration"""
+
+    def __init__(self, instrumentation, name, obj, method_name):
+
+        self.instrumentation = instrumentation
+        self.name = name
+        self.obj = obj
+        self.method_name = method_name
+
+    def __call__(self, *args, **kwargs):
+        start = perf_counter()
+        result = getattr(type(self.obj), self.method_name)(self.obj, *args, **kwargs)
+        self.instrumentation.add_time(self.name, perf_counter() - start)
+
+        if self.method_name in COUNTED_RESULTS:
+            self.instrumentation.count(COUNTED_RESULTS[self.method_name], _count_result(self.method_name, result))
+
+        return result
+
+
+class Instrumentation:
+    """
+    Counters and cumulative timers of a model
+
+    :param sampled: names of the timers of which the duration of every call is kept as well
+    """
+
+    def __init__(self, sampled=()):
+
+        self.calls = {}                                 # timer name -> number of calls
+        self.times = {}                                 # timer name -> cumulative seconds
+        self.counters = {}                              # counter name -> count
+        self.samples = {name: [] for name in sampled}   # timer name -> seconds of every call
+
+    def add_time(self, name, seconds):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.times[name] = self.times.get(name, 0.0) + seconds
+
+        if name in self.samples:
+            self.samples[name].append(seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def timed(self, obj, method_name, name=None):
+        """
+        Replace a method of an object by a timed version
+
+        :param obj: object of which the method is timed
+        :param method_name: name of the method
+        :param name: name of the timer, <type>.<method> when None
+        :return:
+        """
+        if name is None:
+            name = type(obj).__name__ + "." + method_name
+
+        setattr(obj, method_name, _TimedMethod(self, name, obj, method_name))
+
+    def attach(self, model):
+        """
+        Time the hot methods of all agents of a model and its data collector
+
+        :param model: BaseModel
+        :return:
+        """
+        for agent in model.schedule.agents:
+            for method_name in TIMED_METHODS.get(type(agent).__name__, []):
+                self.timed(agent, method_name)
+
+        if model.visualization and model.charts:
+            self.timed(model.dc, "collect")
+
+    def results(self):
+        """
+        Flat dict of all measurements
+
+        :return: dict of counts and seconds
+        """
+        # The vectorized auction evaluates the bids per group of vehicles, and only creates the winning bid
+        if "Bids evaluated" in self.counters:
+            bids_evaluated = self.counters["Bids evaluated"]
+        else:
+            bids_evaluated = self.calls.get("Drone.create_mode_bid", 0) + self.calls.get("Car.create_mode_bid", 0)
+
+        results = {
+            "Auctions": self.calls.get("CommandCenter.auction", 0) + self.calls.get("CommandCenter.vectorized_auction", 0),
+            "Bids evaluated": bids_evaluated,
+            "Schedule items": self.counters.get("Schedule items", 0),
+            "Consolidations": self.counters.get("Consolidations", 0),
+        }
+
+        # Every timed method is reported, also when it was not called, so all runs have the same results
+        timers = {class_name + "." + method_name
+                  for class_name, method_names in TIMED_METHODS.items() for method_name in method_names}
+
+        for name in sorted(timers | set(self.calls)):
+            results[name + " calls"] = self.calls.get(name, 0)
+            results[name + " time"] = self.times.get(name, 0.0)
+
+        return results
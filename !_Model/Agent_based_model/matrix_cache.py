@@ -0,0 +1,174 @@
+"""
+Content-addressed on-disk cache for the processed drone and car route matrices
+
+The matrices that BaseModel derives from drone_params and car_params only depend on the raw route matrices and
+a handful of parameters. They are stored once per unique input as .npy files and reopened memory-mapped, so
+runs that only differ in e.g. seed or delivery mode do not rebuild them.
+"""
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+# Increase when the way the matrices are processed changes, so old cache entries are no longer used
+CACHE_VERSION = 1
+
+# Parameters that affect the processed matrices
+DRONE_MATRIX_PARAMS = ["speed", "takeOffTime", "landTime", "emmissionPerKm"]
+CAR_MATRIX_PARAMS = ["leavingTime", "arrivalTime", "speedingFactor", "normalRisk", "emergencyRisk", "emmissionPerKm"]
+
+# Matrices that have already been opened in this process
+_opened_matrices = {}
+
+# Keys of read-only raw route matrices that have already been computed in this process, by the memory of the
+# matrices and the parameters. Matrices that can be changed in place are hashed every time
+_matrix_keys = {}
+
+# Maximum number of keys that are kept, the oldest key is dropped first
+MAX_MATRIX_KEYS = 16
+
+
+def hash_matrix_inputs(agent_type, arrays, params):
+    """
+    Compute the cache key of a set of raw route matrices and parameters
+
+    :param agent_type: Drone or Car
+    :param arrays: list of raw route matrices
+    :param params: dict of parameters that affect the processed matrices
+    :return: hexadecimal key
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{agent_type}-{CACHE_VERSION}".encode())
+
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype}{array.shape}".encode())
+        digest.update(array.tobytes())
+
+    digest.update(repr(sorted(params.items())).encode())
+
+    return digest.hexdigest()[:32]
+
+
+def memoized_matrix_key(agent_type, arrays, params):
+    """
+    Compute the cache key of a set of raw route matrices and parameters, like hash_matrix_inputs
+
+    Read-only matrices, such as those in shared memory or memory-mapped, are only hashed the first time they are
+    used in this process. They are recognised by their memory, so views on the same memory share the key.
+
+    :param agent_type: Drone or Car
+    :param arrays: list of raw route matrices
+    :param params: dict of parameters that affect the processed matrices
+    :return: hexadecimal key
+    """
+    if not all(isinstance(array, np.ndarray) and not array.flags.writeable for array in arrays):
+        return hash_matrix_inputs(agent_type, arrays, params)
+
+    memory = tuple((array.__array_interface__["data"][0], array.shape, array.strides, array.dtype.str)
+                   for array in arrays)
+    identity = (agent_type, memory, repr(sorted(params.items())))
+
+    if identity not in _matrix_keys:
+        if len(_matrix_keys) == MAX_MATRIX_KEYS:
+            del _matrix_keys[next(iter(_matrix_keys))]
+
+        # The matrices are kept alive, so their memory can not be reused by other matrices
+        _matrix_keys[identity] = (arrays, hash_matrix_inputs(agent_type, arrays, params))
+
+    return _matrix_keys[identity][1]
+
+
+def drone_matrix_key(drone_params):
+    """
+    Compute the cache key of the drone matrices
+
+    :param drone_params: dictionary containing drone specifics
+    :return: hexadecimal key
+    """
+    arrays = [drone_params["distanceMatrix"], drone_params["directDistanceMatrix"],
+              drone_params["riskMatrix"], drone_params["directRiskMatrix"]]
+    params = {param: drone_params[param] for param in DRONE_MATRIX_PARAMS}
+
+    return memoized_matrix_key("Drone", arrays, params)
+
+
+def car_matrix_key(car_params, day):
+    """
+    Compute the cache key of the car matrices of a single day of the week
+
+    :param car_params: dictionary containing car parameters
+    :param day: modeled day of the week
+    :return: hexadecimal key
+    """
+    arrays = [car_params["timeMatrix"][day][hour] for hour in range(24)] \
+        + [car_params["distanceMatrix"][day][hour] for hour in range(24)]
+    params = {param: car_params[param] for param in CAR_MATRIX_PARAMS}
+    params["day"] = day
+
+    return memoized_matrix_key("Car", arrays, params)
+
+
+def save_matrices(directory, matrices):
+    """
+    Store a matrix dict as one .npy file per matrix kind and mode
+
+    The files are written to a temporary directory first, which is then renamed,
+    so concurrent processes never read a partially written entry.
+
+    :param directory: cache entry directory
+    :param matrices: dict of dicts, e.g. matrices["Time"]["safe"]
+    :return:
+    """
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    temporary_directory = tempfile.mkdtemp(dir=parent)
+
+    for kind, modes in matrices.items():
+        for mode, matrix in modes.items():
+            np.save(os.path.join(temporary_directory, f"{kind}_{mode}.npy"), np.asarray(matrix))
+
+    try:
+        os.rename(temporary_directory, directory)
+    except OSError:
+        # Another process stored the same entry first
+        for file_name in os.listdir(temporary_directory):
+            os.remove(os.path.join(temporary_directory, file_name))
+        os.rmdir(temporary_directory)
+
+
+def load_matrices(directory):
+    """
+    Open a stored matrix dict memory-mapped
+
+    :param directory: cache entry directory
+    :return: dict of dicts, e.g. matrices["Time"]["safe"]
+    """
+    matrices = {}
+
+    for file_name in sorted(os.listdir(directory)):
+        kind, mode = file_name[:-len(".npy")].split("_")
+        matrices.setdefault(kind, {})[mode] = np.load(os.path.join(directory, file_name), mmap_mode="r")
+
+    return matrices
+
+
+def cached_matrices(cache_dir, key, create_matrices):
+    """
+    Return the matrices stored under key, creating and storing them if they do not exist yet
+
+    :param cache_dir: root directory of the cache
+    :param key: cache key of the matrices
+    :param create_matrices: function without arguments that computes the matrices
+    :return: dict of dicts, e.g. matrices["Time"]["safe"]
+    """
+    directory = os.path.join(cache_dir, key)
+
+    if directory not in _opened_matrices:
+        if not os.path.isdir(directory):
+            save_matrices(directory, create_matrices())
+
+        _opened_matrices[directory] = load_matrices(directory)
+
+    return _opened_matrices[directory]
@@ -0,0 +1,122 @@
+"""
+Scenario files for running the model without the dashboard
+
+A scenario is a JSON file that contains the paths to the route and demand inputs, the model, drone and car
+parameters, the settings of a single run and the definition of a batch run sweep. Relative paths are resolved
+with respect to the directory of the scenario file.
+"""
+import json
+import os
+import pickle
+
+# Settings that contain a path
+PATH_SETTINGS = ["matrix_cache_dir"]
+
+
+def load_scenario(file_path):
+    """
+    Read a scenario file
+
+    :param file_path: path to the JSON scenario file
+    :return: scenario dict
+    """
+    with open(file_path) as f:
+        scenario = json.load(f)
+
+    directory = os.path.dirname(os.path.abspath(file_path))
+
+    scenario["paths"] = {name: os.path.join(directory, path) for name, path in scenario["paths"].items()}
+
+    for setting in PATH_SETTINGS:
+        if scenario["settings"].get(setting) is not None:
+            scenario["settings"][setting] = os.path.join(directory, scenario["settings"][setting])
+
+    return scenario
+
+
+def load_inputs(paths):
+    """
+    Read the drone routes, car routes and demand input of a scenario
+
+    :param paths: dict with the paths to the droneRoutes, carRoutes and demand files
+    :return: dict of inputs
+    """
+    import pandas as pd
+
+    with open(paths["droneRoutes"], "rb") as f:
+        (
+            client_params,
+            drone_distances,
+            drone_risk,
+            grid,
+            direct_drone_distances,
+            direct_drone_risks,
+
+        ) = pickle.load(f)
+
+    with open(paths["carRoutes"], "rb") as f:
+        car_distances, car_times = pickle.load(f)
+
+    request_list = pd.read_csv(paths["demand"])
+    request_list = request_list.set_index('start', drop=True)
+
+    return {
+        "client_params": client_params,
+        "drone_distances": drone_distances,
+        "drone_risk": drone_risk,
+        "grid": grid,
+        "direct_drone_distances": direct_drone_distances,
+        "direct_drone_risks": direct_drone_risks,
+        "car_distances": car_distances,
+        "car_times": car_times,
+        "request_list": request_list,
+    }
+
+
+def create_input_params(scenario, inputs):
+    """
+    Combine the parameters of a scenario with its inputs into the keyword arguments shared by all runs
+
+    :param scenario: scenario dict
+    :param inputs: dict of inputs, as returned by load_inputs
+    :return: dict of model keyword arguments
+    """
+    model_params = dict(scenario["model_params"])
+    model_params["grid"] = inputs["grid"]
+    model_params["hubs"] = len(inputs["client_params"])
+
+    drone_params = dict(scenario["drone_params"])
+    drone_params["riskMatrix"] = inputs["drone_risk"]
+    drone_params["distanceMatrix"] = inputs["drone_distances"]
+    drone_params["directRiskMatrix"] = inputs["direct_drone_risks"]
+    drone_params["directDistanceMatrix"] = inputs["direct_drone_distances"]
+
+    car_params = dict(scenario["car_params"])
+    car_params["distanceMatrix"] = inputs["car_distances"]
+    car_params["timeMatrix"] = inputs["car_times"]
+
+    return {
+        "model_params": model_params,
+        "drone_params": drone_params,
+        "car_params": car_params,
+        "client_params": inputs["client_params"],
+        "request_input": inputs["request_list"],
+    }
+
+
+def create_variable_params(variable_params):
+    """
+    Expand the sweep definition of a scenario, {"range": [start, stop]} is turned into a range
+
+    :param variable_params: dict of parameter values as read from the scenario file
+    :return: dict of parameter values
+    """
+    expanded = {}
+
+    for param, values in variable_params.items():
+        if isinstance(values, dict) and "range" in values:
+            values = range(*values["range"])
+
+        expanded[param] = values
+
+    return expanded
@@ -1,5 +1,3 @@
-import random as rd
-
 class ScheduleItem:
 
     """Class that represent an item within a vehicle schedule"""
@@ -20,6 +18,7 @@ class ScheduleItem:
         self.duration = self.eta - self.etd
         self.delay = 0
         self.total_delay = 0
+        self.consolidation_entry = None                 # entry in the consolidation index of the command center
 
         if request == None:
 
@@ -29,8 +28,9 @@ class ScheduleItem:
 
             self.requests = [request]
 
-        rd.seed(self.model.seed)
-        
+        if model.instrumentation is not None:
+            model.instrumentation.count("Schedule items")
+
     def complete(self):
         """
         Function that processes the completion of a schedule item
@@ -38,6 +38,8 @@ class ScheduleItem:
         :return:
         """
 
+        self.model.command_center.remove_scheduled_delivery(self)
+
         # Update model KPIs
         self.model.risk[self.vehicle.type] += self.risk
         self.model.emmissions[self.vehicle.type] += self.emmission
@@ -85,12 +87,13 @@ class ScheduleItem:
         else:
             var = delay_percentages['normalTraffic'] * mean
 
-        actual_travel_time = round(rd.uniform(mean - var, mean + var))
+        actual_travel_time = round(mean - var + 2 * var * self.model.draw_travel_delay())
 
         delay = actual_travel_time - self.duration
 
         self.delay += delay 
         self.eta = self.etd + actual_travel_time
+        self.model.command_center.update_scheduled_delivery(self)
         
         return delay
 
@@ -104,6 +107,7 @@ class ScheduleItem:
         self.etd += delay
         self.eta += delay
         self.total_delay += delay
+        self.model.command_center.update_scheduled_delivery(self)
 
         return self.eta 
   
@@ -216,7 +216,8 @@ if batch_run_bool:
         "visualization": False,
         "day_of_week": "Random",
         "track_heatmap": heatmap,
-        'request_input': request_list
+        'request_input': request_list,
+        "matrix_cache_dir": "Results/matrix_cache",     # processed route matrices are only created once per day
 
     }
 
@@ -228,6 +229,8 @@ if batch_run_bool:
             max_steps=5000,
             display_progress=True,
             createHeatmaps=heatmap,
+            share_memory=True,
+            result_format="csv",                       # csv, arrow or parquet
         )
         print(f"Done, with a total of {writes} writes")
 
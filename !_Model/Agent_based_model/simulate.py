@@ -0,0 +1,222 @@
+"""
+Command line entry point of the model
+
+    python -m simulate run Scenarios/default.json
+    python -m simulate batch Scenarios/default.json
+    python -m simulate variants Scenarios/default.json
+    python -m simulate dashboard Scenarios/default.json
+
+Only the modules that are needed for the chosen command are imported, so headless runs and batch workers do
+not load the visualisation. Inputs are only read in the main process, batch workers receive them from the
+batch runner.
+"""
+import argparse
+import json
+
+from scenario import load_scenario, load_inputs, create_input_params, create_variable_params
+
+
+def run(scenario, seed=None):
+    """
+    Perform a single headless model run and print its results
+
+    :param scenario: scenario dict
+    :param seed: overrides the seed of the scenario settings
+    :return: dict of model results
+    """
+    from base_model import BaseModel
+
+    params = create_input_params(scenario, load_inputs(scenario["paths"]))
+    params.update(scenario["settings"])
+    params["visualization"] = False
+
+    if seed is not None:
+        params["seed"] = seed
+
+    model = BaseModel(**params)
+    max_steps = scenario["run"]["max_steps"]
+
+    while model.running and model.schedule.steps <= max_steps:
+        model.step()
+
+    results = {var: value for var, value in model.model_reporters.items()
+               if var != 'Movement matrix' and var != 'Deliveries matrix'}
+
+    print(json.dumps(results, indent=4, default=float))
+
+    return results
+
+
+def batch(scenario, resume=False):
+    """
+    Perform the batch run defined in a scenario
+
+    :param scenario: scenario dict
+    :param resume: skip the runs that an earlier, interrupted, batch run of the scenario completed
+    :return: number of writes of the batch runner
+    """
+    from base_model import BaseModel
+    from Batch_Run.CustomBatchrunner import batch_run
+    from Batch_Run.variance_reduction import VarianceReduction
+    from Batch_Run.adaptive_replication import AdaptiveReplication
+    from Batch_Run.sensitivity import LatinHypercubeSampler, SaltelliSampler
+
+    batch_settings = scenario["batch"]
+    variable_params = create_variable_params(batch_settings["variable_params"])
+
+    variance_reduction = None
+    if batch_settings["variance_reduction"] is not None:
+        variance_reduction = VarianceReduction(**batch_settings["variance_reduction"])
+
+    adaptive_replication = None
+    if batch_settings["adaptive_replication"] is not None:
+        adaptive_replication = AdaptiveReplication(**batch_settings["adaptive_replication"])
+
+    sampler = None
+    if batch_settings["sampler"] is not None:
+        sampler_settings = dict(batch_settings["sampler"])
+        samplers = {"latin_hypercube": LatinHypercubeSampler, "saltelli": SaltelliSampler}
+        sampler_cls = samplers[sampler_settings.pop("method")]
+        sampler = sampler_cls(**sampler_settings)
+
+    # Fixed parameters override variable ones, so settings that are swept or sampled are left out
+    swept = set(variable_params) if sampler is None else set(sampler.bounds)
+    fixed_params = {setting: value for setting, value in scenario["settings"].items() if setting not in swept}
+    fixed_params.update(create_input_params(scenario, load_inputs(scenario["paths"])))
+    fixed_params.update({setting: value for setting, value in batch_settings["fixed_params"].items()
+                         if setting not in swept})
+    fixed_params["visualization"] = False
+    fixed_params["track_heatmap"] = batch_settings["heatmap"]
+
+    writes = batch_run(
+        BaseModel,
+        variable_parameters=variable_params,
+        fixed_parameters=fixed_params,
+        nr_processes=batch_settings["nr_processes"],
+        iterations=batch_settings["iterations"],
+        max_steps=batch_settings["max_steps"],
+        display_progress=True,
+        createHeatmaps=batch_settings["heatmap"],
+        share_memory=batch_settings["share_memory"],
+        result_format=batch_settings["result_format"],
+        run_name=batch_settings["run_name"],
+        resume=resume,
+        variance_reduction=variance_reduction,
+        adaptive_replication=adaptive_replication,
+        sampler=sampler,
+    )
+    print(f"Done, with a total of {writes} writes")
+
+    return writes
+
+
+def variants(scenario, seed=None):
+    """
+    Run the scenario until the fork step of its variants and continue each variant from there
+
+    :param scenario: scenario dict
+    :param seed: overrides the seed of the scenario settings
+    :return: dict of model results, by variant name
+    """
+    from base_model import BaseModel
+    from Batch_Run.fork_variants import run_variants, setting_variant
+
+    variant_settings = scenario["variants"]
+
+    params = create_input_params(scenario, load_inputs(scenario["paths"]))
+    params.update(scenario["settings"])
+    params["visualization"] = False
+
+    if seed is not None:
+        params["seed"] = seed
+
+    model = BaseModel(**params)
+    fork_from_step = variant_settings["fork_from_step"]
+
+    while model.running and model.schedule.steps < fork_from_step:
+        model.step()
+
+    results = run_variants(
+        model.snapshot(),
+        {name: setting_variant(settings) for name, settings in variant_settings["variants"].items()},
+        max_steps=variant_settings["max_steps"],
+        nr_processes=variant_settings["nr_processes"],
+    )
+
+    results = {name: {var: value for var, value in variant_results.items()
+                      if var != 'Movement matrix' and var != 'Deliveries matrix'}
+               for name, variant_results in results.items()}
+
+    print(json.dumps(results, indent=4, default=float))
+
+    return results
+
+
+def dashboard(scenario):
+    """
+    Start the dashboard of a scenario
+
+    :param scenario: scenario dict
+    :return:
+    """
+    import nest_asyncio
+    from initialise_dashboard import initialise_dashboard, dashboard_inputs
+    from Local_Mesa.Visualisation.ModularVisualization import ModularServer
+    from base_model import BaseModel
+
+    dashboard_settings = scenario["dashboard"]
+    charts = dashboard_settings["charts"]
+
+    params = create_input_params(scenario, load_inputs(scenario["paths"]))
+    params.update(scenario["settings"])
+
+    # Does something Python technical with nested loops
+    nest_asyncio.apply()
+    dashboard_elements = initialise_dashboard(params["model_params"]["grid"], charts)
+    num_drones, delivery_mode, repositioning, day_of_week, seed = dashboard_inputs(dashboard_settings["random_seed"])
+
+    params.update({
+        "num_drones": num_drones,
+        "day_of_week": day_of_week,
+        "repositioning": repositioning,
+        "delivery_mode": delivery_mode,
+        "seed": seed,
+        "charts": charts,
+    })
+
+    server = ModularServer(BaseModel, dashboard_elements, "MDS simulation model", params)
+    server.port = dashboard_settings["port"]
+    server.launch()
+
+
+def main(args=None):
+    """
+    Parse the command line arguments and perform the requested command
+
+    :param args: list of command line arguments, sys.argv is used when None
+    :return:
+    """
+    parser = argparse.ArgumentParser(prog="simulate", description="Run the MDS simulation model")
+    parser.add_argument("command", choices=["run", "batch", "variants", "dashboard"])
+    parser.add_argument("scenario", help="path to the JSON scenario file")
+    parser.add_argument("--seed", type=int, default=None, help="seed of a single run or of the variants, overrides the scenario")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted batch run")
+    args = parser.parse_args(args)
+
+    scenario = load_scenario(args.scenario)
+
+    if args.command == "run":
+        run(scenario, args.seed)
+
+    elif args.command == "batch":
+        batch(scenario, args.resume)
+
+    elif args.command == "variants":
+        variants(scenario, args.seed)
+
+    else:
+        dashboard(scenario)
+
+
+if __name__ == "__main__":
+    main()
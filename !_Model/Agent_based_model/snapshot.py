@@ -0,0 +1,67 @@
+"""
+Snapshots of a running model
+
+A snapshot contains the complete state of a model: its agents, schedule, open requests, KPI accumulators and
+random number generators. Objects that do not change during a run, such as the route matrices and the demand
+input, are not copied into the snapshot but referred to, so a snapshot is small and quick to take.
+"""
+import io
+import pickle
+
+
+class ModelSnapshot:
+    """Picklable state of a model at a certain time"""
+
+    def __init__(self, time, state, static_objects):
+
+        self.time = time
+        self.state = state                              # pickled model, without the static objects
+        self.static_objects = static_objects            # objects the pickled model refers to
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """Pickler that stores references to the static objects of a model instead of copying them"""
+
+    def __init__(self, file, static_ids):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.static_ids = static_ids
+
+    def persistent_id(self, obj):
+        return self.static_ids.get(id(obj))
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    """Unpickler that resolves the references to the static objects of a model"""
+
+    def __init__(self, file, static_objects):
+        super().__init__(file)
+        self.static_objects = static_objects
+
+    def persistent_load(self, pid):
+        return self.static_objects[pid]
+
+
+def take_snapshot(model):
+    """
+    Capture the state of a model
+
+    :param model: BaseModel
+    :return: ModelSnapshot
+    """
+    static_objects = model.static_objects()
+    static_ids = {id(obj): i for i, obj in enumerate(static_objects)}
+
+    state = io.BytesIO()
+    _SnapshotPickler(state, static_ids).dump(model)
+
+    return ModelSnapshot(model.time, state.getvalue(), static_objects)
+
+
+def restore_snapshot(snapshot):
+    """
+    Create a model from a snapshot, the model continues where the snapshotted model was
+
+    :param snapshot: ModelSnapshot
+    :return: BaseModel
+    """
+    return _SnapshotUnpickler(io.BytesIO(snapshot.state), snapshot.static_objects).load()